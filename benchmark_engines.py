@@ -0,0 +1,362 @@
+"""
+Benchmark the available PI engines on the same set of ERA5 soundings.
+
+Soundings for a single time step are loaded using the input paths and
+domain in the configuration file (see `calculate.ini`), then passed to
+each engine in turn. The timings, and the differences in PMIN and VMAX
+relative to the first engine, are printed so that the fastest engine for
+a given machine can be chosen. Each engine is run with each of the
+methods of solving for the minimum pressure given by `-s`, and the mean
+and maximum number of iterations per column are printed, along with the
+number of columns that did not converge (IFL = 0). With `--matable`,
+each is also run using the table of moist adiabats in the CAPE
+calculation (see :mod:`moistadiabat`).
+
+With `--warmstart`, the first engine is also run on the following time
+step starting the minimum pressure iteration from the default guess
+(cold), from the final iterate of the previous time (previous) and from
+a coarse subset of points of the same time (spatial). The number of
+iterations, timings and differences relative to the cold start are
+printed.
+
+With `--precision`, the first engine is also run on soundings converted
+from the ERA5 data in single precision, as done in `calculate.py` with
+`Precision=single`, and the differences in PMIN and VMAX relative to the
+default (double precision) conversion are printed.
+
+Example::
+
+    python benchmark_engines.py -c calculate.ini -y 2015 -m 1 -t 0 \\
+        -e fortran numba -s fixed secant -n 3 --threads 8
+
+"""
+
+import os
+import argparse
+import datetime
+from calendar import monthrange
+from configparser import ConfigParser
+from os.path import join as pjoin
+from time import perf_counter
+
+import numpy as np
+
+import metutils
+import nctools
+import moistadiabat
+from engines import ENGINES, SOLVERS, loadEngine
+from columns import oceanIndex, packColumns
+from calculate import levelSlice
+
+
+def loadSoundings(config, year, month, tdx, dtype=float, withindex=False):
+    """
+    Load the soundings for a single time from the ERA5 data.
+
+    :param config: :class:`ConfigParser` instance
+    :param int year: Year
+    :param int month: Month
+    :param int tdx: Time index within the monthly file
+    :param dtype: Floating point type used to convert the data, before
+                  the soundings are packed in single precision (see
+                  `calculate.PRECISIONS`)
+    :param bool withindex: If True, also return the flattened positions
+                           of the columns on the grid
+
+    :returns: (ncol,) arrays of SST and SLP, and (ncol, nlev) arrays of
+              pressure, temperature and mixing ratio, followed by the
+              (ncol,) array of positions if `withindex` is True
+    """
+    startdate = datetime.datetime(year, month, 1)
+    enddate = datetime.datetime(year, month, monthrange(year, month)[1])
+    filedatestr = f"{startdate.strftime('%Y%m%d')}-{enddate.strftime('%Y%m%d')}"
+
+    minLon = config.getfloat('Domain', 'MinLon')
+    maxLon = config.getfloat('Domain', 'MaxLon')
+    minLat = config.getfloat('Domain', 'MinLat')
+    maxLat = config.getfloat('Domain', 'MaxLat')
+
+    tobj = nctools.ncLoadFile(pjoin(config.get('Input', 'Temp'), f'{year}',
+                                    f't_era5_oper_pl_{filedatestr}.nc'))
+    robj = nctools.ncLoadFile(pjoin(config.get('Input', 'Humidity'), f'{year}',
+                                    f'r_era5_oper_pl_{filedatestr}.nc'))
+    sstobj = nctools.ncLoadFile(pjoin(config.get('Input', 'SST'), f'{year}',
+                                      f'sst_era5_oper_sfc_{filedatestr}.nc'))
+    slpobj = nctools.ncLoadFile(pjoin(config.get('Input', 'SLP'), f'{year}',
+                                      f'msl_era5_oper_sfc_{filedatestr}.nc'))
+
+    tlon = nctools.ncGetDims(tobj, 'longitude')
+    tlat = nctools.ncGetDims(tobj, 'latitude')
+    varidx = np.where((tlon >= minLon) & (tlon <= maxLon))[0]
+    varidy = np.where((tlat >= minLat) & (tlat <= maxLat))[0]
+    levels = nctools.ncGetDims(tobj, 'level')
+    lslice = levelSlice(levels,
+                        config.getfloat('Input', 'TopPressure', fallback=None),
+                        config.getfloat('Input', 'BottomPressure',
+                                        fallback=None))
+    levels = levels[lslice]
+
+    # Surface variables may be on a larger grid than the pressure
+    # level variables, so pick out the matching points
+    sstlon = nctools.ncGetDims(sstobj, 'longitude')
+    sstlat = nctools.ncGetDims(sstobj, 'latitude')
+    sstidx = np.array([np.where(sstlon == x)[0][0] for x in tlon[varidx]])
+    sstidy = np.array([np.where(sstlat == y)[0][0] for y in tlat[varidy]])
+
+    sstvar = nctools.ncGetVar(sstobj, 'sst')
+    slpvar = nctools.ncGetVar(slpobj, 'msl')
+    tvar = nctools.ncGetVar(tobj, 't')
+    rvar = nctools.ncGetVar(robj, 'r')
+
+    sst = metutils.convert(sstvar[tdx, sstidy, sstidx], sstvar.units, 'C',
+                           dtype)
+    slp = metutils.convert(slpvar[tdx, sstidy, sstidx], slpvar.units, 'hPa',
+                           dtype)
+    t = metutils.convert(tvar[tdx, lslice, varidy, varidx], tvar.units, 'C',
+                         dtype)
+    pp = np.broadcast_to(levels[:, np.newaxis, np.newaxis], t.shape)
+    r = metutils.rHToMixRat(rvar[tdx, lslice, varidy, varidx], t,
+                            levels[:, np.newaxis, np.newaxis], 'C', dtype)
+    r = np.where(r < 0, 0, r)
+
+    # Only benchmark columns with valid SST
+    index = oceanIndex(np.ma.getmaskarray(sst))
+    sstc = np.ma.filled(sst, np.nan).ravel()[index].astype(np.float32)
+    slpc = np.ma.filled(slp, np.nan).ravel()[index].astype(np.float32)
+    soundings = (sstc, slpc, packColumns(pp, index), packColumns(t, index),
+                 packColumns(r, index))
+    if withindex:
+        return soundings + (index,)
+    return soundings
+
+
+def benchmark(engine, soundings, repeats=3, isolv=0):
+    """
+    Time an engine on a set of soundings.
+
+    :param engine: PI engine module (see :mod:`engines`)
+    :param tuple soundings: SST, SLP, P, T, R arrays
+    :param int repeats: Number of timed repetitions
+    :param int isolv: Method used to solve for the minimum pressure (see
+                      :data:`engines.SOLVERS`)
+
+    :returns: best elapsed time (s) and the results of the last call
+    """
+    # Warm up (e.g. JIT compilation) on a few columns
+    engine.pcminv(*[np.ascontiguousarray(a[:4]) for a in soundings],
+                  isolv=isolv)
+    best = np.inf
+    for _ in range(repeats):
+        start = perf_counter()
+        result = engine.pcminv(*soundings, isolv=isolv)
+        best = min(best, perf_counter() - start)
+    return best, result
+
+
+def benchmarkWarmStart(engine, previous, soundings, pindex, index,
+                       repeats=3, stride=4):
+    """
+    Compare the first guesses of the minimum pressure iteration on a set
+    of soundings. As in `calculate.calculate`, there is no first guess
+    from a column that did not converge, and columns that fail from a
+    first guess are calculated again from the default one.
+
+    :param engine: PI engine module (see :mod:`engines`)
+    :param tuple previous: SST, SLP, P, T, R arrays for the previous time
+    :param tuple soundings: SST, SLP, P, T, R arrays
+    :param pindex: `numpy.ndarray` of the positions of the columns of
+                   `previous` on the grid (see `loadSoundings`)
+    :param index: `numpy.ndarray` of the positions of the columns of
+                  `soundings` on the grid
+    :param int repeats: Number of timed repetitions
+    :param int stride: Spacing of the coarse points used for the spatial
+                       first guess (every `stride`-th column)
+
+    :returns: dict of (best elapsed time (s), results) for the cold,
+              previous and spatial first guesses
+    """
+    ncol = len(soundings[0])
+    coarse = np.arange(ncol) % stride == 0
+    cidx = np.flatnonzero(coarse)
+    fidx = np.flatnonzero(~coarse)
+    nearest = np.minimum(np.rint(fidx / stride).astype(int), len(cidx) - 1)
+    subset = lambda idx: [np.asfortranarray(a[idx]) for a in soundings]
+
+    def guess(result):
+        return np.where(result[2] == 1, result[4], np.nan).astype(np.float32)
+
+    def recalculate(result, warm):
+        idx = np.flatnonzero((result[2] == 0) & (warm >= 400))
+        if len(idx):
+            for out, a in zip(result, engine.pcminv(*subset(idx))):
+                out[idx] = a
+        return result
+
+    def cold():
+        return engine.pcminv(*soundings)
+
+    # First guess from the same grid point at the previous time, where
+    # it is an ocean point
+    pmc = guess(engine.pcminv(*previous))
+    position = np.minimum(np.searchsorted(pindex, index), len(pindex) - 1)
+    warm = np.where(pindex[position] == index, pmc[position],
+                    np.nan).astype(np.float32)
+
+    def fromprevious():
+        return recalculate(engine.pcminv(*soundings, pminit=warm), warm)
+
+    def spatial():
+        cresult = engine.pcminv(*subset(cidx))
+        result = [np.empty(ncol, dtype=a.dtype) for a in cresult]
+        swarm = np.full(ncol, np.nan, dtype=np.float32)
+        swarm[fidx] = guess(cresult)[nearest]
+        fresult = engine.pcminv(*subset(fidx), pminit=swarm[fidx])
+        for out, c, f in zip(result, cresult, fresult):
+            out[cidx] = c
+            out[fidx] = f
+        return recalculate(result, swarm)
+
+    timings = {}
+    for name, func in (('cold', cold), ('previous', fromprevious),
+                       ('spatial', spatial)):
+        best = np.inf
+        for _ in range(repeats):
+            start = perf_counter()
+            result = func()
+            best = min(best, perf_counter() - start)
+        timings[name] = (best, result)
+    return timings
+
+
+def precisionError(engine, double, single):
+    """
+    Compare the PI calculated from soundings converted in double and
+    single precision.
+
+    :param engine: PI engine module (see :mod:`engines`)
+    :param tuple double: SST, SLP, P, T, R arrays converted in double
+                         precision
+    :param tuple single: The same arrays converted in single precision
+
+    :returns: absolute differences in PMIN (hPa) and VMAX (m/s) for
+              columns that converged in both, and a boolean array that
+              is True for columns where the flags differ
+    """
+    pmin, vmax, ifl = engine.pcminv(*double)[:3]
+    spmin, svmax, sifl = engine.pcminv(*single)[:3]
+    ok = (ifl == 1) & (sifl == 1)
+    return (np.abs(spmin - pmin)[ok], np.abs(svmax - vmax)[ok],
+            ifl != sifl)
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__,
+                                formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument('-c', '--config_file', help="Configuration file", required=True)
+    p.add_argument('-y', '--year', type=int, default=2015, help="Year")
+    p.add_argument('-m', '--month', type=int, default=1, help="Month")
+    p.add_argument('-t', '--time', type=int, default=0,
+                   help="Time index in the monthly file")
+    p.add_argument('-e', '--engines', nargs='+',
+                   default=[name for name in ENGINES if name != 'emulator'],
+                   help="Engines to benchmark. The first is the reference. "
+                        "The emulator needs a fitted model (see "
+                        "train_emulator.py)")
+    p.add_argument('-s', '--solvers', nargs='+', default=['fixed'],
+                   choices=list(SOLVERS),
+                   help="Methods of solving for the minimum pressure. "
+                        "The first is the reference")
+    p.add_argument('-n', '--repeats', type=int, default=3,
+                   help="Number of timed repetitions")
+    p.add_argument('--threads', type=int,
+                   default=int(os.environ.get('OMP_NUM_THREADS', 1)),
+                   help="Number of threads per engine")
+    p.add_argument('--matable', action='store_true',
+                   help="Also run each engine using the moist adiabat table")
+    p.add_argument('--warmstart', action='store_true',
+                   help="Compare first guesses of the minimum pressure "
+                        "using the first engine and the next time")
+    p.add_argument('--precision', action='store_true',
+                   help="Compare single and double precision conversion "
+                        "of the input data using the first engine")
+    args = p.parse_args()
+
+    config = ConfigParser()
+    config.read(args.config_file)
+    *soundings, index = loadSoundings(config, args.year, args.month,
+                                      args.time, withindex=True)
+    ncol = len(soundings[0])
+    print(f"{ncol} ocean columns, {soundings[2].shape[1]} levels, "
+          f"{args.threads} thread(s)")
+
+    reference = None
+    print(f"{'engine':>16s} {'solver':>12s} {'time (s)':>10s} {'col/s':>10s} "
+          f"{'speedup':>8s} {'iters':>7s} {'max it':>7s} {'IFL=0':>6s} "
+          f"{'max dP':>8s} {'max dV':>8s} {'dIFL':>6s}")
+    for name in args.engines:
+        try:
+            engine = loadEngine(name)
+        except ImportError as e:
+            print(f"{name:>16s} unavailable: {e}")
+            continue
+        engine.setnthreads(args.threads)
+        runs = [(solver, False) for solver in args.solvers]
+        if args.matable:
+            runs += [(solver, True) for solver in args.solvers]
+        for solver, table in runs:
+            moistadiabat.useTable(engine, table)
+            elapsed, (pmin, vmax, ifl, niter, *_) = benchmark(engine, soundings,
+                                                              args.repeats,
+                                                              SOLVERS[solver])
+            label = f"{solver}+table" if table else solver
+            if reference is None:
+                reference = (elapsed, pmin, vmax, ifl)
+            # Compare only columns that converged in both runs
+            ok = (ifl == 1) & (reference[3] == 1)
+            dp = np.nanmax(np.abs(pmin - reference[1])[ok], initial=0)
+            dv = np.nanmax(np.abs(vmax - reference[2])[ok], initial=0)
+            difl = np.sum(ifl != reference[3])
+            print(f"{name:>16s} {label:>12s} {elapsed:10.3f} "
+                  f"{ncol / elapsed:10.0f} {reference[0] / elapsed:8.2f} "
+                  f"{niter.mean():7.2f} {niter.max():7d} "
+                  f"{np.sum(ifl == 0):6d} {dp:8.3f} {dv:8.3f} {difl:6d}")
+        moistadiabat.useTable(engine, False)
+
+    if args.warmstart:
+        engine = loadEngine(args.engines[0])
+        engine.setnthreads(args.threads)
+        *nextsoundings, nextindex = loadSoundings(config, args.year,
+                                                  args.month, args.time + 1,
+                                                  withindex=True)
+        timings = benchmarkWarmStart(engine, soundings, nextsoundings, index,
+                                     nextindex, args.repeats)
+        print(f"\nFirst guess of minimum pressure ({args.engines[0]}, "
+              f"time {args.time + 1})")
+        print(f"{'guess':>10s} {'time (s)':>10s} {'iters':>10s} "
+              f"{'per col':>8s} {'max dP':>8s} {'max dV':>8s} {'dIFL':>6s}")
+        celapsed, (cpmin, cvmax, cifl, cniter, *_) = timings['cold']
+        for name, (elapsed, (pmin, vmax, ifl, niter, *_)) in timings.items():
+            dp = np.nanmax(np.abs(pmin - cpmin))
+            dv = np.nanmax(np.abs(vmax - cvmax))
+            difl = np.sum(ifl != cifl)
+            print(f"{name:>10s} {elapsed:10.3f} {niter.sum():10d} "
+                  f"{niter.mean():8.2f} {dp:8.3f} {dv:8.3f} {difl:6d}")
+
+    if args.precision:
+        engine = loadEngine(args.engines[0])
+        engine.setnthreads(args.threads)
+        single = loadSoundings(config, args.year, args.month, args.time,
+                               np.float32)
+        dpmin, dvmax, difl = precisionError(engine, soundings, single)
+        print(f"\nSingle precision input data ({args.engines[0]}, "
+              f"{np.sum(~difl)} columns with the same flag)")
+        print(f"{'':>10s} {'mean':>10s} {'99%':>10s} {'max':>10s}")
+        for name, d in (('dP (hPa)', dpmin), ('dV (m/s)', dvmax)):
+            print(f"{name:>10s} {d.mean():10.2e} "
+                  f"{np.percentile(d, 99, method='nearest'):10.2e} "
+                  f"{d.max():10.2e}")
+        print(f"{'dIFL':>10s} {np.sum(difl):10d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Benchmark the transfer of results from the MPI workers to the first
+process in `calculate.py`.
+
+Each worker sends the arrays returned for a unit of work (see
+`calculate.py`) for its share of `-n` units, and the first process
+receives them into the arrays of the month, as:
+
+* ``pickle`` - a pickled tuple of the arrays, sent with `comm.send`,
+  which is unpickled and then copied into the arrays of the month
+* ``buffer`` - a message with the number of the unit, followed by the
+  arrays as typed buffers, received directly into the arrays of the
+  month (see :func:`parallel.recvArrays`)
+
+The time taken by the first process to receive all the units, and the
+throughput in units and MB a second, are printed for each method. With
+`--tilesize`, the domain is divided into tiles, and each tile of each
+time is a unit, as with the `TileSize` option of `calculate.py`.
+
+Example::
+
+    mpirun -np 8 python benchmark_mpi.py --shape 241 481 -n 124 \\
+        --tilesize 60 120
+
+"""
+
+import argparse
+from time import perf_counter
+
+import numpy as np
+from mpi4py import MPI
+
+from calculate import tileSlices
+from parallel import tileType, sendArrays, recvArrays
+
+# Types of the arrays of the month, as allocated by `calculate.py` with
+# double precision: pmin, vmax, ifl, niter, to, otl and ncmax
+TYPES = (np.float64, np.float64, np.uint8, np.int64, np.float32, np.float32,
+         np.int32)
+
+WORK_TAG = 0
+RESULT_TAG = 1
+
+
+def master(comm, outputs, units, tiles, method):
+    """
+    Hand out the units of work and receive the results.
+
+    :param comm: MPI communicator
+    :param list outputs: Arrays (nt, ny, nx) of the month
+    :param list units: (time, tile) of each unit of work
+    :param list tiles: (`slice`, `slice`) of each tile
+    :param str method: ``pickle`` or ``buffer``
+
+    :returns: elapsed time (s)
+    """
+    status = MPI.Status()
+    if method == 'buffer' and len(tiles) > 1:
+        datatypes = [[tileType(out[0], tile) for out in outputs]
+                     for tile in tiles]
+    else:
+        datatypes = [[None] * len(outputs)]
+    comm.Barrier()
+    start = perf_counter()
+    w = 0
+    for d in range(1, comm.size):
+        comm.send(w if w < len(units) else None, dest=d, tag=WORK_TAG)
+        w += 1
+    active = min(comm.size - 1, len(units))
+    while active:
+        if method == 'pickle':
+            result, W = comm.recv(source=MPI.ANY_SOURCE, tag=RESULT_TAG,
+                                  status=status)
+            tdx, k = units[W]
+            ys, xs = tiles[k]
+            for out, values in zip(outputs, result):
+                out[tdx][..., ys, xs] = values
+        else:
+            W = comm.recv(source=MPI.ANY_SOURCE, tag=RESULT_TAG,
+                          status=status)
+            tdx, k = units[W]
+            recvArrays(comm, [out[tdx] for out in outputs], datatypes[k],
+                       status.source, RESULT_TAG)
+        if w < len(units):
+            comm.send(w, dest=status.source, tag=WORK_TAG)
+            w += 1
+        else:
+            comm.send(None, dest=status.source, tag=WORK_TAG)
+            active -= 1
+    elapsed = perf_counter() - start
+    for types in datatypes:
+        for datatype in types:
+            if datatype is not None:
+                datatype.Free()
+    return elapsed
+
+
+def worker(comm, results, units, method):
+    """
+    Send the same results for every unit of work handed out.
+
+    :param comm: MPI communicator
+    :param dict results: Arrays of the results of each tile
+    :param list units: (time, tile) of each unit of work
+    :param str method: ``pickle`` or ``buffer``
+    """
+    comm.Barrier()
+    while True:
+        W = comm.recv(source=0, tag=WORK_TAG)
+        if W is None:
+            break
+        arrays = results[units[W][1]]
+        if method == 'pickle':
+            comm.send((arrays, W), dest=0, tag=RESULT_TAG)
+        else:
+            comm.send(W, dest=0, tag=RESULT_TAG)
+            sendArrays(comm, arrays, 0, RESULT_TAG)
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__,
+                                formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument('--shape', type=int, nargs=2, default=[241, 481],
+                   help="Number of latitudes and longitudes of the domain")
+    p.add_argument('-n', '--times', type=int, default=31,
+                   help="Number of times in the month")
+    p.add_argument('--tilesize', type=int, nargs=2, default=None,
+                   help="Number of latitudes and longitudes of each tile")
+    p.add_argument('-r', '--repeats', type=int, default=3,
+                   help="Number of timed repetitions")
+    args = p.parse_args()
+
+    comm = MPI.COMM_WORLD
+    if comm.size < 2:
+        raise SystemExit("Run with at least 2 MPI processes")
+    ny, nx = args.shape
+    tiles = tileSlices(ny, nx, args.tilesize)
+    units = [(tdx, k) for tdx in range(args.times) for k in range(len(tiles))]
+    rng = np.random.default_rng(comm.rank)
+
+    if comm.rank == 0:
+        outputs = [np.zeros((args.times, ny, nx), dtype=t) for t in TYPES]
+        nbytes = sum(out.nbytes for out in outputs)
+        print(f"{comm.size - 1} workers, {len(units)} units of "
+              f"{len(tiles)} tile(s), {nbytes / 2**20:.1f} MB")
+        print(f"{'method':>8s} {'time (s)':>10s} {'units/s':>10s} "
+              f"{'MB/s':>10s}")
+    else:
+        results = [[(100 * rng.random((ys.stop - ys.start,
+                                       xs.stop - xs.start))).astype(t)
+                    for t in TYPES] for ys, xs in tiles]
+
+    for method in ('pickle', 'buffer'):
+        best = np.inf
+        for _ in range(args.repeats):
+            if comm.rank == 0:
+                best = min(best, master(comm, outputs, units, tiles, method))
+            else:
+                worker(comm, results, units, method)
+        if comm.rank == 0:
+            print(f"{method:>8s} {best:10.3f} {len(units) / best:10.1f} "
+                  f"{nbytes / 2**20 / best:10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -18,6 +18,13 @@
 # qsub -v NJOBS=44,YEAR=1979 calc_pi.sh
 #
 # This will run the process for 44 years, starting 1979
+#
+# If a job stops before finishing its year, resubmit that year with
+# NJOB > 1 and YEAR set to the year before, e.g. for 1990:
+#
+# qsub -v NJOB=2,NJOBS=44,YEAR=1989 calc_pi.sh
+#
+# Months (and times within a month) already calculated are skipped
 
 module purge
 module load pbs
@@ -67,7 +74,7 @@ $ECHO "Processing PI for $YEAR"
 
 cd $HOME/pcmin
 
-mpirun -np $PBS_NCPUS python3 calculate.py -c calculate.ini -y $YEAR > $HOME/pcmin/logs/calculate.stdout.$YEAR 2>&1
+mpirun -np $PBS_NCPUS python3 calculate.py -c calculate.ini -y $YEAR --resume > $HOME/pcmin/logs/calculate.stdout.$YEAR 2>&1
 
 if [ $NJOB -lt $NJOBS ]; then
     NJOB=$(($NJOB+1))
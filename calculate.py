@@ -7,9 +7,16 @@ import os
 import sys
 import logging
 import argparse
+import shutil
+import hashlib
+import zipfile
 import datetime
+import functools
+import threading
+import multiprocessing
 from calendar import monthrange
-from time import sleep
+from concurrent.futures import (ThreadPoolExecutor, ProcessPoolExecutor,
+                                as_completed)
 from configparser import ConfigParser
 from os.path import join as pjoin, realpath, isdir, dirname, splitext
 
@@ -19,14 +26,89 @@ from git import Repo
 
 import metutils
 import nctools
-from pcmin import pcmin
-from parallel import attemptParallel, disableOnWorkers
+import moistadiabat
+import climatology
+from columns import columnIndex, packColumns, scatter
+from engines import (loadEngine, emptyResult, SOLVERS, PARAMETERS, DEFAULTS,
+                     parameterSets)
+from parallel import (attemptParallel, disableOnWorkers, tileType,
+                      sendArrays, recvArrays, shareArray, attachArray,
+                      releaseArrays)
 
 LOGGER = logging.getLogger()
 
 repo = Repo('', search_parent_directories=True)
 COMMIT = str(repo.commit('HEAD'))
 
+# Floating point type of the input data, intermediate arrays and outputs
+# for each value of the `Precision` option
+PRECISIONS = {
+    'double': np.float64,
+    'single': np.float32,
+}
+
+# Value of the PCMIN flag at points that are not passed to the kernel
+# (land, or no valid SST). Also the fill value of the flag in the output
+IFL_MISSING = 255
+
+# Value of the PCMIN flag at columns skipped by the pre-screen (see
+# `calculate`), which are given zero PI without calling the kernel
+IFL_SCREENED = 3
+
+# Fill values of the flag and iteration counts in the output files, which
+# are also used at points without a valid SST (where `vmax` is NaN)
+FILLS = {'ifl': IFL_MISSING, 'niter': -1, 'ncmax': -1}
+
+# The netCDF and HDF5 libraries are not thread-safe, so the input files
+# read in the prefetch thread, and the output files written in the writer
+# thread, are only accessed while holding this lock (see `main`)
+NCLOCK = threading.Lock()
+
+# Ways of distributing the units of work (see `main`): ``mpi`` between
+# MPI processes, ``pool`` between a pool of processes on this node, with
+# the input arrays in shared memory (for runs without mpi4py), or
+# ``serial`` in this process
+BACKENDS = ('mpi', 'pool', 'serial')
+
+# Results of `calculate` for each unit of work, in the order returned,
+# before the derivatives in `SENSITIVITIES` (see `processTile`)
+RESULTS = ('pmin', 'vmax', 'ifl', 'niter', 'pmc', 'to', 'otl', 'ncmax')
+
+# Tags of the messages between the first MPI process and the workers
+WORK_TAG = 0
+RESULT_TAG = 1
+
+# State of a process of the pool: the PI engine, the options of the
+# calculation, and the inputs of the month (see `poolInit`)
+POOL = {}
+
+# Counterfactual PI calculated in the decomposition mode (see
+# `decompose`), in the order returned by `decompose`, and what each is
+# calculated with
+COUNTERFACTUALS = {
+    'pmin_sst': 'observed SST and climatological atmosphere',
+    'vmax_sst': 'observed SST and climatological atmosphere',
+    'pmin_atm': 'climatological SST and observed atmosphere',
+    'vmax_atm': 'climatological SST and observed atmosphere',
+}
+
+# Derivatives of PI calculated with the tangent linear of the kernel
+# (see `calculate`), in the order returned by `calculate`, and their
+# units and long names. The derivatives with respect to temperature are
+# for a warming of 1 K of a layer (see the [Sensitivity] section)
+SENSITIVITIES = {
+    'dpmin_dsst': ('hPa K**-1', 'derivative of minimum central pressure '
+                                'with respect to sea surface temperature'),
+    'dvmax_dsst': ('m s**-1 K**-1', 'derivative of maximum sustained '
+                                    'windspeed with respect to sea surface '
+                                    'temperature'),
+    'dpmin_dt': ('hPa K**-1', 'derivative of minimum central pressure '
+                              'with respect to air temperature'),
+    'dvmax_dt': ('m s**-1 K**-1', 'derivative of maximum sustained '
+                                  'windspeed with respect to air '
+                                  'temperature'),
+}
+
 def main():
     """
     Handle command line arguments and call processing functions
@@ -39,6 +121,16 @@ def main():
                    help="Verbose output", 
                    action='store_true')
     p.add_argument('-y', '--year', help="Year to process (1979-2020)")
+    p.add_argument('-e', '--engine',
+                   help="PI engine (fortran, numba, numpy or emulator). Overrides the config file")
+    p.add_argument('-r', '--resume', action='store_true',
+                   help="Skip months already calculated, and the times "
+                        "saved in the checkpoint of a month that was not "
+                        "finished")
+    p.add_argument('-b', '--backend', choices=BACKENDS,
+                   help="Parallel backend (mpi, pool or serial). Overrides "
+                        "the config file. Default is mpi when run with "
+                        "more than one MPI process, otherwise pool")
 
     args = p.parse_args()
 
@@ -88,222 +180,1748 @@ def main():
     LOGGER.info(f"Log file: {logfile} (detail level {logLevel})")
     LOGGER.info(f"Code version: f{COMMIT}")
 
-    tpath = config.get('Input', 'Temp')
-    rpath = config.get('Input', 'Humidity')
-    sstpath = config.get('Input', 'SST')
-    slppath = config.get('Input', 'SLP')
+    settings = readSettings(config, args)
 
     if args.year:
         year = int(args.year)
     else:
         year = 2015
 
-    minLon = config.getfloat('Domain', 'MinLon')
-    maxLon = config.getfloat('Domain', 'MaxLon')
-    minLat = config.getfloat('Domain', 'MinLat')
-    maxLat = config.getfloat('Domain', 'MaxLat')
+    # Months whose output is complete, and the number of times in each.
+    # These are skipped when resuming
+    complete = completeMonths(settings, year) if args.resume else {}
+    for month in sorted(complete):
+        LOGGER.info(f"The output for {year}-{month} is complete: skipping")
+    months = [month for month in range(1, 13) if month not in complete]
+    # Number of times read from checkpoints and calculated, when resuming
+    resumed = 0
+    calculated = 0
 
-    LOGGER.info(f"Domain: {minLon}-{maxLon}, {minLat}-{maxLat}")
+    pool = None
+    if settings['backend'] == 'pool':
+        pool = startPool(settings, logfile, logLevel)
 
-    for month in range(1, 13):
+    # The input data of the next month are read in a background thread
+    # while the current month is calculated. The first process writes
+    # each month in another thread while the next month is calculated
+    prefetch = ThreadPoolExecutor(max_workers=1)
+    writer = ThreadPoolExecutor(max_workers=1)
+    written = None
+    if months:
+        nextmonth = prefetch.submit(loadMonth, settings, year, months[0])
+    for i, month in enumerate(months):
         LOGGER.info(f"Processing {year}-{month}")
-        startdate = datetime.datetime(year, month, 1)
-        enddate = datetime.datetime(year, month, monthrange(year, month)[1])
+        monthdata = nextmonth.result()
+        if i + 1 < len(months):
+            nextmonth = prefetch.submit(loadMonth, settings, year,
+                                        months[i + 1])
+        if monthdata is None:
+            continue
+        written, ndone, ncalc = processMonth(settings, year, month,
+                                             monthdata, args.resume, pool,
+                                             writer, written)
+        resumed += ndone
+        calculated += ncalc
+
+    if written is not None:
+        written.result()
+    prefetch.shutdown()
+    writer.shutdown()
+    if pool is not None:
+        pool.shutdown()
+    if args.resume:
+        skipped = sum(complete.values()) + resumed
+        total = skipped + calculated
+        LOGGER.info(f"Resumed {year}: skipped {len(complete)} complete "
+                    f"month(s) ({sum(complete.values())} times) and "
+                    f"{resumed} times read from checkpoints, "
+                    f"{100. * skipped / max(total, 1):.1f}% of the "
+                    f"{total} times. Calculated {calculated} times")
+    LOGGER.info("Finished calculating potential intensity")
 
-        filedatestr = f"{startdate.strftime('%Y%m%d')}-{enddate.strftime('%Y%m%d')}"
 
-        tfile = pjoin(tpath, f'{year}', f't_era5_oper_pl_{filedatestr}.nc')
-        try:
-            assert(os.path.isfile(tfile))
-        except AssertionError:
-            LOGGER.warning(f"Input file is missing: {tfile}")
-            LOGGER.warning(f"Skipping month {month}")
-            continue
+def readSettings(config, args):
+    """
+    Read the options of a run from the configuration file and the command
+    line, and set up the PI engine to match.
+
+    :param config: :class:`ConfigParser` instance
+    :param args: Command line arguments (see `main`)
+
+    :returns: dict of the settings of the run, used by `loadMonth` and
+              `processMonth`. `options` holds the arguments of
+              `calculate` other than the inputs (see `processTile`)
+    :raises ValueError: if the parallel backend is not recognised or
+                        cannot be used with the number of MPI processes,
+                        or the [Sensitivity] and [Sweep] sections are
+                        used together
+    """
+    enginename = args.engine or config.get('Engine', 'Name',
+                                           fallback='fortran')
+    engine = loadEngine(enginename)
+
+    # Number of threads for the PI kernel. Default to a single
+    # thread, so that multiple MPI processes on a node do not each try to
+    # use every core.
+    nthreads = config.getint('Parallel', 'Threads',
+                             fallback=int(os.environ.get('OMP_NUM_THREADS', 1)))
+    engine.setnthreads(nthreads)
+    LOGGER.info(f"Using {engine.getnthreads()} thread(s) per process for the PI kernel")
+
+    # Size (latitude, longitude points) of the tiles of the domain. Each
+    # time of each tile is a unit of work for the MPI processes. Default
+    # is the whole domain, so each unit is a single time
+    tilesize = config.get('Parallel', 'TileSize', fallback=None)
+    if tilesize:
+        tilesize = tuple(int(n) for n in tilesize.split(','))
+        LOGGER.info(f"Tiles of {tilesize[0]} x {tilesize[1]} points")
+
+    # Backend that distributes the units of work. Without MPI (a single
+    # process, or no mpi4py), the units are calculated by a pool of
+    # Processes processes, by default enough to use every core
+    backend = args.backend or config.get('Parallel', 'Backend',
+                                         fallback=None)
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') \
+        else os.cpu_count()
+    processes = config.getint('Parallel', 'Processes',
+                              fallback=max(cores // nthreads, 1))
+    if backend is None:
+        if comm.size > 1:
+            backend = 'mpi'
+        elif processes > 1:
+            backend = 'pool'
+        else:
+            backend = 'serial'
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown parallel backend '{backend}'. "
+                         f"Available backends: {', '.join(BACKENDS)}")
+    if backend != 'mpi' and comm.size > 1:
+        raise ValueError(f"The '{backend}' backend cannot be used with "
+                         f"{comm.size} MPI processes")
+    if backend == 'pool':
+        LOGGER.info(f"Using a pool of {processes} processes")
+    else:
+        LOGGER.info(f"Parallel backend: {backend}")
+
+    # Optionally write the output files in parallel: each worker writes
+    # the results it calculates directly to the file, so they are not
+    # gathered by the first process
+    paroutput = config.getboolean('Output', 'Parallel', fallback=False)
+    if paroutput and comm.size == 1:
+        paroutput = False
+    elif paroutput and not nctools.ncParallelSupport():
+        LOGGER.warning("The netCDF library does not support parallel "
+                       "access: the results will be gathered by the "
+                       "first process")
+        paroutput = False
+    if paroutput:
+        LOGGER.info("Writing the output files in parallel")
+
+    # Each time of a month is saved to a checkpoint when it is finished,
+    # so that a job that stops part way through a month can be resumed
+    # (see --resume). The results of the month are not held by the first
+    # process with parallel output, so there is no checkpoint
+    checkpoint = config.getboolean('Output', 'Checkpoint', fallback=True)
+    if paroutput:
+        checkpoint = False
+
+    # The emulator (see :mod:`pcmin_emulator`) is loaded from EmulatorModel,
+    # and EmulatorCheck columns of each time are also calculated with the
+    # Fortran engine to check its error
+    reference = None
+    check = 0
+    model = config.get('Engine', 'EmulatorModel', fallback=None)
+    if hasattr(engine, 'setmodel'):
+        engine.setmodel(model)
+        check = config.getint('Engine', 'EmulatorCheck', fallback=0)
+        if check > 0:
+            reference = loadEngine('fortran')
+            reference.setnthreads(nthreads)
+
+    # First guess of the minimum pressure: 'none' (default, 950 hPa),
+    # 'spatial' (from a coarse subset of points in the same time) or
+    # 'previous' (from the previous time of the same tile)
+    warmstart = config.get('Engine', 'WarmStart', fallback='none').lower()
+    stride = config.getint('Engine', 'WarmStartStride', fallback=4)
+    if warmstart == 'previous' and ((backend == 'mpi' and comm.size > 2) or
+                                    (backend == 'pool' and processes > 1)):
+        # Which process calculates the previous time of a tile depends
+        # on the order the units finish, and so would the results
+        LOGGER.warning("WarmStart=previous needs a single process to "
+                       "calculate every unit: using spatial instead")
+        warmstart = 'spatial'
+    if warmstart == 'none':
+        stride = 0
+    LOGGER.info(f"First guess of minimum pressure: {warmstart}")
+
+    # Method used to solve for the minimum pressure: 'fixed' (default,
+    # fixed-point iteration) or 'secant' (safeguarded secant iteration)
+    solver = config.get('Engine', 'Solver', fallback='fixed').lower()
+    isolv = SOLVERS[solver]
+    LOGGER.info(f"Minimum pressure solver: {solver}")
+
+    # Optional pre-screen: columns with SST below ScreenSST (C) are given
+    # zero PI without calling the kernel. ScreenValidate columns of those
+    # screened at each time are calculated anyway, to check the screen
+    screen = config.getfloat('Engine', 'ScreenSST', fallback=None)
+    validate = config.getint('Engine', 'ScreenValidate', fallback=0)
+    tolerance = config.getfloat('Engine', 'ScreenTolerance', fallback=1.0)
+    if screen is not None:
+        LOGGER.info(f"Screening columns with SST below {screen} C "
+                    f"(checking {validate} per time)")
+
+    # Precision of the data held in memory and written to the output
+    # files: 'double' (default) or 'single'. The Fortran kernel works in
+    # single precision either way, so 'single' halves the memory and
+    # output size without converting the data on every call
+    precision = config.get('Engine', 'Precision', fallback='double').lower()
+    dtype = PRECISIONS[precision]
+    LOGGER.info(f"Data precision: {precision}")
+
+    # Optionally use a table of moist adiabats in the CAPE calculation.
+    # The table is built (and cached) by the first process, then read
+    # from the cache by the others
+    table = config.getboolean('Engine', 'MoistAdiabatTable', fallback=False)
+    cachefile = config.get('Engine', 'MoistAdiabatCache', fallback=None)
+    if table:
+        if comm.rank == 0:
+            moistadiabat.useTable(engine, cachefile=cachefile)
+        if comm.size > 1:
+            comm.Barrier()
+            if comm.rank > 0:
+                moistadiabat.useTable(engine, cachefile=cachefile)
 
+    # Optional decomposition of PI into the contributions of the SST and
+    # the atmosphere, using a day-of-year climatology of the inputs over
+    # the years StartYear-EndYear (see `decompose`)
+    decomposition = config.has_section('Decomposition')
+    climyears = climwindow = climcache = None
+    if decomposition:
+        climyears = range(config.getint('Decomposition', 'StartYear'),
+                          config.getint('Decomposition', 'EndYear') + 1)
+        climwindow = config.getint('Decomposition', 'Window', fallback=31)
+        climcache = config.get('Decomposition', 'Cache',
+                               fallback=climatology.CACHEDIR)
+        LOGGER.info(f"Calculating counterfactual PI with a {climwindow}-day "
+                    f"climatology for {climyears[0]}-{climyears[-1]}")
+
+    params = readParameters(config)
+    if params is not None:
+        LOGGER.info(f"Calculating {params.shape[1]} parameter set(s)")
+        for k in range(params.shape[1]):
+            LOGGER.info(f"Parameter set {k}: " +
+                        ", ".join(f"{name}={value:g}" for name, value in
+                                  zip(PARAMETERS, params[:, k])))
+
+    # Optional derivatives of PI with respect to the SST and to the
+    # temperature of the layer between BottomPressure and TopPressure
+    # (see `calculate`)
+    sensitivity = config.has_section('Sensitivity')
+    layer = None
+    if sensitivity:
+        if params is not None:
+            raise ValueError("The [Sensitivity] and [Sweep] sections "
+                             "cannot be used together")
+        layer = (config.getfloat('Sensitivity', 'BottomPressure',
+                                 fallback=300.),
+                 config.getfloat('Sensitivity', 'TopPressure',
+                                 fallback=100.))
+        LOGGER.info("Calculating the derivatives of PI with respect to "
+                    f"SST and to temperature at {layer[0]:g}-{layer[1]:g} hPa")
+
+    # Optional land-sea mask. If not given, the columns passed to the
+    # kernel are those with a valid SST at any time of the month
+    lsmfile = config.get('Input', 'LandSeaMask', fallback=None)
+    lsmthreshold = config.getfloat('Input', 'LandSeaThreshold', fallback=0.5)
+    # Optional window of pressure levels (hPa) read from the temperature
+    # and humidity files. Default is every level
+    ptop = config.getfloat('Input', 'TopPressure', fallback=None)
+    pbottom = config.getfloat('Input', 'BottomPressure', fallback=None)
+
+    domain = (config.getfloat('Domain', 'MinLon'),
+              config.getfloat('Domain', 'MaxLon'),
+              config.getfloat('Domain', 'MinLat'),
+              config.getfloat('Domain', 'MaxLat'))
+    LOGGER.info(f"Domain: {domain[0]}-{domain[1]}, {domain[2]}-{domain[3]}")
+
+    outputPath = config.get('Output', 'Path')
+    try:
+        os.makedirs(outputPath)
+    except:
+        pass
+
+    # Options that change the results. A checkpoint saved with other
+    # options is not read when resuming (see `loadCheckpoint`)
+    signature = checkpointSignature(
+        enginename, model, solver, warmstart, stride, precision, table,
+        screen, tilesize, ptop, pbottom, lsmfile, lsmthreshold, domain,
+        None if params is None else params.tolist(), layer,
+        (list(climyears), climwindow) if decomposition else None)
+
+    return {
+        'enginename': enginename, 'nthreads': nthreads, 'model': model,
+        'check': check, 'table': table, 'cachefile': cachefile,
+        'warmstart': warmstart, 'tilesize': tilesize, 'backend': backend,
+        'processes': processes, 'paroutput': paroutput,
+        'checkpoint': checkpoint, 'dtype': dtype, 'screen': screen,
+        'params': params, 'layer': layer, 'climyears': climyears,
+        'climwindow': climwindow, 'climcache': climcache,
+        'tpath': config.get('Input', 'Temp'),
+        'rpath': config.get('Input', 'Humidity'),
+        'sstpath': config.get('Input', 'SST'),
+        'slppath': config.get('Input', 'SLP'),
+        'lsmfile': lsmfile, 'lsmthreshold': lsmthreshold, 'ptop': ptop,
+        'pbottom': pbottom, 'domain': domain, 'outputPath': outputPath,
+        'signature': signature,
+        'options': {'engine': engine, 'stride': stride, 'isolv': isolv,
+                    'params': params, 'screen': screen,
+                    'validate': validate, 'tolerance': tolerance,
+                    'reference': reference, 'check': check,
+                    'dtype': dtype},
+    }
+
+
+def completeMonths(settings, year):
+    """
+    Find the months of a year whose output is complete, which are skipped
+    when resuming. The output files are checked by the first process.
+
+    :param dict settings: Settings of the run (see `readSettings`)
+    :param int year: Year
+
+    :returns: dict of the number of times in each complete month
+    """
+    complete = {}
+    if comm.rank == 0:
+        for month in range(1, 13):
+            datestr = monthString(year, month)
+            outputFile = pjoin(settings['outputPath'], f'pcmin.{datestr}.nc')
+            tfile = pjoin(settings['tpath'], f'{year}',
+                          f't_era5_oper_pl_{datestr}.nc')
+            if os.path.isfile(outputFile) and os.path.isfile(tfile):
+                tobj = nctools.ncLoadFile(tfile)
+                ntimes = len(tobj.dimensions['time'])
+                tobj.close()
+                if checkOutput(outputFile, ntimes):
+                    complete[month] = ntimes
+    if comm.size > 1:
+        complete = comm.bcast(complete, root=0)
+    return complete
+
+
+def startPool(settings, logfile, loglevel):
+    """
+    Start the pool of processes of the ``pool`` backend. The processes
+    are started afresh rather than forked, as the netCDF library is in
+    use by the threads of this process. Each loads and sets up the engine
+    as this process has (see `poolInit`).
+
+    :param dict settings: Settings of the run (see `readSettings`)
+    :param str logfile: Path to the log file
+    :param str loglevel: Logging level
+
+    :returns: :class:`ProcessPoolExecutor` instance
+    """
+    setup = {name: settings[name] for name in
+             ('nthreads', 'model', 'check', 'table', 'cachefile',
+              'warmstart')}
+    setup.update(engine=settings['enginename'], logfile=logfile,
+                 loglevel=loglevel)
+    options = {name: value for name, value in settings['options'].items()
+               if name not in ('engine', 'reference')}
+    return ProcessPoolExecutor(
+        max_workers=settings['processes'],
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=poolInit, initargs=(setup, options))
+
+
+def loadMonth(settings, year, month):
+    """
+    Open the input files of a month, and read and convert the SST and
+    sea level pressure. This runs in a background thread, reading the
+    next month while the current month is calculated.
+
+    :param dict settings: Settings of the run (see `readSettings`)
+    :param int year: Year
+    :param int month: Month
+
+    :returns: tuple of the dates in the file names, the temperature
+              and humidity variables, SST and SLP, the index of the
+              ocean columns, the times, the pressure levels, their
+              slice and their array for `metutils.rHToMixRat`, the
+              longitudes and latitudes, and the indices of the grid
+              in the pressure level and surface files, or None if an
+              input file is missing
+    """
+    LOGGER.info(f"Loading input data for {year}-{month}")
+    filedatestr = monthString(year, month)
+    minLon, maxLon, minLat, maxLat = settings['domain']
+    dtype = settings['dtype']
+
+    tfile = pjoin(settings['tpath'], f'{year}',
+                  f't_era5_oper_pl_{filedatestr}.nc')
+    try:
+        assert(os.path.isfile(tfile))
+    except AssertionError:
+        LOGGER.warning(f"Input file is missing: {tfile}")
+        LOGGER.warning(f"Skipping month {month}")
+        return None
+
+    with NCLOCK:
         tobj = nctools.ncLoadFile(tfile)
         tvar = nctools.ncGetVar(tobj, 't')
         tvar.set_auto_maskandscale(True)
 
-        rfile = pjoin(rpath, f'{year}', f'r_era5_oper_pl_{filedatestr}.nc')
-        try:
-            assert(os.path.isfile(rfile))
-        except AssertionError:
-            LOGGER.warning(f"Input file is missing: {rfile}")
-            LOGGER.warning(f"Skipping month {month}")
-            continue
+    rfile = pjoin(settings['rpath'], f'{year}',
+                  f'r_era5_oper_pl_{filedatestr}.nc')
+    try:
+        assert(os.path.isfile(rfile))
+    except AssertionError:
+        LOGGER.warning(f"Input file is missing: {rfile}")
+        LOGGER.warning(f"Skipping month {month}")
+        return None
+    with NCLOCK:
         robj = nctools.ncLoadFile(rfile)
         rvar = nctools.ncGetVar(robj, 'r')
         rvar.set_auto_maskandscale(True)
-        # This is actually relative humidity, we need to convert to mixing ratio
-        # Calculate mixing ratio - this function returns mixing ratio in g/kg
+    # This is actually relative humidity, we need to convert to mixing ratio
+    # Calculate mixing ratio - this function returns mixing ratio in g/kg
 
-        # Dimensions need to come from the pressure files
-        # These have been clipped to the Australian region, so contain
-        # a subset of the global data. The SST and MSLP data
-        # are then clipped to the same domain
+    # Dimensions need to come from the pressure files
+    # These have been clipped to the Australian region, so contain
+    # a subset of the global data. The SST and MSLP data
+    # are then clipped to the same domain
+    with NCLOCK:
         tlon = nctools.ncGetDims(tobj, 'longitude')
         tlat = nctools.ncGetDims(tobj, 'latitude')
-        LOGGER.debug(f"Latitude extents: {tlat.min()} - {tlat.max()}")
-        LOGGER.debug(f"Longitude extents: {tlon.min()} - {tlon.max()}")
+    LOGGER.debug(f"Latitude extents: {tlat.min()} - {tlat.max()}")
+    LOGGER.debug(f"Longitude extents: {tlon.min()} - {tlon.max()}")
 
-        varidx = np.where((tlon>=minLon) & (tlon<=maxLon))[0]
-        varidy = np.where((tlat>=minLat) & (tlat<=maxLat))[0]
+    varidx = np.where((tlon>=minLon) & (tlon<=maxLon))[0]
+    varidy = np.where((tlat>=minLat) & (tlat<=maxLat))[0]
 
-        templon = tlon[varidx]
-        templat = tlat[varidy]
+    templon = tlon[varidx]
+    templat = tlat[varidy]
 
-        LOGGER.info(f"Loading SST data")
-        sstfile = pjoin(sstpath, f'{year}', f'sst_era5_oper_sfc_{filedatestr}.nc' )
-        try:
-            assert(os.path.isfile(sstfile))
-        except AssertionError:
-            LOGGER.warning(f"Input file is missing: {sstfile}")
-            LOGGER.warning(f"Skipping month {month}")
-            continue
+    LOGGER.info(f"Loading SST data")
+    sstfile = pjoin(settings['sstpath'], f'{year}',
+                    f'sst_era5_oper_sfc_{filedatestr}.nc')
+    try:
+        assert(os.path.isfile(sstfile))
+    except AssertionError:
+        LOGGER.warning(f"Input file is missing: {sstfile}")
+        LOGGER.warning(f"Skipping month {month}")
+        return None
 
+    with NCLOCK:
         sstobj = nctools.ncLoadFile(sstfile)
         sstvar = nctools.ncGetVar(sstobj,'sst')
         sstvar.set_auto_maskandscale(True)
         sstlon = nctools.ncGetDims(sstobj, 'longitude')
         sstlat = nctools.ncGetDims(sstobj, 'latitude')
 
-        LOGGER.debug(f"SST latitude extents: {sstlat.min()} - {sstlat.max()}")
-        LOGGER.debug(f"SST longitude extents: {sstlon.min()} - {sstlon.max()}")
+    LOGGER.debug(f"SST latitude extents: {sstlat.min()} - {sstlat.max()}")
+    LOGGER.debug(f"SST longitude extents: {sstlon.min()} - {sstlon.max()}")
 
-        LOGGER.info("Loading SLP data")
-        slpfile = pjoin(slppath, f'{year}', f'msl_era5_oper_sfc_{filedatestr}.nc')
-        try:
-            assert(os.path.isfile(slpfile))
-        except AssertionError:
-            LOGGER.warning(f"Input file is missing: {slpfile}")
-            LOGGER.warning(f"Skipping month {month}")
-            continue
+    LOGGER.info("Loading SLP data")
+    slpfile = pjoin(settings['slppath'], f'{year}',
+                    f'msl_era5_oper_sfc_{filedatestr}.nc')
+    try:
+        assert(os.path.isfile(slpfile))
+    except AssertionError:
+        LOGGER.warning(f"Input file is missing: {slpfile}")
+        LOGGER.warning(f"Skipping month {month}")
+        return None
+    with NCLOCK:
         slpobj = nctools.ncLoadFile(slpfile)
         slpvar = nctools.ncGetVar(slpobj, 'msl')
         slpvar.set_auto_maskandscale(True)
 
-        # In the ERA5 data on NCI, surface variables are global, 
-        # pressure variables are only over Australian region
-        LOGGER.info("Getting intersection of grids")
-        lonx, sstidx, varidxx = np.intersect1d(sstlon, templon, return_indices=True)
-        laty, sstidy, varidyy = np.intersect1d(sstlat, templat[::-1], return_indices=True)
-        nx = len(varidx)
-        ny = len(varidy)
-        LOGGER.info("Loading and converting SST and SLP data")
-        sst = metutils.convert(sstvar[:, sstidy, sstidx], sstvar.units, 'C')
-        slp = metutils.convert(slpvar[:, sstidy, sstidx], slpvar.units, 'hPa')
-
-        times = nctools.ncGetTimes(nctools.ncLoadFile(tfile))
-        nt = len(times)
-        LOGGER.debug(f"There are {nt} times in the data file")
-
-        levels = nctools.ncGetDims(nctools.ncLoadFile(tfile), 'level')
-        nz = len(levels)
-        LOGGER.debug(f"There are {nz} vertical levels in the data file")
-
-        # Create an array of the pressure variable that 
-        # matches the shape of the temperature and mixing ratio
-        # variables.
-        LOGGER.info("Creating temporary pressure array")
-        pp = np.ones((nz, ny, nx))
-        ppT = pp.T
-        ppT *= levels
-
-        pmin = np.zeros(sst.shape)
-        vmax = np.zeros(sst.shape)
-        status = MPI.Status()
-        work_tag = 0
-        result_tag = 1
-        LOGGER.info("Calculating potential intensity")
-        if (comm.rank == 0) and (comm.size > 1):
-            w = 0
-            p = comm.size - 1
-            for d in range(1, comm.size):
-                if w < nt:
-                    LOGGER.debug(f"Sending time {w} to node {d}")
-                    comm.send(w, dest=d, tag=work_tag)
-                    w += 1
-                else:
-                    comm.send(None, dest=d, tag=work_tag)
-                    p = w
-
-            terminated = 0
-            while(terminated < p):
-                result, tdx = comm.recv(source=MPI.ANY_SOURCE, status=status, tag=MPI.ANY_TAG)
-                pmin[tdx, :, :], vmax[tdx, :, :] = result
-                LOGGER.debug(f"Mean PI: {np.nanmean(vmax[tdx, :, :]):.2f} m/s")
-                d = status.source
-
-                if w < nt:
-                    LOGGER.debug(f"Sending time {times[w]} to node {d}")
-                    comm.send(w, dest=d, tag=status.tag)
-                    w += 1
-                else:
-                    # Exhausted all times, send empty packet:
-                    comm.send(None, dest=d, tag=status.tag)
-                    terminated += 1
-        elif (comm.size > 1) and (comm.rank != 0):
-            status = MPI.Status()
-            W = None
-            while(True):
-                W = comm.recv(source=0, tag=work_tag, status=status)
-                if W is None:
-                    # Received an empty packet, so no work required
-                    LOGGER.debug("No work to be done on this processor: {0}".format(comm.rank))
-                    break
-                LOGGER.debug(f"Processing time {times[W]} on node {comm.rank}")
-                t = metutils.convert(tvar[W, :, varidy, varidx], tvar.units, 'C')
-                r = metutils.rHToMixRat(rvar[W, :, varidy, varidx], t, pp, 'C')
-                r = np.where(r < 0, 0, r)
-                results = calculate(sst[W, :, :], slp[W, :, :], pp, t, r, levels)
-                LOGGER.debug(f"Finished time {times[W]} on node {comm.rank}")
-                comm.send((results, W), dest=0, tag=status.tag)
-        elif (comm.size == 1) and (comm.rank == 0):
-            # We're working on a single processor:
-            for tdx in range(nt):
-                LOGGER.debug(f"Processing time {times[W]}")
-                t = metutils.convert(tvar[tdx, :, varidy, varidx], tvar.units, 'C')
-                r = metutils.rHToMixRat(rvar[tdx, :, varidy, varidx], t, pp, 'C')
-                r = np.where(r < 0, 0, r)
-                pmin[tdx, :, :], vmax[tdx, :, :] = calculate(sst[tdx, :, :],
-                                                             slp[tdx, :, :],
-                                                             pp, t, r, levels)
+    # In the ERA5 data on NCI, surface variables are global,
+    # pressure variables are only over Australian region
+    LOGGER.info("Getting intersection of grids")
+    lonx, sstidx, varidxx = np.intersect1d(sstlon, templon, return_indices=True)
+    laty, sstidy, varidyy = np.intersect1d(sstlat, templat[::-1], return_indices=True)
+    LOGGER.info("Loading and converting SST and SLP data")
+    with NCLOCK:
+        sst = sstvar[:, sstidy, sstidx]
+    sst = metutils.convert(sst, sstvar.units, 'C', dtype)
+    with NCLOCK:
+        slp = slpvar[:, sstidy, sstidx]
+    slp = metutils.convert(slp, slpvar.units, 'hPa', dtype)
+
+    # Only the ocean columns are passed to the kernel. The index is
+    # the same for every month on the same grid, so is cached
+    with NCLOCK:
+        index = columnIndex(lonx, laty,
+                            np.ma.getmaskarray(sst).all(axis=0),
+                            settings['lsmfile'], settings['lsmthreshold'])
+        times = nctools.ncGetTimes(tobj)
+        levels = nctools.ncGetDims(tobj, 'level')
+    LOGGER.debug(f"There are {len(times)} times in the data file")
+
+    LOGGER.debug(f"There are {len(levels)} vertical levels in the data file")
+    # Only the levels in the window are read and converted
+    lslice = levelSlice(levels, settings['ptop'], settings['pbottom'])
+    levels = levels[lslice]
+    LOGGER.debug(f"Reading {len(levels)} levels ({levels.min()}-"
+                 f"{levels.max()} hPa)")
+
+    # The pressure levels are the same for every column, so are
+    # broadcast across the grid rather than stored for each point
+    plev = levels[:, np.newaxis, np.newaxis].astype(dtype)
+    return (filedatestr, tvar, rvar, sst, slp, index, times, levels,
+            lslice, plev, lonx, laty, varidx, varidy, sstidx, sstidy)
+
+
+def monthOutputs(settings, shape, lon, lat, times):
+    """
+    Allocate the arrays of the results of a month.
+
+    :param dict settings: Settings of the run (see `readSettings`)
+    :param tuple shape: Shape (nt, ny, nx) of the month
+    :param lon: `numpy.ndarray` of longitudes
+    :param lat: `numpy.ndarray` of latitudes
+    :param times: Times of the month
+
+    :returns: dict of the `numpy.ndarray` of each output variable, in
+              the order the results of a unit of work are sent between
+              processes, and the positional and keyword arguments of
+              `saveData` other than the file name
+    """
+    dtype = settings['dtype']
+    params = settings['params']
+    if params is not None:
+        shape = (shape[0], params.shape[1]) + tuple(shape[1:])
+    if settings['paroutput']:
+        # The results are not held for the whole month: arrays
+        # that take no memory stand in for them to create the file
+        empty = lambda t: np.broadcast_to(np.zeros((), dtype=t), shape)
+    else:
+        empty = lambda t: np.zeros(shape, dtype=t)
+    types = {'pmin': dtype, 'vmax': dtype, 'ifl': np.uint8,
+             'niter': np.int32, 'to': np.float32, 'otl': np.float32,
+             'ncmax': np.int32}
+    if settings['layer'] is not None:
+        types.update(dict.fromkeys(SENSITIVITIES, dtype))
+    if settings['climyears'] is not None:
+        types.update(dict.fromkeys(COUNTERFACTUALS, dtype))
+    outputs = {name: empty(t) for name, t in types.items()}
+    saveargs = ((outputs['pmin'], outputs['vmax'], lon, lat, times,
+                 params),
+                dict(ifl=outputs['ifl'], niter=outputs['niter'],
+                     ncmax=outputs['ncmax'], to=outputs['to'],
+                     otl=outputs['otl'], layer=settings['layer'],
+                     counterfactual={name: outputs[name] for name
+                                     in COUNTERFACTUALS if name in outputs},
+                     sensitivity={name: outputs[name] for name
+                                  in SENSITIVITIES if name in outputs}))
+    return outputs, saveargs
+
+
+def processMonth(settings, year, month, monthdata, resume, pool, writer,
+                 written):
+    """
+    Calculate the PI of a month with the parallel backend of the run,
+    log its statistics, and queue the output to be written.
+
+    :param dict settings: Settings of the run (see `readSettings`)
+    :param int year: Year
+    :param int month: Month
+    :param tuple monthdata: Inputs of the month (see `loadMonth`)
+    :param bool resume: If True, read the times saved in the checkpoint
+                        of the month rather than calculate them
+    :param pool: :class:`ProcessPoolExecutor` of the ``pool`` backend
+                 (see `startPool`), or None
+    :param writer: :class:`ThreadPoolExecutor` that writes the output
+                   and checkpoints
+    :param written: :class:`Future` of the output of the previous month,
+                    or None
+
+    :returns: :class:`Future` of the output of this month (or `written`
+              if this process does not write it), and the number of
+              times read from the checkpoint and calculated
+    """
+    (filedatestr, tvar, rvar, sst, slp, index, times, levels, lslice,
+     plev, lonx, laty, varidx, varidy, sstidx, sstidy) = monthdata
+    nt = len(times)
+    ny, nx = len(varidy), len(varidx)
+    layer = settings['layer']
+    paroutput = settings['paroutput']
+    checkpoint = settings['checkpoint']
+    signature = settings['signature']
 
+    dtlayer = None
+    if layer is not None:
+        # Perturbation of the temperature (K) at each level
+        dtlayer = ((levels <= layer[0]) &
+                   (levels >= layer[1])).astype(np.float32)
+        if not dtlayer.any():
+            LOGGER.warning(f"There are no levels between {layer[0]:g} "
+                           f"and {layer[1]:g} hPa: the derivatives "
+                           "with respect to temperature are zero")
 
+    climargs = None
+    if settings['climyears'] is not None:
+        # The climatology is built by the first process (the first
+        # time it is needed), then read from the cache by the others
+        climargs = ({'sst': settings['sstpath'], 'slp': settings['slppath'],
+                     't': settings['tpath'], 'r': settings['rpath']},
+                    settings['climyears'],
+                    (sstidy, sstidx, varidy, varidx, lslice), levels,
+                    lonx, laty, settings['climwindow'],
+                    settings['climcache'])
         if comm.rank == 0:
-            sleep(5)
+            with NCLOCK:
+                clim = climatology.loadClimatology(*climargs)
+        if comm.size > 1:
+            comm.Barrier()
+            if comm.rank > 0:
+                clim = climatology.loadClimatology(*climargs, build=False)
+
+    outputs, saveargs = monthOutputs(settings, sst.shape, lonx, laty, times)
+
+    outputFile = pjoin(settings['outputPath'], f'pcmin.{filedatestr}.nc')
+    # The output is written to a temporary file, which is renamed
+    # once it is complete (see `saveMonth`)
+    partFile = f"{outputFile}.partial"
+    checkpointPath = f"{outputFile}.ckpt"
+    ncobj = None
+    if paroutput:
+        # The file is created by the first process, then opened by
+        # every process. Independent writes cannot be compressed
+        saveData(partFile, *saveargs[0], **saveargs[1],
+                 writedata=False, zlib=False)
         comm.Barrier()
-        LOGGER.info(f"Saving data for month: {month}")
-        outputPath = config.get('Output', 'Path')
+        with NCLOCK:
+            ncobj = nctools.ncOpenParallel(partFile, comm)
+    # Times already calculated, read from the checkpoint of the month
+    done = set()
+    if checkpoint and resume and comm.rank == 0:
+        done = loadCheckpoint(checkpointPath, outputs, signature)
+        if done:
+            LOGGER.info(f"Resuming {year}-{month}: read {len(done)} of "
+                        f"{nt} times from {checkpointPath}")
+    elif checkpoint and comm.rank == 0 and isdir(checkpointPath):
+        # Not resuming: the times of an earlier run are not kept
+        shutil.rmtree(checkpointPath)
+    if comm.size > 1:
+        done = comm.bcast(done, root=0)
+    # Units of work: each tile of each time
+    tiles = tileSlices(ny, nx, settings['tilesize'])
+    units = [(tdx, k) for tdx in range(nt) if tdx not in done
+             for k in range(len(tiles))]
+    # Number of tiles of each time still to be calculated
+    remaining = {tdx: len(tiles) for tdx in range(nt) if tdx not in done}
+
+    def finished(tdx):
+        # Save a time to the checkpoint once all its tiles are
+        # calculated. This is queued behind the output of the previous
+        # month, and the output of this month behind it
+        remaining[tdx] -= 1
+        if checkpoint and not remaining[tdx]:
+            writer.submit(saveCheckpoint, checkpointPath, tdx,
+                          {name: out[tdx] for name, out in outputs.items()},
+                          signature)
+    # Ocean columns of each tile
+    ocean = np.zeros(ny * nx, dtype=bool)
+    ocean[index] = True
+    ocean = ocean.reshape(ny, nx)
+    tindex = [np.flatnonzero(ocean[ys, xs]) for ys, xs in tiles]
+    if len(tiles) > 1:
+        LOGGER.info(f"{len(units)} units of work: {len(remaining)} "
+                    f"times of {len(tiles)} tiles")
+
+    inputs = {'tvar': tvar, 'rvar': rvar, 'lslice': lslice,
+              'varidy': varidy, 'varidx': varidx, 'levels': levels,
+              'plev': plev, 'sst': sst, 'slp': slp, 'tiles': tiles,
+              'tindex': tindex, 'dtlayer': dtlayer, 'clim': None,
+              'days': None}
+    if climargs is not None:
+        inputs['clim'] = clim
+        inputs['days'] = [climatology.dayOfYear(time) for time in times]
+    # Final iterate of each tile and time calculated by this process,
+    # until it is the first guess of the next time
+    prev = {} if settings['warmstart'] == 'previous' else None
+
+    LOGGER.info("Calculating potential intensity")
+    options = settings['options']
+    # Statistics of the results written by this process (see
+    # `resultStats`), with parallel output
+    stats = None
+    if pool is not None:
+        # The SST, SLP and ocean points are shared with the processes
+        # of the pool, which read the temperature and humidity of each
+        # tile from the input files themselves
+        shared = [shareArray(array) for array in
+                  (np.ma.getdata(sst), np.ma.getmaskarray(sst),
+                   np.ma.getdata(slp), np.ma.getmaskarray(slp), ocean)]
+        spec = {'month': filedatestr,
+                'tfile': tvar.group().filepath(),
+                'rfile': rvar.group().filepath(),
+                'arrays': [desc for _, desc in shared],
+                'lslice': lslice, 'varidy': varidy, 'varidx': varidx,
+                'levels': levels, 'tiles': tiles, 'dtlayer': dtlayer,
+                'climargs': climargs, 'days': inputs['days']}
+        runPool(pool, spec, units, outputs, finished)
+        releaseArrays([shm for shm, _ in shared])
+    elif comm.size > 1 and comm.rank == 0:
+        runMaster(comm, units, tiles, outputs, finished, paroutput)
+    elif comm.size > 1:
+        stats = runWorker(comm, units, inputs, options, outputs, prev,
+                          ncobj)
+    else:
+        runSerial(units, inputs, options, outputs, finished, prev)
+
+    if paroutput:
+        with NCLOCK:
+            ncobj.close()
+        stats = comm.gather(stats, root=0)
+        if comm.rank == 0:
+            stats = functools.reduce(combineStats, stats)
+            os.replace(partFile, outputFile)
+    elif comm.rank == 0:
+        stats = resultStats(outputs)
+
+    if comm.rank == 0:
+        logStats(settings, month, stats)
+        if not paroutput:
+            # The previous month must be written before this one is
+            # queued, so at most two months of results are held
+            if written is not None:
+                written.result()
+            LOGGER.info(f"Saving data for month: {month}")
+            written = writer.submit(saveMonth, outputFile, checkpointPath,
+                                    *saveargs[0], **saveargs[1])
+    return written, len(done), nt - len(done)
+
+
+def logStats(settings, month, stats):
+    """
+    Log the statistics of the results of a month.
+
+    :param dict settings: Settings of the run (see `readSettings`)
+    :param int month: Month
+    :param dict stats: Statistics of the results (see `resultStats`)
+    """
+    LOGGER.info(f"Minimum pressure iterations for month {month}: "
+                f"{stats['niter']} "
+                f"({stats['niter'] / max(stats['calculated'], 1):.2f} "
+                f"per column calculated, maximum {stats['maxiter']})")
+    LOGGER.info(f"{stats['nonconv']} columns did not converge "
+                f"(IFL = 0) and the CAPE routine failed in "
+                f"{stats['capefail']} columns (IFL = 2). Maximum "
+                f"CAPE iterations at any level: {stats['maxcape']}")
+    if settings['screen'] is not None:
+        nscreen = stats['screened']
+        ncalc = stats['ocean']
+        LOGGER.info(f"{nscreen} of {ncalc} ocean columns "
+                    f"({100. * nscreen / max(ncalc, 1):.1f}%) were "
+                    f"screened (IFL = {IFL_SCREENED})")
+    if settings['climyears'] is not None:
+        mean = {name: total / max(count, 1) for name, (total, count)
+                in stats['vmax'].items()}
+        LOGGER.info(f"Mean VMAX: {mean['vmax']:.2f} m/s, "
+                    f"{mean['vmax_sst']:.2f} m/s "
+                    f"with climatological atmosphere, "
+                    f"{mean['vmax_atm']:.2f} m/s "
+                    f"with climatological SST")
+
+
+def saveMonth(outputFile, checkpointPath, *args, **kwargs):
+    """
+    Save the PI data of a month with `saveData`, holding the lock on the
+    netCDF library (see `NCLOCK`), so that it can run in a separate
+    thread. The data are written to a temporary file, which is renamed
+    once it is complete, so a file that has the name of the output is
+    never partly written. The checkpoint of the month is then removed.
+
+    :param str outputFile: Path to the output file
+    :param str checkpointPath: Directory of the checkpoint of the month
+                               (see `saveCheckpoint`)
+
+    Other arguments are passed to `saveData`.
+    """
+    partFile = f"{outputFile}.partial"
+    with NCLOCK:
+        saveData(partFile, *args, **kwargs)
+    os.replace(partFile, outputFile)
+    if isdir(checkpointPath):
+        shutil.rmtree(checkpointPath)
+
+
+def monthString(year, month):
+    """
+    :returns: str of the first and last dates of a month, as in the names
+              of the input and output files, e.g. ``20150101-20150131``
+    """
+    startdate = datetime.datetime(year, month, 1)
+    enddate = datetime.datetime(year, month, monthrange(year, month)[1])
+    return f"{startdate.strftime('%Y%m%d')}-{enddate.strftime('%Y%m%d')}"
+
+
+def checkOutput(filename, ntimes):
+    """
+    Check that an output file is complete, before skipping its month
+    when resuming: the file can be opened, and has `ntimes` times and the
+    PI of the last of them.
+
+    :param str filename: Path to the output file
+    :param int ntimes: Number of times in the input files of the month
+
+    :returns: True if the file is complete
+    """
+    try:
+        ncobj = nctools.ncLoadFile(filename)
+    except IOError:
+        LOGGER.warning(f"Cannot read {filename}: the month will be "
+                       "calculated again")
+        return False
+    try:
+        if len(ncobj.dimensions['time']) != ntimes:
+            LOGGER.warning(f"{filename} has {len(ncobj.dimensions['time'])} "
+                           f"times, not {ntimes}: the month will be "
+                           "calculated again")
+            return False
+        ncobj.variables['pmin'][-1]
+        ncobj.variables['vmax'][-1]
+    except (KeyError, IndexError, RuntimeError) as e:
+        LOGGER.warning(f"{filename} is incomplete ({e}): the month will "
+                       "be calculated again")
+        return False
+    finally:
+        ncobj.close()
+    return True
+
+
+def checkpointSignature(*key):
+    """
+    Signature of the options of a run, saved with the checkpoints so that
+    a checkpoint saved with other options is not resumed.
+
+    :param key: Values of the options that change the results
+
+    :returns: str hash of `key`
+    """
+    return hashlib.md5(repr(key).encode()).hexdigest()[:12]
+
+
+def saveCheckpoint(path, tdx, results, signature):
+    """
+    Save the results of a time to the checkpoint of a month. Each time is
+    saved to a file of its own, written under a temporary name and then
+    renamed, so a file in the checkpoint is never partly written. The
+    `signature` of the options is saved with the first time.
+
+    :param str path: Directory of the checkpoint
+    :param int tdx: Index of the time
+    :param dict results: `numpy.ndarray` of each output variable at the
+                         time
+    :param str signature: Signature of the options of the run (see
+                          `checkpointSignature`)
+    """
+    os.makedirs(path, exist_ok=True)
+    sigfile = pjoin(path, 'signature')
+    if not os.path.isfile(sigfile):
+        with open(sigfile, 'w') as fh:
+            fh.write(signature)
+    filename = pjoin(path, f"{tdx:04d}.npz")
+    with open(f"{filename}.partial", 'wb') as fh:
+        np.savez(fh, **results)
+    os.replace(f"{filename}.partial", filename)
+
+
+def loadCheckpoint(path, outputs, signature):
+    """
+    Read the times saved in the checkpoint of a month (see
+    `saveCheckpoint`) into the arrays of the month. Files that cannot be
+    read, or that do not match the arrays, are ignored, and their times
+    calculated again. A checkpoint saved with other options (a different
+    `signature`) is removed, and the whole month calculated again.
+
+    :param str path: Directory of the checkpoint
+    :param dict outputs: `numpy.ndarray` of each output variable for the
+                         month
+    :param str signature: Signature of the options of the run (see
+                          `checkpointSignature`)
+
+    :returns: set of the indices of the times read
+    """
+    done = set()
+    if not isdir(path):
+        return done
+    try:
+        with open(pjoin(path, 'signature')) as fh:
+            saved = fh.read().strip()
+    except OSError:
+        saved = None
+    if saved != signature:
+        LOGGER.warning(f"The checkpoint {path} was saved with different "
+                       "options: the month will be calculated again")
+        shutil.rmtree(path)
+        return done
+    nt = len(next(iter(outputs.values())))
+    for name in sorted(os.listdir(path)):
+        base, ext = splitext(name)
+        if ext != '.npz' or not base.isdigit() or int(base) >= nt:
+            continue
+        tdx = int(base)
         try:
-            os.makedirs(outputPath)
-        except:
-            pass
-        outputFile = pjoin(outputPath, f'pcmin.{filedatestr}.nc')
-        saveData(outputFile, pmin, vmax, lonx, laty, times)
+            with np.load(pjoin(path, name)) as data:
+                for var, out in outputs.items():
+                    out[tdx] = data[var]
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile) as e:
+            LOGGER.warning(f"Cannot read time {tdx} from the checkpoint "
+                           f"{path} ({e}): it will be calculated again")
+            continue
+        done.add(tdx)
+    return done
 
-    LOGGER.info("Finished calculating potential intensity")
 
+def processTile(inputs, tdx, k, options, prev=None):
+    """
+    Calculate the PI of one tile of one time: a unit of work for the
+    MPI processes or the processes of the pool. The temperature and
+    humidity of the tile are read from the input files.
+
+    :param dict inputs: Inputs of the month: the temperature and
+                        humidity variables `tvar` and `rvar`, the slice
+                        `lslice` of the levels read, the indices `varidy`
+                        and `varidx` of the domain in those files, the
+                        pressure levels `levels` (and `plev` for
+                        `metutils.rHToMixRat`), `sst` and `slp`, the
+                        `tiles` (see `tileSlices`) and the ocean columns
+                        `tindex` of each tile, the temperature
+                        perturbation `dtlayer`, and, for the
+                        decomposition, the climatology `clim` and the day
+                        of the year `days` of each time (otherwise None)
+    :param int tdx: Index of the time
+    :param int k: Index of the tile
+    :param dict options: The `engine`, `stride`, `isolv`, `params`,
+                         `screen`, `validate`, `tolerance`, `reference`
+                         and `check` arguments of `calculate`, and the
+                         `dtype` of the data
+    :param dict prev: Optional final iterate of each (time, tile)
+                      calculated by this process, for ``WarmStart =
+                      previous``. The previous time of the tile is taken
+                      from it as the first guess, and this time added
+
+    :returns: dict of the results of `calculate` (see `RESULTS` and
+              `SENSITIVITIES`), and those of `decompose` (see
+              `COUNTERFACTUALS`) with the decomposition
+    """
+    ys, xs = inputs['tiles'][k]
+    tvar, rvar = inputs['tvar'], inputs['rvar']
+    rows, cols = inputs['varidy'][ys], inputs['varidx'][xs]
+    dtype = options['dtype']
+    with NCLOCK:
+        t = tvar[tdx, inputs['lslice'], rows, cols]
+        r = rvar[tdx, inputs['lslice'], rows, cols]
+    t = metutils.convert(t, tvar.units, 'C', dtype)
+    r = metutils.rHToMixRat(r, t, inputs['plev'], 'C', dtype)
+    r = np.where(r < 0, 0, r)
+    sst = inputs['sst'][tdx, ys, xs]
+    slp = inputs['slp'][tdx, ys, xs]
+    engine = options['engine']
+    pminit = None if prev is None else prev.pop((tdx - 1, k), None)
+    results = calculate(sst, slp, None, t, r, inputs['levels'], engine,
+                        pminit, options['stride'], options['isolv'],
+                        options['params'], inputs['tindex'][k],
+                        options['screen'], options['validate'],
+                        options['tolerance'], inputs['dtlayer'],
+                        options['reference'], options['check'])
+    results = dict(zip(RESULTS + tuple(SENSITIVITIES), results))
+    # Only the columns that converged give a first guess
+    guess = np.where(results['ifl'] == 1, results['pmc'], np.nan)
+    if prev is not None:
+        prev[tdx, k] = guess
+    if inputs['clim'] is not None:
+        ctile = {name: inputs['clim'][name][..., ys, xs]
+                 for name in climatology.VARIABLES}
+        results.update(zip(COUNTERFACTUALS,
+                           decompose(ctile, inputs['days'][tdx], sst, slp,
+                                     t, r, inputs['levels'], engine, guess,
+                                     options['isolv'], options['params'],
+                                     inputs['tindex'][k],
+                                     options['screen'])))
+    return results
+
+
+def poolInit(setup, options):
+    """
+    Set up a process of the pool: start its log file, and load and set
+    up the PI engine as the first process has.
+
+    :param dict setup: The `engine` name, number of threads `nthreads`,
+                       emulator `model` and number of columns to `check`,
+                       whether to use the moist adiabat `table` (and its
+                       `cachefile`), the `warmstart` method, and the
+                       `logfile` and `loglevel` of the first process
+    :param dict options: Options of the calculation (see `processTile`),
+                         without the engines
+    """
+    logging.basicConfig(level=setup['loglevel'],
+                        format="%(asctime)s: %(funcName)s: %(message)s",
+                        filename=f"{setup['logfile']}-{os.getpid()}",
+                        filemode='w', datefmt="%Y-%m-%d %H:%M:%S")
+    engine = loadEngine(setup['engine'])
+    engine.setnthreads(setup['nthreads'])
+    reference = None
+    if hasattr(engine, 'setmodel'):
+        engine.setmodel(setup['model'])
+        if setup['check'] > 0:
+            reference = loadEngine('fortran')
+            reference.setnthreads(setup['nthreads'])
+    if setup['table']:
+        moistadiabat.useTable(engine, cachefile=setup['cachefile'])
+    POOL['warmstart'] = setup['warmstart']
+    POOL['options'] = dict(options, engine=engine, reference=reference)
+
+
+def poolMonth(spec):
+    """
+    Set up the inputs of a month in a process of the pool: attach to the
+    arrays shared by the first process, open the temperature and humidity
+    files and load the climatology. The inputs of the previous month are
+    released.
+
+    :param dict spec: Description of the inputs of the month (see `main`)
+    """
+    POOL.pop('inputs', None)
+    for shm in POOL.pop('blocks', []):
+        shm.close()
+    attached = [attachArray(desc) for desc in spec['arrays']]
+    sst, sstmask, slp, slpmask, ocean = [array for _, array in attached]
+    dtype = POOL['options']['dtype']
+    tvar = nctools.ncGetVar(nctools.ncLoadFile(spec['tfile']), 't')
+    tvar.set_auto_maskandscale(True)
+    rvar = nctools.ncGetVar(nctools.ncLoadFile(spec['rfile']), 'r')
+    rvar.set_auto_maskandscale(True)
+    clim = None
+    if spec['climargs'] is not None:
+        clim = climatology.loadClimatology(*spec['climargs'], build=False)
+    POOL['month'] = spec['month']
+    POOL['blocks'] = [shm for shm, _ in attached]
+    # Final iterate of each tile and time of the month calculated by this
+    # process, until it is the first guess of the next time
+    POOL['prev'] = {} if POOL['warmstart'] == 'previous' else None
+    POOL['inputs'] = {
+        'tvar': tvar, 'rvar': rvar, 'lslice': spec['lslice'],
+        'varidy': spec['varidy'], 'varidx': spec['varidx'],
+        'levels': spec['levels'],
+        'plev': spec['levels'][:, np.newaxis, np.newaxis].astype(dtype),
+        'sst': np.ma.MaskedArray(sst, mask=sstmask),
+        'slp': np.ma.MaskedArray(slp, mask=slpmask),
+        'tiles': spec['tiles'],
+        'tindex': [np.flatnonzero(ocean[ys, xs]) for ys, xs in spec['tiles']],
+        'dtlayer': spec['dtlayer'], 'clim': clim, 'days': spec['days']}
+
+
+def poolProcess(spec, tdx, k):
+    """
+    Calculate the PI of one tile of one time in a process of the pool.
+
+    :param dict spec: Description of the inputs of the month (see `main`)
+    :param int tdx: Index of the time
+    :param int k: Index of the tile
+
+    :returns: dict of the results of `processTile`, without the final
+              iterate `pmc`
+    """
+    if POOL.get('month') != spec['month']:
+        poolMonth(spec)
+    LOGGER.debug(f"Processing time {tdx}, tile {k} of {spec['month']}")
+    results = processTile(POOL['inputs'], tdx, k, POOL['options'],
+                          POOL['prev'])
+    del results['pmc']
+    return results
+
+
+def runPool(pool, spec, units, outputs, finished):
+    """
+    Calculate the units of work of a month with a pool of processes. The
+    units are handed out as processes become free, and the results
+    copied into the arrays of the month.
+
+    :param pool: `concurrent.futures.ProcessPoolExecutor` set up with
+                 `poolInit`
+    :param dict spec: Description of the inputs of the month (see `main`)
+    :param list units: (time, tile) of each unit of work
+    :param dict outputs: `numpy.ndarray` of the month of each output
+                         variable
+    :param finished: Function called with the index of the time when a
+                     unit is finished
+    """
+    futures = {pool.submit(poolProcess, spec, tdx, k): (tdx, k)
+               for tdx, k in units}
+    for future in as_completed(futures):
+        tdx, k = futures[future]
+        ys, xs = spec['tiles'][k]
+        for name, values in future.result().items():
+            outputs[name][tdx][..., ys, xs] = values
+        LOGGER.debug(f"Finished time {tdx}, tile {k}")
+        finished(tdx)
+
+
+def runMaster(comm, units, tiles, outputs, finished, paroutput=False):
+    """
+    Hand out the units of work of a month to the MPI workers (see
+    `runWorker`) as they become free, and receive the results directly
+    into the arrays of the month: a tile of the domain is described by a
+    subarray datatype, while a whole time is contiguous.
+
+    :param comm: MPI communicator
+    :param list units: (time, tile) of each unit of work
+    :param list tiles: (`slice`, `slice`) of each tile
+    :param dict outputs: `numpy.ndarray` of the month of each output
+                         variable
+    :param finished: Function called with the index of the time when a
+                     unit is received
+    :param bool paroutput: The workers write the results to the output
+                           file, and only report each unit as finished
+    """
+    status = MPI.Status()
+    nunits = len(units)
+    if paroutput:
+        datatypes = [[]]
+    elif len(tiles) > 1:
+        datatypes = [[tileType(out[0], tile) for out in outputs.values()]
+                     for tile in tiles]
+    else:
+        datatypes = [[None] * len(outputs)]
+    w = 0
+    p = comm.size - 1
+    for d in range(1, comm.size):
+        if w < nunits:
+            LOGGER.debug(f"Sending unit {w} to node {d}")
+            comm.send(w, dest=d, tag=WORK_TAG)
+            w += 1
+        else:
+            comm.send(None, dest=d, tag=WORK_TAG)
+            p = w
+
+    terminated = 0
+    while terminated < p:
+        # A worker sends the number of the unit, then the arrays
+        W = comm.recv(source=MPI.ANY_SOURCE, status=status, tag=RESULT_TAG)
+        d = status.source
+        tdx, k = units[W]
+        if not paroutput:
+            recvArrays(comm, [out[tdx] for out in outputs.values()],
+                       datatypes[k], d, RESULT_TAG)
+            ys, xs = tiles[k]
+            LOGGER.debug("Mean PI: "
+                         f"{np.nanmean(outputs['vmax'][tdx][..., ys, xs]):.2f}"
+                         " m/s")
+            finished(tdx)
+
+        if w < nunits:
+            LOGGER.debug(f"Sending unit {w} (time {units[w][0]}, "
+                         f"tile {units[w][1]}) to node {d}")
+            comm.send(w, dest=d, tag=WORK_TAG)
+            w += 1
+        else:
+            # Exhausted all units, send empty packet:
+            comm.send(None, dest=d, tag=WORK_TAG)
+            terminated += 1
+    for types in datatypes:
+        for datatype in types:
+            if datatype is not None:
+                datatype.Free()
+
+
+def runWorker(comm, units, inputs, options, outputs, prev=None, ncobj=None):
+    """
+    Calculate the units of work handed out by the first MPI process (see
+    `runMaster`) until it sends an empty packet, and send back the
+    results, or write them to the output file.
+
+    :param comm: MPI communicator
+    :param list units: (time, tile) of each unit of work
+    :param dict inputs: Inputs of the month (see `processTile`)
+    :param dict options: Options of the calculation (see `processTile`)
+    :param dict outputs: `numpy.ndarray` of the month of each output
+                         variable, giving the names and types of the
+                         results sent
+    :param dict prev: Optional final iterates for the first guess (see
+                      `processTile`)
+    :param ncobj: Optional output file opened for parallel access. The
+                  results are written to it rather than sent
+
+    :returns: statistics of the results written to `ncobj` (see
+              `resultStats`), or None
+    """
+    stats = None
+    while True:
+        W = comm.recv(source=0, tag=WORK_TAG)
+        if W is None:
+            # Received an empty packet, so no work required
+            LOGGER.debug(f"No work to be done on this processor: "
+                         f"{comm.rank}")
+            break
+        tdx, k = units[W]
+        LOGGER.debug(f"Processing time {tdx}, tile {k} on node {comm.rank}")
+        results = processTile(inputs, tdx, k, options, prev)
+        LOGGER.debug(f"Finished time {tdx}, tile {k} on node {comm.rank}")
+        if ncobj is not None:
+            # Write the results to the file, and tell the first
+            # process the unit is finished
+            ys, xs = inputs['tiles'][k]
+            missing = np.isnan(results['vmax'])
+            for name in outputs:
+                values = results[name]
+                if name in FILLS:
+                    values = np.where(missing, FILLS[name], values)
+                with NCLOCK:
+                    ncobj[name][tdx, ..., ys, xs] = values
+            stats = combineStats(stats, resultStats(results))
+            comm.send(W, dest=0, tag=RESULT_TAG)
+            continue
+        # The arrays are converted to the types of the arrays of the
+        # month, so the first process receives them in place
+        comm.send(W, dest=0, tag=RESULT_TAG)
+        sendArrays(comm, [np.asarray(results[name], dtype=out.dtype)
+                          for name, out in outputs.items()],
+                   0, RESULT_TAG)
+    return stats
+
+
+def runSerial(units, inputs, options, outputs, finished, prev=None):
+    """
+    Calculate the units of work of a month in this process.
+
+    :param list units: (time, tile) of each unit of work
+    :param dict inputs: Inputs of the month (see `processTile`)
+    :param dict options: Options of the calculation (see `processTile`)
+    :param dict outputs: `numpy.ndarray` of the month of each output
+                         variable
+    :param finished: Function called with the index of the time when a
+                     unit is finished
+    :param dict prev: Optional final iterates for the first guess (see
+                      `processTile`)
+    """
+    for tdx, k in units:
+        LOGGER.debug(f"Processing time {tdx}, tile {k}")
+        ys, xs = inputs['tiles'][k]
+        results = processTile(inputs, tdx, k, options, prev)
+        for name, out in outputs.items():
+            out[tdx][..., ys, xs] = results[name]
+        finished(tdx)
+
+
+def resultStats(results):
+    """
+    Statistics of the results of a month, or of some of its units of
+    work, that are logged at the end of each month. Statistics of
+    different units are combined with `combineStats`.
+
+    :param dict results: Arrays of the results, keyed by the name of the
+                         output variable (`pmin`, `vmax`, `ifl`, `niter`,
+                         `ncmax`, ... and the counterfactual PI)
+
+    :returns: dict of the number of points calculated with the kernel
+              (ocean points that were not screened), the total and
+              largest number of iterations, the number of points where
+              the iteration did not converge (including those that
+              reached the iteration limit), where the CAPE calculation
+              failed, that were screened, and that are ocean points, the largest number of CAPE
+              iterations, and the sum and number of valid values of VMAX
+              and of any counterfactual VMAX (`vmax`)
+    """
+    niter, ifl, ncmax = results['niter'], results['ifl'], results['ncmax']
+    return {
+        'calculated': int(np.sum((ifl != IFL_MISSING) &
+                                 (ifl != IFL_SCREENED))),
+        'niter': int(niter.sum()),
+        'maxiter': int(niter.max(initial=0)),
+        'nonconv': int(np.sum(ifl == 0)),
+        'capefail': int(np.sum(ifl == 2)),
+        'maxcape': int(ncmax.max(initial=0)),
+        'screened': int(np.sum(ifl == IFL_SCREENED)),
+        'ocean': int(np.sum(ifl != IFL_MISSING)),
+        'vmax': {name: (float(np.nansum(results[name])),
+                        int(np.sum(np.isfinite(results[name]))))
+                 for name in ('vmax', 'vmax_sst', 'vmax_atm')
+                 if name in results},
+    }
+
+
+def combineStats(a, b):
+    """
+    Combine the statistics of two sets of results (see `resultStats`).
+
+    :param dict a: Statistics of the first set, or None if it is empty
+    :param dict b: Statistics of the second set, or None if it is empty
+
+    :returns: dict of the statistics of both sets
+    """
+    if a is None or b is None:
+        return b if a is None else a
+    stats = {name: max(a[name], b[name]) if name.startswith('max')
+             else a[name] + b[name] for name in a if name != 'vmax'}
+    stats['vmax'] = {name: (total + b['vmax'][name][0],
+                            count + b['vmax'][name][1])
+                     for name, (total, count) in a['vmax'].items()}
+    return stats
+
+
+def readParameters(config):
+    """
+    Read the adjustable parameters of the PI calculation from the
+    configuration.
+
+    Dissipative heating is included unless the `Dissipative` option
+    (normally in the [DEFAULT] section) is False. If there is a [Sweep]
+    section, each of its options (`CKCD`, `SIG`, `Dissipative`, `B` and
+    `VREDUC`) is a comma-separated list of values, and every combination
+    of the values is calculated. Options that are not given take their
+    default value (see :data:`engines.DEFAULTS`).
+
+    :param config: :class:`ConfigParser` instance
+
+    :returns: `numpy.ndarray` (5, npar) of parameter sets (see
+              :func:`engines.parameterSets`), or None if there is no
+              [Sweep] section and the parameters are the defaults
+    """
+    if not config.has_section('Sweep'):
+        dissipative = config.getboolean('DEFAULT', 'Dissipative', fallback=True)
+        if int(dissipative) == DEFAULTS['IDISS']:
+            return None
+        return parameterSets(IDISS=[int(dissipative)])
+
+    values = {}
+    for name in PARAMETERS:
+        option = 'Dissipative' if name == 'IDISS' else name
+        if not config.has_option('Sweep', option):
+            continue
+        items = [v.strip() for v in config.get('Sweep', option).split(',')]
+        if name == 'IDISS':
+            unknown = [v for v in items if v.lower() not in config.BOOLEAN_STATES]
+            if unknown:
+                raise ValueError(f"Not a boolean: {', '.join(unknown)}")
+            values[name] = [int(config.BOOLEAN_STATES[v.lower()])
+                            for v in items]
+        else:
+            values[name] = [float(v) for v in items]
+    return parameterSets(**values)
+
+
+def decompose(clim, day, sst, slp, tt, rr, levels, engine, pminit=None,
+              isolv=0, params=None, index=None, screen=None):
+    """
+    Calculate the counterfactual PI used to attribute changes in PI to
+    the SST or the atmosphere: PI with the observed SST and the
+    climatological atmosphere (temperature, mixing ratio and sea level
+    pressure), and PI with the climatological SST and the observed
+    atmosphere.
+
+    The inputs already loaded for the actual PI are reused, and only
+    the climatology of the day is read from the (memory-mapped) cache.
+
+    :param dict clim: Climatology (see :func:`climatology.loadClimatology`)
+    :param int day: Day of the year (see :func:`climatology.dayOfYear`)
+    :param pminit: Optional first guess of the minimum pressure
+                   iteration, e.g. the final iterate `pmc` of the actual
+                   PI, with NaN where the actual PI did not converge
+
+    Other arguments are as described in `calculate`.
+
+    :returns: `pmin` and `vmax` with observed SST, and `pmin` and `vmax`
+              with observed atmosphere (see `COUNTERFACTUALS`)
+    """
+    ocean = calculate(sst, clim['slp'][day], None, clim['t'][day],
+                      clim['r'][day], levels, engine, pminit, 0, isolv,
+                      params, index, screen)
+    atmos = calculate(clim['sst'][day], slp, None, tt, rr, levels, engine,
+                      pminit, 0, isolv, params, index, screen)
+    return ocean[0], ocean[1], atmos[0], atmos[1]
+
+
+def tileSlices(ny, nx, size=None):
+    """
+    Divide the domain into tiles, each of which is calculated as a
+    separate unit of work.
+
+    :param int ny: Number of latitudes in the domain
+    :param int nx: Number of longitudes in the domain
+    :param tuple size: Number of (latitude, longitude) points in each
+                       tile. Tiles at the edges of the domain may be
+                       smaller. Default is a single tile of the whole
+                       domain
+
+    :returns: list of (`slice`, `slice`) of the latitudes and longitudes
+              of each tile
+    :raises ValueError: if a tile size is less than 1
+    """
+    if size is None:
+        return [(slice(0, ny), slice(0, nx))]
+    tny, tnx = size
+    if tny < 1 or tnx < 1:
+        raise ValueError(f"Invalid tile size: {tny} x {tnx}")
+    return [(slice(j, min(j + tny, ny)), slice(i, min(i + tnx, nx)))
+            for j in range(0, ny, tny) for i in range(0, nx, tnx)]
+
+
+def levelSlice(levels, top=None, bottom=None):
+    """
+    Slice of the pressure levels between `top` and `bottom`, used to read
+    only those levels from the input files.
+
+    The kernels do not lift parcels above 59 hPa, but use the first level
+    above that to find the level of neutral buoyancy. A window that keeps
+    these levels (e.g. `top` = 50 hPa for the ERA5 levels) gives the same
+    results as the full sounding; a warning is logged if it does not.
+
+    :param levels: `numpy.ndarray` of pressure levels (hPa), in increasing
+                   or decreasing order
+    :param float top: Lowest pressure (hPa) to read, or None for no limit
+    :param float bottom: Highest pressure (hPa) to read, or None for no
+                         limit
+
+    :returns: `slice` of the levels within the window
+    :raises ValueError: if there are no levels within the window
+    """
+    top = -np.inf if top is None else top
+    bottom = np.inf if bottom is None else bottom
+    idx = np.flatnonzero((levels >= top) & (levels <= bottom))
+    if len(idx) == 0:
+        raise ValueError(f"No pressure levels between {top} and {bottom} hPa")
+    above = levels[levels < 59.0]
+    if len(above) and above.max() < top:
+        LOGGER.warning(f"Top of the level window ({top} hPa) excludes the "
+                       f"{above.max()} hPa level used by the PI kernels")
+    return slice(idx[0], idx[-1] + 1)
+
+
+def calculate(sst, slp, pp, tt, rr, levels, engine, pminit=None, stride=0,
+              isolv=0, params=None, index=None, screen=None, validate=0,
+              tolerance=1.0, sensitivity=None, reference=None, check=0):
+    """
+    Calculate potential intensity for all grid points of a single time.
+
+    All columns are passed to the batched `pcminv` kernel in one call,
+    rather than calling `pcmin` once per grid point. If `index` is given,
+    only those columns (the ocean columns, see :func:`columns.columnIndex`)
+    are packed and passed to the kernel, and the other points are set to
+    the fill value: NaN, or `IFL_MISSING` for the flag and zero for the
+    iteration counts.
+
+    The minimum pressure iteration can be started from a first guess,
+    rather than the default of 950 hPa. Either `pminit` is given (e.g.
+    the final iterate `pmc` from the previous time), or, if `stride` > 1,
+    every `stride`-th point in each direction is calculated first and
+    the final iterate at the nearest of those points is used as the first
+    guess for the remaining points.
+
+    Note the first guess is the final value of the iteration, `pmc`, not
+    `pmin`: the reported `pmin` includes an additional correction for
+    dissipative heating, so is not the point the iteration converges to.
+    Only points where the iteration converged give a first guess, and
+    any column that does not converge from its first guess is
+    calculated again from the default one with the fixed-point
+    iteration, so a first guess never loses a result.
+
+    If `pp` is None, every column is on the pressure levels `levels`,
+    and the single vector of levels is passed to the `pcminp` kernel
+    instead of a pressure value for every level of every column.
+
+    If `params` is given, each column is calculated for every parameter
+    set with the `pcsweep` kernel, and the results gain a leading
+    parameter set dimension. The first guess for all sets is taken from
+    the first set.
+
+    If `screen` is given, columns with an SST below `screen` are assumed
+    to have no PI and are not passed to the kernel: `vmax` is zero,
+    `pmin` is the sea level pressure and `ifl` is `IFL_SCREENED`. The
+    assumption is checked by calculating `validate` of the screened
+    columns, picked at random, with the kernel, and logging a warning if
+    any has a `vmax` greater than `tolerance`.
 
+    If `sensitivity` is given, the `pctlp` kernel also returns the
+    derivatives of `pmin` and `vmax` with respect to the SST, and along
+    the perturbation of the temperature `sensitivity` (see
+    `SENSITIVITIES`), from the tangent linear of the kernel. This takes
+    a single kernel call, rather than a further calculation for each
+    perturbed input. The derivatives are NaN where `ifl` is not 1.
 
+    If `reference` is given (e.g. the Fortran engine, when `engine` is the
+    emulator in :mod:`pcmin_emulator`), `check` of the columns, picked at
+    random, are also calculated with `reference`, and the RMS and mean
+    differences in `vmax` and `pmin` are logged.
 
-def calculate(sst, slp, pp, tt, rr, levels):
+    :param sst: `numpy.ndarray` (ny, nx) of sea surface temperature (C)
+    :param slp: `numpy.ndarray` (ny, nx) of sea level pressure (hPa)
+    :param pp: `numpy.ndarray` (nz, ny, nx) of pressure (hPa), or None if
+               all columns share the pressure levels `levels`
+    :param tt: `numpy.ndarray` (nz, ny, nx) of temperature (C)
+    :param rr: `numpy.ndarray` (nz, ny, nx) of mixing ratio (g/kg)
+    :param levels: `numpy.ndarray` of pressure levels (hPa)
+    :param engine: PI engine module (see :mod:`engines`)
+    :param pminit: Optional `numpy.ndarray` (ny, nx) of first guess for
+                   the minimum pressure iteration (hPa)
+    :param int stride: Spacing of the coarse points used to give a first
+                       guess when `pminit` is not given (0 to disable)
+    :param int isolv: Method used to solve for the minimum pressure (see
+                      :data:`engines.SOLVERS`)
+    :param params: Optional `numpy.ndarray` (5, npar) of parameter sets
+                   (see :func:`engines.parameterSets`)
+    :param index: Optional `numpy.ndarray` (ncol,) of the flattened
+                  positions of the columns to calculate
+    :param float screen: Optional SST (C) below which columns are not
+                         calculated
+    :param int validate: Number of screened columns to check with the
+                         kernel
+    :param float tolerance: Largest `vmax` (m/s) of a screened column
+                            before the screen is reported as failing
+    :param sensitivity: Optional `numpy.ndarray` (nz,) of the perturbation
+                        of the temperature (K) at each of `levels`, e.g. 1
+                        in a layer and 0 elsewhere
+    :param reference: Optional PI engine module to check the results of
+                      `engine` against
+    :param int check: Number of columns to check with `reference`
+
+    :returns: `pmin`, `vmax`, `ifl`, `niter` (number of iterations of
+              the minimum pressure calculation), `pmc` (final value of the
+              minimum pressure iteration), `to` (outflow temperature),
+              `otl` (outflow level) and `ncmax` (largest number of
+              iterations of the CAPE calculation at any level) arrays,
+              each of shape (ny, nx), or (npar, ny, nx) if `params` is
+              given. `to` and `otl` are NaN where the SST is missing.
+              If `sensitivity` is given, these are followed by the
+              derivatives in `SENSITIVITIES`.
+    :raises ValueError: if `params` is given with a pressure array `pp`,
+                        or `sensitivity` with `params`, a pressure array
+                        or an engine that has no `pctlp` kernel
+    """
     ny, nx = sst.shape
-    pmin = np.zeros(sst.shape)
-    vmax = np.zeros(sst.shape)
-    for jj in range(ny):
-        for ii in range(nx):
-            pmin[jj, ii], vmax[jj, ii], ifl = pcmin(sst[jj, ii],
-                                                    slp[jj, ii],
-                                                    pp[::-1, jj, ii],
-                                                    tt[::-1, jj, ii],
-                                                    rr[::-1, jj, ii],
-                                                    len(levels),
-                                                    len(levels))
-    return pmin, vmax
+    nz = len(levels)
+    if index is None:
+        index = np.arange(ny * nx)
+    screened = index[:0]
+    if screen is not None:
+        cold = np.ma.filled(sst, np.nan).ravel()[index] < screen
+        index, screened = index[~cold], index[cold]
+    ncol = len(index)
+    sstc = np.ma.filled(sst, np.nan).ravel()[index].astype(np.float32,
+                                                          copy=False)
+    slpc = np.ma.filled(slp, np.nan).ravel()[index].astype(np.float32,
+                                                          copy=False)
+    tc, rc = packColumns(tt, index), packColumns(rr, index)
+    if pp is None:
+        # Reversed to match the order of the packed columns
+        pc = np.asarray(levels[::-1], dtype=np.float32)
+    else:
+        pc = packColumns(pp, index)
+
+    shape = (ncol,)
+    if params is not None:
+        if pp is not None:
+            raise ValueError("Parameter sweeps require all columns to be "
+                             "on the same pressure levels (pp=None)")
+        shape = (ncol, params.shape[1])
+        if pminit is not None:
+            pminit = pminit[0]
+
+    if sensitivity is not None:
+        if params is not None or pp is not None:
+            raise ValueError("Sensitivities require a single parameter set "
+                             "and all columns on the same pressure levels")
+        if not hasattr(engine, 'pctlp'):
+            raise ValueError(f"The {engine.__name__} engine does not "
+                             "calculate sensitivities")
+        # Reversed to match the order of the packed columns
+        dt = np.asarray(sensitivity[::-1], dtype=np.float32)
+
+    def run(sst, psl, p, t, r, n, **kwargs):
+        # The Fortran kernels need at least one column
+        if len(sst) == 0:
+            return emptyResult((0,) + shape[1:], sensitivity is not None)
+        if sensitivity is not None:
+            return engine.pctlp(sst, psl, p, t, r, dt, n, **kwargs)
+        if params is not None:
+            return engine.pcsweep(sst, psl, p, t, r, params, n, **kwargs)
+        if pp is None:
+            return engine.pcminp(sst, psl, p, t, r, n, **kwargs)
+        return engine.pcminv(sst, psl, p, t, r, n, **kwargs)
+
+    def subset(idx, **kwargs):
+        return run(sstc[idx], slpc[idx],
+                   pc if pp is None else np.asfortranarray(pc[idx]),
+                   np.asfortranarray(tc[idx]), np.asfortranarray(rc[idx]),
+                   nz, **kwargs)
+
+    # First guess of each column, NaN where there is none
+    warm = None
+    if pminit is not None:
+        warm = np.ma.filled(pminit, np.nan).ravel()[index].astype(np.float32)
+        result = list(run(sstc, slpc, pc, tc, rc, nz, pminit=warm,
+                          isolv=isolv))
+    elif stride > 1:
+        result = None
+        warm = np.full(ncol, np.nan, dtype=np.float32)
+        coarse = np.zeros((ny, nx), dtype=bool)
+        coarse[::stride, ::stride] = True
+        coarse = coarse.ravel()[index]
+        # Position of each grid point in the packed columns
+        position = np.full(ny * nx, -1)
+        position[index] = np.arange(ncol)
+        for idx, guess in ((np.flatnonzero(coarse), None),
+                           (np.flatnonzero(~coarse), 'nearest')):
+            if guess is not None:
+                # Nearest coarse point to each grid point
+                jj = np.minimum(np.rint(np.arange(ny) / stride).astype(int),
+                                (ny - 1) // stride) * stride
+                ii = np.minimum(np.rint(np.arange(nx) / stride).astype(int),
+                                (nx - 1) // stride) * stride
+                nearest = position[(jj[:, None] * nx + ii[None, :]).ravel()]
+                nearest = nearest[index[idx]]
+                # No first guess (950 hPa) where the nearest coarse
+                # point is not calculated or did not converge
+                pmc = result[4][:, 0] if result[4].ndim > 1 else result[4]
+                ok = result[2][:, 0] if result[2].ndim > 1 else result[2]
+                pmc = np.where(ok == 1, pmc, np.nan)
+                guess = np.full(len(idx), np.nan, dtype=np.float32)
+                guess[nearest >= 0] = pmc[nearest[nearest >= 0]]
+                warm[idx] = guess
+            part = subset(idx, pminit=guess, isolv=isolv)
+            if result is None:
+                result = [np.empty(shape, dtype=a.dtype) for a in part]
+            for out, a in zip(result, part):
+                out[idx] = a
+    else:
+        result = run(sstc, slpc, pc, tc, rc, nz, isolv=isolv)
+
+    if warm is not None:
+        # The iteration can fail from a first guess where it converges
+        # from the default one: calculate these columns again as if
+        # there were no first guess, with the fixed-point iteration
+        fail = result[2] == 0
+        if fail.ndim > 1:
+            fail = fail.any(axis=1)
+        idx = np.flatnonzero(fail & (warm >= 400))
+        if len(idx):
+            LOGGER.debug(f"Recalculating {len(idx)} columns that did not "
+                         "converge from the first guess")
+            part = subset(idx, isolv=0)
+            for out, a in zip(result, part):
+                out[idx] = a
+
+    # The outflow temperature and level are not meaningful without an SST
+    pmin, vmax, ifl, niter, pmc, to, otl, ncmax = result[:8]
+    missing = np.isnan(sstc)
+    to[missing] = np.nan
+    otl[missing] = np.nan
+    # The derivatives are not defined where the iteration did not converge
+    derivatives = tuple(result[8:])
+    for a in derivatives:
+        a[ifl != 1] = np.nan
+    result = (pmin, vmax, ifl, niter, pmc, to, otl, ncmax) + derivatives
+    fills = ((np.nan, np.nan, IFL_MISSING, 0, np.nan, np.nan, np.nan, 0) +
+             (np.nan,) * len(derivatives))
+    result = [scatter(a, index, (ny, nx), fill)
+              for a, fill in zip(result, fills)]
+
+    if reference is not None and check > 0 and ncol > 0:
+        rng = np.random.default_rng()
+        sample = np.sort(rng.choice(index, min(check, ncol), replace=False))
+        full = calculate(sst, slp, pp, tt, rr, levels, reference,
+                         isolv=isolv, params=params, index=sample)
+        if params is not None:
+            full = [np.moveaxis(a, 0, -1) for a in full]
+        ok = ((full[2].reshape(ny * nx, -1)[sample] == 1) &
+              (result[2].reshape(ny * nx, -1)[sample] == 1))
+        diff = [(a.reshape(ny * nx, -1)[sample] -
+                 b.reshape(ny * nx, -1)[sample])[ok]
+                for a, b in zip(result[:2], full[:2])]
+        if ok.any():
+            rms = [np.sqrt(np.mean(d ** 2)) for d in diff]
+            LOGGER.info(f"Checked {ok.sum()} columns with "
+                        f"{reference.__name__}: RMS difference "
+                        f"{rms[1]:.2f} m/s (mean {diff[1].mean():.2f}) "
+                        f"in VMAX and {rms[0]:.2f} hPa (mean "
+                        f"{diff[0].mean():.2f}) in PMIN")
+            if hasattr(engine, 'modelError'):
+                expected = engine.modelError()[0]
+                if rms[1] > 2 * expected[0] or rms[0] > 2 * expected[1]:
+                    LOGGER.warning("The emulator error is more than twice "
+                                   "that estimated when it was fitted: "
+                                   "the inputs may be outside the range "
+                                   "of the training data")
+
+    if len(screened):
+        # No PI in the screened columns: the minimum pressure is the
+        # sea level pressure
+        pmin, vmax, ifl = (a.reshape(ny * nx, -1) for a in result[:3])
+        pmin[screened] = np.ma.filled(slp, np.nan).ravel()[screened, None]
+        vmax[screened] = 0
+        ifl[screened] = IFL_SCREENED
+        if validate > 0:
+            rng = np.random.default_rng()
+            sample = np.sort(rng.choice(screened, min(validate, len(screened)),
+                                        replace=False))
+            check = calculate(sst, slp, pp, tt, rr, levels, engine,
+                              isolv=isolv, params=params, index=sample)[1]
+            if params is not None:
+                check = np.moveaxis(check, 0, -1)
+            check = check.reshape(ny * nx, -1)[sample]
+            nfail = np.sum(np.nanmax(check, axis=1) > tolerance)
+            LOGGER.info(f"Screened {len(screened)} columns with SST below "
+                        f"{screen} C. Largest VMAX of {len(sample)} checked "
+                        f"with the kernel: {np.nanmax(check):.2f} m/s")
+            if nfail:
+                LOGGER.warning(f"{nfail} of {len(sample)} screened columns "
+                               f"have VMAX above {tolerance} m/s: the "
+                               "SST screen is too high")
+
+    if params is not None:
+        # (ny, nx, npar) to (npar, ny, nx)
+        return tuple(np.moveaxis(a, -1, 0) for a in result)
+    return tuple(result)
 
 @disableOnWorkers
-def saveData(outputFile, pmin, vmax, lon, lat, times):
+def saveData(outputFile, pmin, vmax, lon, lat, times, params=None,
+             ifl=None, niter=None, ncmax=None, to=None, otl=None,
+             counterfactual=None, sensitivity=None, layer=None,
+             writedata=True, zlib=True):
+    """
+    Save the PI data to a netCDF file.
+
+    :param str outputFile: Path to the output file
+    :param pmin: `numpy.ndarray` (time, lat, lon) of minimum central
+                 pressure, or (time, parameter_set, lat, lon) if `params`
+                 is given. `pmin` and `vmax` are written with the type of
+                 the arrays (float32 or float64).
+    :param vmax: `numpy.ndarray` of maximum wind speed, the same shape
+                 as `pmin`
+    :param lon: `numpy.ndarray` of longitudes
+    :param lat: `numpy.ndarray` of latitudes
+    :param times: sequence of `datetime` objects
+    :param params: Optional `numpy.ndarray` (5, npar) of parameter sets
+                   (see :func:`readParameters`)
+    :param ifl: Optional `numpy.ndarray` of the PCMIN flag, the same shape
+                as `pmin`. Stored as an unsigned byte.
+    :param niter: Optional `numpy.ndarray` of the number of iterations of
+                  the minimum pressure calculation. Stored as a short.
+    :param ncmax: Optional `numpy.ndarray` of the largest number of
+                  iterations of the CAPE calculation at any level. Stored
+                  as a short.
+    :param to: Optional `numpy.ndarray` of outflow temperature (K)
+    :param otl: Optional `numpy.ndarray` of outflow level (hPa)
+    :param counterfactual: Optional dict of `numpy.ndarray` of the
+                           counterfactual PI (see `COUNTERFACTUALS`)
+    :param sensitivity: Optional dict of `numpy.ndarray` of the
+                        derivatives of PI (see `SENSITIVITIES`)
+    :param tuple layer: Bottom and top pressure (hPa) of the layer the
+                        derivatives with respect to temperature are for
+    :param bool writedata: If False, only create the file and its
+                           variables, for the data to be written later
+                           (e.g. in parallel). The arrays are then only
+                           used for their shape and type
+    :param bool zlib: Compress the variables
+
+    Flags and iteration counts of points without a valid SST (where
+    `vmax` is NaN) are set to the fill value.
+    """
     LOGGER.info(f"Saving PI data to {outputFile}")
     dimensions = {
             0: {
@@ -345,7 +1963,7 @@ def saveData(outputFile, pmin, vmax, lon, lat, times):
                 'name': 'pmin',
                 'dims': ('time', 'latitude', 'longitude'),
                 'values': pmin,
-                'dtype': 'float64',
+                'dtype': pmin.dtype,
                 'atts': {
                     'long_name': 'minimum central pressure',
                     'standard_name': 'air_pressure_at_mean_sea_level',
@@ -357,7 +1975,7 @@ def saveData(outputFile, pmin, vmax, lon, lat, times):
                 'name': 'vmax',
                 'dims': ('time', 'latitude', 'longitude'),
                 'values': vmax,
-                'dtype': 'float64',
+                'dtype': vmax.dtype,
                 'atts': {
                     'long_name': 'maximum sustained windspeed',
                     'standard_name': 'wind_speed',
@@ -367,6 +1985,113 @@ def saveData(outputFile, pmin, vmax, lon, lat, times):
             }
         }
 
+    diagnostics = (
+        ('ifl', ifl, 'u1', FILLS['ifl'], {
+            'long_name': 'PCMIN flag',
+            'flag_values': np.array([0, 1, 2, IFL_SCREENED], dtype=np.uint8),
+            'flag_meanings': 'no_convergence ok cape_failed screened',
+        }),
+        ('niter', niter, 'i2', FILLS['niter'], {
+            'long_name': 'number of iterations of the minimum pressure '
+                         'calculation',
+        }),
+        ('ncmax', ncmax, 'i2', FILLS['ncmax'], {
+            'long_name': 'maximum number of iterations of the CAPE '
+                         'calculation at any level',
+        }),
+        ('to', to, 'float32', None, {
+            'long_name': 'outflow temperature',
+            'standard_name': 'air_temperature',
+            'units': 'K',
+        }),
+        ('otl', otl, 'float32', None, {
+            'long_name': 'outflow temperature level',
+            'standard_name': 'air_pressure',
+            'units': 'hPa',
+        }),
+    )
+    for name, values, dtype, fill, atts in diagnostics:
+        if values is None:
+            continue
+        var = {
+            'name': name,
+            'dims': ('time', 'latitude', 'longitude'),
+            'values': values,
+            'dtype': dtype,
+            'atts': atts,
+        }
+        if fill is not None:
+            # Integer variables cannot hold NaN or the default fill value
+            if writedata:
+                var['values'] = np.where(np.isnan(vmax), fill, values)
+            var['fill_value'] = fill
+        variables[len(variables)] = var
+
+    for name, values in (counterfactual or {}).items():
+        # Same attributes as the actual `pmin` or `vmax`
+        base = variables[0] if name.startswith('pmin') else variables[1]
+        atts = dict(base['atts'])
+        atts['long_name'] += f" with {COUNTERFACTUALS[name]}"
+        variables[len(variables)] = {
+            'name': name,
+            'dims': base['dims'],
+            'values': values,
+            'dtype': values.dtype,
+            'atts': atts,
+        }
+
+    for name, values in (sensitivity or {}).items():
+        units, longname = SENSITIVITIES[name]
+        if name.endswith('_dt') and layer is not None:
+            longname += f" between {layer[0]:g} and {layer[1]:g} hPa"
+        variables[len(variables)] = {
+            'name': name,
+            'dims': ('time', 'latitude', 'longitude'),
+            'values': values,
+            'dtype': values.dtype,
+            'atts': {
+                'long_name': longname,
+                'units': units,
+            }
+        }
+
+    if params is not None:
+        # Insert a parameter set dimension after time, and record the
+        # value of each parameter for each set
+        npar = params.shape[1]
+        dimensions = {0: dimensions[0],
+                      1: {
+                          'name': 'parameter_set',
+                          'values': np.arange(npar),
+                          'dtype': 'int32',
+                          'atts': {
+                              'long_name': 'Parameter set',
+                          }
+                      },
+                      2: dimensions[1],
+                      3: dimensions[2]}
+        dims = ('time', 'parameter_set', 'latitude', 'longitude')
+        for v in variables.values():
+            v['dims'] = dims
+        descriptions = {
+            'CKCD': 'ratio of enthalpy and momentum exchange coefficients',
+            'SIG': 'buoyancy of displaced parcels (0 = reversible ascent, '
+                   '1 = pseudo-adiabatic ascent)',
+            'IDISS': 'dissipative heating (1 = included, 0 = not included)',
+            'B': 'exponent of azimuthal velocity profile in the eye',
+            'VREDUC': 'factor to reduce gradient wind to 10 m wind',
+        }
+        for name, values in zip(PARAMETERS, params):
+            variables[len(variables)] = {
+                'name': name.lower(),
+                'dims': ('parameter_set',),
+                'values': values,
+                'dtype': 'float32',
+                'atts': {
+                    'long_name': descriptions[name],
+                }
+            }
+
     history = (f"Maximum potential intensity calculated using Emanuel's algorithm "
                f"and ERA5 reanalysis data for the Australian region ")
                
@@ -377,7 +2102,7 @@ def saveData(outputFile, pmin, vmax, lon, lat, times):
 
     nctools.ncSaveGrid(outputFile, dimensions, variables, nodata=-9999,
                        datatitle='Maximum potential intensity', gatts=gatts,
-                       writedata=True, keepfileopen=False, zlib=True,
+                       writedata=writedata, keepfileopen=False, zlib=zlib,
                        complevel=4, lsd=None)
     return
 
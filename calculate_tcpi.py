@@ -47,6 +47,9 @@ from git import Repo
 from tcpyPI import pi
 import tcpyPI.utilities as tcPIutils
 
+from engines import loadEngine, emptyResult
+from columns import columnIndex, oceanIndex, scatter
+
 LOGGER = logging.getLogger()
 repo = Repo('', search_parent_directories=True)
 COMMIT = str(repo.commit('HEAD'))
@@ -94,6 +97,9 @@ def main():
                    help="Verbose output",
                    action='store_true')
     p.add_argument('-y', '--year', help="Year to process (1979-2020)")
+    p.add_argument('-e', '--engine', default='tcpypi',
+                   help=("PI engine: tcpypi (default), or one of the "
+                         "kernels in engines.py (fortran, numba, numpy)"))
 
     args = p.parse_args()
 
@@ -162,11 +168,11 @@ def main():
     startYear = config.getint("Input", "StartYear")
     endYear = config.getint("Input", "EndYear")
     for year in range(startYear, endYear + 1):
-        processYear(year, basepath, outpath, config)
+        processYear(year, basepath, outpath, config, args.engine)
     LOGGER.info("Completed")
 
 
-def processYear(year, basepath, outpath, config):
+def processYear(year, basepath, outpath, config, engine='tcpypi'):
     infiles = filelist(basepath, year)
     ds = xr.open_mfdataset(infiles)
 
@@ -189,7 +195,24 @@ def processYear(year, basepath, outpath, config):
     subds = ds.isel(longitude=slice(0, 1440, 4),
                      latitude=slice(0, 721, 4)).\
                 sel(level=slice(None, None, -1))
-    outds = run(subds.chunk(dict(level=-1)))
+    # Optional window of pressure levels (hPa). The levels are ordered
+    # from highest to lowest pressure, so only the levels in the window
+    # are read
+    subds = subds.sel(level=slice(config.getfloat('Input', 'BottomPressure',
+                                                  fallback=None),
+                                  config.getfloat('Input', 'TopPressure',
+                                                  fallback=None)))
+    # Optional land-sea mask giving the ocean columns for the kernels in
+    # :mod:`engines`. If not given, the points with valid SST are used
+    index = None
+    lsmfile = config.get('Input', 'LandSeaMask', fallback=None)
+    if lsmfile is not None:
+        index = columnIndex(subds['longitude'].values,
+                            subds['latitude'].values, lsmfile=lsmfile,
+                            threshold=config.getfloat('Input',
+                                                      'LandSeaThreshold',
+                                                      fallback=0.5))
+    outds = run(subds.chunk(dict(level=-1)), engine, index)
 
     outputfile = os.path.join(outpath, f"pcmin.{year}.nc")
 
@@ -206,31 +229,105 @@ def processYear(year, basepath, outpath, config):
     outds.to_netcdf(outputfile)
 
 
-def run(ds):
+def runEngine(ds, engine, index=None):
+    """
+    Run the PI calculation with one of the batched kernels in
+    :mod:`engines`. The ocean columns of each chunk of the dataset are
+    passed to the kernel in a single call; other points are NaN, with a
+    flag of 255.
+
+    :param ds: `xr.Dataset` containing required SST, MSL, T and Q variables,
+               with levels ordered from highest to lowest pressure
+    :param engine: PI engine module (see :mod:`engines`)
+    :param index: Optional `numpy.ndarray` of the flattened (latitude,
+                  longitude) positions of the ocean columns (see
+                  :func:`columns.columnIndex`). Default is the points
+                  where the SST is valid
+    :returns: `vmax`, `pmin`, `ifl`, `t0` (outflow temperature, K) and
+              `otl` (outflow level, hPa) as `xr.DataArray` objects
+
+    """
+
+    def kernel(sst, psl, p, t, r, land):
+        shape = sst.shape
+        nz = p.shape[-1]
+        # The levels are the same for every column
+        pc = p.reshape(-1, nz)[0]
+        # Only the ocean columns of the chunk are passed to the kernel
+        cols = oceanIndex(np.broadcast_to(land, shape) | np.isnan(sst))
+        if len(cols):
+            pmin, vmax, ifl, _, _, t0, otl, _ = engine.pcminp(
+                sst.ravel()[cols], psl.ravel()[cols], pc,
+                t.reshape(-1, nz)[cols], r.reshape(-1, nz)[cols])
+        else:
+            pmin, vmax, ifl, _, _, t0, otl, _ = emptyResult()
+        return (scatter(vmax, cols, shape), scatter(pmin, cols, shape),
+                scatter(ifl, cols, shape, 255), scatter(t0, cols, shape),
+                scatter(otl, cols, shape))
+
+    land = np.zeros(ds['sst'].shape[-2:], dtype=bool)
+    if index is not None:
+        land = np.ones(land.shape, dtype=bool)
+        land.ravel()[index] = False
+    land = xr.DataArray(land, dims=('latitude', 'longitude'),
+                        coords={'latitude': ds['latitude'],
+                                'longitude': ds['longitude']})
+
+    # The kernels take SST and temperature in Celsius, pressure in hPa
+    # and mixing ratio in g/kg
+    r = 1000. * ds['q'] / (1. - ds['q'])
+    result = xr.apply_ufunc(
+        kernel,
+        ds['sst'] - 273.15, ds['msl'] / 100., ds['level'], ds['t'] - 273.15, r,
+        land,
+        input_core_dims=[[], [], ['level',], ['level',], ['level',], []],
+        output_core_dims=[[], [], [], [], []],
+        dask='parallelized',
+        output_dtypes=[np.float32, np.float32, np.int32, np.float32,
+                       np.float32]
+    )
+    return result
+
+
+def run(ds, engine='tcpypi', index=None):
     """
     Run the PI and diagnostic calculations.
 
     :param ds: `xr.Dataset` containing required SST, MSL, T and Q variables
+    :param str engine: Name of the PI engine. ``tcpypi`` uses `tcpyPI.pi`;
+                       any other value is passed to `engines.loadEngine`
+    :param index: Optional `numpy.ndarray` of the flattened (latitude,
+                  longitude) positions of the ocean columns passed to the
+                  engine (see :func:`columns.columnIndex`). Not used by
+                  ``tcpypi``
     :returns: `xr.Dataset` containing PI, TO, OTL, EFF, DISEQ variables
 
     NOTES:
     - the diagnostics take SST in Celsius, while the PI function takes
       SST in Kelvin. I handle this in the call to the diagnostics.
+    - the kernels in :mod:`engines` return the outflow temperature and
+      level along with PI, so TO, OTL, EFF and DISEQ are calculated
+      with any engine.
 
     """
 
-    result = xr.apply_ufunc(
-        pi,
-        ds['sst']-273.15, ds['msl'], ds['level'], ds['t']-273.15, ds['q'],
-        kwargs=dict(CKCD=CKCD, ascent_flag=0,
-                    diss_flag=1, ptop=50, miss_handle=1),
-        input_core_dims=[[], [], ['level',], ['level',], ['level',]],
-        output_core_dims=[[], [], [], [], []],
-        vectorize=True,
-        dask='parallelized'
-    )
+    if engine != 'tcpypi':
+        vmax, pmin, ifl, t0, otl = runEngine(ds, loadEngine(engine), index)
+        flagname = 'PCMIN Flag'
+    else:
+        result = xr.apply_ufunc(
+            pi,
+            ds['sst']-273.15, ds['msl'], ds['level'], ds['t']-273.15, ds['q'],
+            kwargs=dict(CKCD=CKCD, ascent_flag=0,
+                        diss_flag=1, ptop=50, miss_handle=1),
+            input_core_dims=[[], [], ['level',], ['level',], ['level',]],
+            output_core_dims=[[], [], [], [], []],
+            vectorize=True,
+            dask='parallelized'
+        )
+        vmax, pmin, ifl, t0, otl = result
+        flagname = 'pyPI Flag'
 
-    vmax, pmin, ifl, t0, otl = result
     out_ds = xr.Dataset({
         'vmax': vmax,
         'pmin': pmin,
@@ -245,7 +342,7 @@ def run(ds):
     out_ds.vmax.attrs['units'] = 'm/s'
     out_ds.pmin.attrs['standard_name']= 'Minimum Central Pressure'
     out_ds.pmin.attrs['units'] = 'hPa'
-    out_ds.ifl.attrs['standard_name'] = 'pyPI Flag'
+    out_ds.ifl.attrs['standard_name'] = flagname
     out_ds.t0.attrs['standard_name'] = "Outflow temperature"
     out_ds.t0.attrs['units'] = 'K'
     out_ds.otl.attrs['standard_name'] = "Outflow temperature level"
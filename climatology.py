@@ -0,0 +1,274 @@
+"""
+:mod:`climatology` -- day-of-year climatology of the PI inputs
+==============================================================
+
+.. module:: climatology
+    :synopsis: Build, cache and load a day-of-year climatology of the
+               inputs to the PI calculation (SST, sea level pressure,
+               temperature and mixing ratio) for each grid point, used
+               to calculate counterfactual PI (see
+               :func:`calculate.decompose`).
+
+               The climatology is the mean over a range of years of all
+               times on each day of the year, smoothed with a running
+               mean over `window` days (weighted by the number of times
+               on each day). Days are counted in a leap year calendar,
+               so 29 February has its own (smoothed) value.
+
+               The climatology is built once, by reading the ERA5 files
+               for every month of the base period, and cached on disk as
+               a set of `.npy` files, one for each variable, that are
+               memory-mapped when loaded. Only the day needed at each
+               time is then read from disk.
+
+.. moduleauthor: Craig Arthur, <craig.arthur@ga.gov.au>
+
+"""
+
+import os
+import hashlib
+import logging
+import datetime
+from calendar import monthrange
+from os.path import join as pjoin, isfile, expanduser
+
+import numpy as np
+
+import metutils
+import nctools
+
+LOGGER = logging.getLogger(__name__)
+
+# Number of days in the climatology (a leap year)
+NDAYS = 366
+
+# Climatological variables: SST (C), sea level pressure (hPa),
+# temperature (C) and mixing ratio (g/kg)
+VARIABLES = ('sst', 'slp', 't', 'r')
+
+# Default location of the cached climatology
+CACHEDIR = pjoin(expanduser('~'), '.cache', 'pcmin')
+
+
+def dayOfYear(date):
+    """
+    Index of the day of the year in a leap year calendar, so that a day
+    has the same index in every year.
+
+    :param date: `datetime` or `cftime` object
+
+    :returns: index of the day (0 to 365)
+    """
+    return datetime.date(2000, date.month, date.day).timetuple().tm_yday - 1
+
+
+def inputFiles(paths, year, month):
+    """
+    Names of the ERA5 files for one month.
+
+    :param dict paths: Directory of each of the 'sst', 'slp', 't' and 'r'
+                       variables (see the [Input] section of the
+                       configuration file)
+    :param int year: Year
+    :param int month: Month
+
+    :returns: dict of the name of the file of each variable
+    """
+    startdate = datetime.datetime(year, month, 1)
+    enddate = datetime.datetime(year, month, monthrange(year, month)[1])
+    filedatestr = f"{startdate.strftime('%Y%m%d')}-{enddate.strftime('%Y%m%d')}"
+    patterns = {'sst': 'sst_era5_oper_sfc', 'slp': 'msl_era5_oper_sfc',
+                't': 't_era5_oper_pl', 'r': 'r_era5_oper_pl'}
+    return {name: pjoin(paths[name], f'{year}',
+                        f'{patterns[name]}_{filedatestr}.nc')
+            for name in VARIABLES}
+
+
+def cacheFiles(cachedir, *key):
+    """
+    Names of the cache files. The names include a hash of `key`, so a
+    climatology built for a different grid, period or smoothing is not
+    used.
+
+    :param str cachedir: Directory for the cache files
+    :param key: values that determine the climatology
+
+    :returns: dict of the name of the file of each variable, and of the
+              number of times on each day ('count')
+    """
+    digest = hashlib.md5()
+    for item in key:
+        if isinstance(item, np.ndarray):
+            digest.update(np.ascontiguousarray(item).tobytes())
+        else:
+            digest.update(repr(item).encode())
+    digest = digest.hexdigest()[:12]
+    return {name: pjoin(cachedir, f'climatology_{digest}_{name}.npy')
+            for name in VARIABLES + ('count',)}
+
+
+def smooth(mean, count, out, window):
+    """
+    Running mean of the daily means over `window` days, weighted by the
+    number of times on each day, treating the year as periodic.
+
+    :param mean: `numpy.ndarray` (NDAYS, ...) of the mean of each day
+    :param count: `numpy.ndarray` (NDAYS,) of the number of times on each
+                  day
+    :param out: `numpy.ndarray` (NDAYS, ...) for the smoothed means. Days
+                with no times within the window are NaN
+    :param int window: Number of days in the running mean (odd)
+    """
+    half = window // 2
+    total = np.zeros(mean.shape[1:])
+    n = 0
+    for k in range(-half, half + 1):
+        if count[k % NDAYS]:
+            total += count[k % NDAYS] * mean[k % NDAYS]
+            n += count[k % NDAYS]
+    for day in range(NDAYS):
+        out[day] = total / n if n else np.nan
+        old, new = (day - half) % NDAYS, (day + half + 1) % NDAYS
+        if count[old]:
+            total -= count[old] * mean[old]
+            n -= count[old]
+        if count[new]:
+            total += count[new] * mean[new]
+            n += count[new]
+
+
+def buildClimatology(paths, years, indices, levels, files, window=31):
+    """
+    Build the climatology and save it to `files`.
+
+    The data are read with the same indices as the data of each month
+    in `calculate.py`, so the climatology is on the same grid.
+
+    :param dict paths: Directory of each variable (see `inputFiles`)
+    :param years: sequence of the years of the base period
+    :param tuple indices: Indices (`sstidy`, `sstidx`) of the grid in the
+                          surface files, (`varidy`, `varidx`) in the
+                          pressure level files and a `slice` of the
+                          levels
+    :param levels: `numpy.ndarray` of the pressure levels (hPa) within the
+                   slice
+    :param dict files: Names of the cache files (see `cacheFiles`)
+    :param int window: Number of days in the running mean
+
+    :raises ValueError: if there are no data in the base period
+    """
+    sstidy, sstidx, varidy, varidx, lslice = indices
+    ny, nx, nz = len(sstidy), len(sstidx), len(levels)
+    shapes = {'sst': (ny, nx), 'slp': (ny, nx),
+              't': (nz, len(varidy), len(varidx)),
+              'r': (nz, len(varidy), len(varidx))}
+    plev = levels[:, np.newaxis, np.newaxis]
+
+    # Running means of each day are accumulated in temporary files, then
+    # smoothed into the cache files
+    means = {name: np.lib.format.open_memmap(f"{files[name]}.{os.getpid()}.tmp",
+                                             mode='w+', dtype=np.float32,
+                                             shape=(NDAYS,) + shapes[name])
+             for name in VARIABLES}
+    count = np.zeros(NDAYS, dtype=np.int64)
+    for year in years:
+        for month in range(1, 13):
+            names = inputFiles(paths, year, month)
+            missing = [f for f in names.values() if not isfile(f)]
+            if missing:
+                LOGGER.warning(f"Input file is missing: {missing[0]}. "
+                               f"Skipping {year}-{month} in the climatology")
+                continue
+            LOGGER.info(f"Adding {year}-{month} to the climatology")
+            ncobjs = {name: nctools.ncLoadFile(f) for name, f in names.items()}
+            sstvar = nctools.ncGetVar(ncobjs['sst'], 'sst')
+            slpvar = nctools.ncGetVar(ncobjs['slp'], 'msl')
+            tvar = nctools.ncGetVar(ncobjs['t'], 't')
+            rvar = nctools.ncGetVar(ncobjs['r'], 'r')
+            for var in (sstvar, slpvar, tvar, rvar):
+                var.set_auto_maskandscale(True)
+            times = nctools.ncGetTimes(ncobjs['t'])
+            for tdx, time in enumerate(times):
+                t = metutils.convert(tvar[tdx, lslice, varidy, varidx],
+                                     tvar.units, 'C')
+                r = metutils.rHToMixRat(rvar[tdx, lslice, varidy, varidx],
+                                        t, plev, 'C')
+                values = {
+                    'sst': metutils.convert(sstvar[tdx, sstidy, sstidx],
+                                            sstvar.units, 'C'),
+                    'slp': metutils.convert(slpvar[tdx, sstidy, sstidx],
+                                            slpvar.units, 'hPa'),
+                    't': t,
+                    'r': np.where(r < 0, 0, r),
+                }
+                day = dayOfYear(time)
+                count[day] += 1
+                for name, value in values.items():
+                    value = np.ma.filled(value, np.nan)
+                    means[name][day] += (value - means[name][day]) / count[day]
+            for ncobj in ncobjs.values():
+                ncobj.close()
+
+    if not count.any():
+        for name in VARIABLES:
+            os.remove(means[name].filename)
+        raise ValueError(f"No data to build a climatology for {years[0]}-"
+                         f"{years[-1]}")
+
+    LOGGER.info(f"Smoothing the climatology with a {window}-day running mean")
+    for name in VARIABLES:
+        tmpfile = f"{files[name]}.{os.getpid()}.npy"
+        out = np.lib.format.open_memmap(tmpfile, mode='w+', dtype=np.float32,
+                                        shape=means[name].shape)
+        smooth(means[name], count, out, window)
+        out.flush()
+        del out
+        os.remove(means[name].filename)
+        os.replace(tmpfile, files[name])
+    # The count is saved last, marking the climatology as complete
+    tmpfile = f"{files['count']}.{os.getpid()}.npy"
+    np.save(tmpfile, count)
+    os.replace(tmpfile, files['count'])
+
+
+def loadClimatology(paths, years, indices, levels, lon, lat, window=31,
+                    cachedir=CACHEDIR, build=True):
+    """
+    Load the climatology from the cache, building it first if it does
+    not exist (and `build` is True).
+
+    :param dict paths: Directory of each variable (see `inputFiles`)
+    :param years: sequence of the years of the base period
+    :param tuple indices: Indices of the grid (see `buildClimatology`)
+    :param levels: `numpy.ndarray` of the pressure levels (hPa) within the
+                   slice
+    :param lon: `numpy.ndarray` of the longitudes of the grid
+    :param lat: `numpy.ndarray` of the latitudes of the grid
+    :param int window: Number of days in the running mean
+    :param str cachedir: Directory for the cache files
+    :param bool build: If False, the climatology must already exist (e.g.
+                       it is being built by another process)
+
+    :returns: dict of memory-mapped `numpy.ndarray` of each variable,
+              (NDAYS, ny, nx) for 'sst' and 'slp' and (NDAYS, nz, ny, nx)
+              for 't' and 'r', and the number of times on each day
+              ('count')
+    :raises FileNotFoundError: if the climatology does not exist and
+                               `build` is False
+    """
+    years = list(years)
+    files = cacheFiles(cachedir, [paths[name] for name in VARIABLES],
+                       years, indices[-1], np.asarray(levels, dtype=float),
+                       np.asarray(lon, dtype=float),
+                       np.asarray(lat, dtype=float), window)
+    if not isfile(files['count']):
+        if not build:
+            raise FileNotFoundError(f"No climatology in {files['count']}")
+        LOGGER.info(f"Building climatology for {years[0]}-{years[-1]}")
+        os.makedirs(cachedir, exist_ok=True)
+        buildClimatology(paths, years, indices, levels, files, window)
+        LOGGER.info(f"Saved climatology to {files['count']}")
+    LOGGER.debug(f"Loading climatology from {files['count']}")
+    clim = {name: np.load(files[name], mmap_mode='r') for name in VARIABLES}
+    clim['count'] = np.load(files['count'])
+    return clim
@@ -0,0 +1,213 @@
+"""
+:mod:`columns` -- index of the ocean columns of a grid
+======================================================
+
+.. module:: columns
+    :synopsis: Build the index of the grid points where potential
+               intensity is calculated, pack those columns into the
+               compact (ncol, nlev) arrays passed to the PI kernels and
+               scatter the results back onto the grid.
+
+               Potential intensity is only defined over the ocean, so
+               there is no need to pass land points to the kernel. The
+               index holds the flattened (lat, lon) position of each
+               ocean column, either where the SST is valid or where a
+               land-sea mask (e.g. the ERA5 ``lsm`` field) is below a
+               threshold. It depends only on the grid, so is built once
+               and cached: in memory for the life of the process, and,
+               for a land-sea mask file, on disk (see `columnIndex`).
+
+.. moduleauthor: Craig Arthur, <craig.arthur@ga.gov.au>
+
+"""
+
+import os
+import hashlib
+import logging
+from os.path import join as pjoin, isfile, realpath, getmtime, expanduser
+
+import numpy as np
+
+import nctools
+
+LOGGER = logging.getLogger(__name__)
+
+# Default location of the cached indices (shared with :mod:`moistadiabat`)
+CACHEDIR = pjoin(expanduser('~'), '.cache', 'pcmin')
+
+# Indices built during this process, keyed by a hash of the grid and
+# the source of the mask
+_INDICES = {}
+
+
+def oceanIndex(land):
+    """
+    Index of the ocean columns of a grid.
+
+    :param land: `numpy.ndarray` (ny, nx) of bool, True where no PI is
+                 calculated (land, or no valid SST)
+
+    :returns: `numpy.ndarray` (ncol,) of the flattened positions of the
+              ocean columns, in increasing order
+    """
+    return np.flatnonzero(~np.asarray(land, dtype=bool).ravel())
+
+
+def landSeaMask(lsmfile, lon, lat, threshold=0.5, varname='lsm'):
+    """
+    Read a land-sea mask on the grid given by `lon` and `lat`. The mask
+    file may cover a larger domain, but must include every point of
+    the grid. If the mask has a time dimension, the first time is used.
+
+    :param str lsmfile: Path to a netCDF file of the fraction of land in
+                        each grid cell
+    :param lon: `numpy.ndarray` of longitudes
+    :param lat: `numpy.ndarray` of latitudes
+    :param float threshold: Points with a land fraction of at least
+                            `threshold` are land
+    :param str varname: Name of the land-sea mask variable
+
+    :returns: `numpy.ndarray` (ny, nx) of bool, True over land
+    :raises ValueError: if the mask file does not cover the grid
+    """
+    ncobj = nctools.ncLoadFile(lsmfile)
+    lsmlon = nctools.ncGetDims(ncobj, 'longitude')
+    lsmlat = nctools.ncGetDims(ncobj, 'latitude')
+    _, idx, ii = np.intersect1d(lsmlon, lon, return_indices=True)
+    _, idy, jj = np.intersect1d(lsmlat, lat, return_indices=True)
+    if len(idx) != len(lon) or len(idy) != len(lat):
+        ncobj.close()
+        raise ValueError(f"Land-sea mask {lsmfile} does not cover the grid")
+    var = nctools.ncGetVar(ncobj, varname)
+    var.set_auto_maskandscale(True)
+    frac = var[0] if var.ndim == 3 else var[:]
+    frac = np.ma.filled(frac[:, idx][idy, :], 1.0)
+    ncobj.close()
+    land = np.empty((len(lat), len(lon)), dtype=bool)
+    land[np.ix_(jj, ii)] = frac >= threshold
+    return land
+
+
+def _gridKey(lon, lat, *source):
+    """
+    Hash of the grid and the source of the mask, used as the key of the
+    cached indices.
+    """
+    digest = hashlib.md5()
+    for arr in (lon, lat):
+        digest.update(np.ascontiguousarray(arr, dtype=np.float64).tobytes())
+    for item in source:
+        if isinstance(item, np.ndarray):
+            digest.update(np.packbits(item).tobytes())
+        else:
+            digest.update(repr(item).encode())
+    return digest.hexdigest()[:12]
+
+
+def columnIndex(lon, lat, land=None, lsmfile=None, threshold=0.5,
+                cachedir=CACHEDIR):
+    """
+    Index of the ocean columns of the grid, built once and cached.
+
+    The index is built from the land-sea mask in `lsmfile` if it is
+    given, otherwise from `land`, typically the points where the SST is
+    missing at every time::
+
+        index = columnIndex(lon, lat,
+                            np.ma.getmaskarray(sst).all(axis=0))
+
+    Indices built from a land-sea mask file are also saved in
+    `cachedir`, so later runs on the same grid do not read the mask.
+
+    :param lon: `numpy.ndarray` (nx,) of longitudes
+    :param lat: `numpy.ndarray` (ny,) of latitudes
+    :param land: `numpy.ndarray` (ny, nx) of bool, True where no PI is
+                 calculated. Ignored if `lsmfile` is given
+    :param str lsmfile: Optional path to a land-sea mask file (see
+                        `landSeaMask`)
+    :param float threshold: Land fraction at which a point is land
+    :param str cachedir: Directory for the cached index, or None to keep
+                         it in memory only
+
+    :returns: `numpy.ndarray` (ncol,) of the flattened positions of the
+              ocean columns
+    :raises ValueError: if neither `land` nor `lsmfile` is given
+    """
+    if lsmfile is not None:
+        lsmfile = realpath(lsmfile)
+        key = _gridKey(lon, lat, lsmfile, getmtime(lsmfile), threshold)
+    elif land is not None:
+        land = np.asarray(land, dtype=bool)
+        key = _gridKey(lon, lat, land)
+    else:
+        raise ValueError("Either a land mask or a land-sea mask file "
+                         "is required")
+
+    if key in _INDICES:
+        return _INDICES[key]
+
+    cachefile = None
+    if lsmfile is not None and cachedir is not None:
+        cachefile = pjoin(cachedir, f'columns_{key}.npy')
+    if cachefile is not None and isfile(cachefile):
+        LOGGER.debug(f"Loading ocean column index from {cachefile}")
+        index = np.load(cachefile)
+    else:
+        if lsmfile is not None:
+            LOGGER.info(f"Reading land-sea mask from {lsmfile}")
+            land = landSeaMask(lsmfile, lon, lat, threshold)
+        index = oceanIndex(land)
+        if cachefile is not None:
+            try:
+                os.makedirs(cachedir, exist_ok=True)
+                tmpfile = f"{cachefile}.{os.getpid()}.npy"
+                np.save(tmpfile, index)
+                os.replace(tmpfile, cachefile)
+            except OSError as e:
+                LOGGER.warning(f"Unable to cache ocean column index: {e}")
+
+    LOGGER.info(f"{len(index)} of {len(lon) * len(lat)} columns are ocean")
+    _INDICES[key] = index
+    return index
+
+
+def packColumns(arr, index=None):
+    """
+    Pack a 3-d (level, lat, lon) array into a 2-d (column, level) array
+    suitable for passing to the batched `pcminv` kernel.
+
+    The vertical dimension is reversed, so that the lowest index
+    corresponds to the highest pressure level, as required by `pcmin.f`.
+
+    :param arr: `numpy.ndarray` of shape (nz, ny, nx)
+    :param index: Optional `numpy.ndarray` (ncol,) of the columns to pack
+                  (see `columnIndex`). Default is every column
+
+    :returns: `numpy.ndarray` of shape (ncol, nz), single precision
+              and Fortran-ordered so f2py does not make a further copy.
+    """
+    nz = arr.shape[0]
+    arr = np.ma.filled(arr, np.nan)[::-1].reshape(nz, -1)
+    if index is not None:
+        arr = arr[:, index]
+    return np.asfortranarray(arr.T, dtype=np.float32)
+
+
+def scatter(values, index, shape, fill=np.nan):
+    """
+    Scatter the results for the packed columns back onto the grid.
+
+    :param values: `numpy.ndarray` (ncol,) or (ncol, npar) of results
+    :param index: `numpy.ndarray` (ncol,) of the positions of the columns
+                  (see `columnIndex`)
+    :param tuple shape: Shape (ny, nx) of the grid
+    :param fill: Value at the points that are not in `index`
+
+    :returns: `numpy.ndarray` (ny, nx), or (ny, nx, npar), of the same
+              type as `values`
+    """
+    values = np.asarray(values)
+    out = np.full((int(np.prod(shape)),) + values.shape[1:], fill,
+                  dtype=values.dtype)
+    out[index] = values
+    return out.reshape(tuple(shape) + values.shape[1:])
@@ -0,0 +1,244 @@
+"""
+:mod:`engines` -- select the potential intensity kernel
+=======================================================
+
+.. module:: engines
+    :synopsis: Load one of the available implementations of the
+               potential intensity kernel. Each engine is a module that
+               provides the same functions:
+
+               * `pcminv(sst, psl, p, t, r, n)` - batched PI calculation
+                 for (ncol, nlev) soundings, returning (ncol,) arrays of
+                 `pmin`, `vmax`, `ifl`, `niter` (number of iterations) and
+                 `pmc` (final value of the minimum pressure iteration),
+                 `to` (outflow temperature, K), `otl` (outflow level,
+                 hPa) and `ncmax` (largest number of iterations of the
+                 CAPE calculation at any level).
+                 An optional `pminit` gives the first guess of the
+                 iteration, and `isolv` the method used to solve for the
+                 minimum pressure (see `SOLVERS`)
+               * `pcminp(sst, psl, p, t, r, n)` - as `pcminv`, for
+                 soundings on the same pressure levels: `p` is a single
+                 (nlev,) array shared by all columns
+               * `pcsweep(sst, psl, p, t, r, par, n)` - as `pcminp`, for
+                 several sets of the adjustable parameters `par` (see
+                 `PARAMETERS` and `parameterSets`), returning (ncol, npar)
+                 arrays. Work that does not depend on a parameter is
+                 shared between the sets
+               * `pctlp(sst, psl, p, t, r, dt, n)` - as `pcminp`, also
+                 returning the derivatives of `pmin` and `vmax` with
+                 respect to the SST and along a perturbation `dt` of the
+                 temperature at each level (see `SENSITIVITY_TYPES`),
+                 from the tangent linear of the kernel. Optional: only
+                 the ``fortran`` engine provides it
+               * `setnthreads(n)` - set the number of threads
+               * `getnthreads()` - get the number of threads
+
+               Available engines are:
+
+               * ``fortran`` - the f2py-wrapped `pcmin.f` (default). The
+                 extension is built for several instruction sets (see
+                 `VARIANTS`), and the best one the CPU supports is
+                 loaded. A build can be chosen by name, e.g.
+                 ``fortran:avx2``, or with the `PCMIN_VARIANT`
+                 environment variable
+               * ``numba`` - the Numba port in :mod:`pcmin_numba`
+               * ``numpy`` - the vectorised NumPy version in
+                 :mod:`pcmin_numpy`
+               * ``emulator`` - the regression model of PMIN and VMAX in
+                 :mod:`pcmin_emulator`, fitted to the output of the
+                 kernel, for fast screening. It also provides `setmodel`
+                 to load the model, and `modelError`
+
+.. moduleauthor: Craig Arthur, <craig.arthur@ga.gov.au>
+
+"""
+
+import os
+import importlib
+import logging
+import itertools
+
+import numpy as np
+
+LOGGER = logging.getLogger(__name__)
+
+ENGINES = {
+    'fortran': 'pcmin',
+    'numba': 'pcmin_numba',
+    'numpy': 'pcmin_numpy',
+    'emulator': 'pcmin_emulator',
+}
+
+# Builds of the Fortran engine for different instruction sets (see
+# setup.py), from the fastest to the most portable, and the CPU features
+# (as named by NumPy) each needs. The baseline build runs on any x86-64 CPU
+VARIANTS = {
+    'avx512': ('pcmin_avx512', ('AVX512F', 'AVX512CD', 'AVX512BW',
+                                'AVX512DQ', 'AVX512VL', 'FMA3')),
+    'avx2': ('pcmin_avx2', ('AVX2', 'FMA3')),
+    'baseline': ('pcmin', ()),
+}
+
+# Environment variable that overrides the choice of build
+VARIANT_ENV = 'PCMIN_VARIANT'
+
+# Values of `isolv` for each method of solving for the minimum pressure
+SOLVERS = {
+    'fixed': 0,
+    'secant': 1,
+}
+
+# Adjustable parameters of the PI calculation, in the order of the rows
+# of the `par` argument of `pcsweep`, and their default values (as set
+# in `DEFPAR` in `pcmin.f`):
+# CKCD - ratio of the exchange coefficients of enthalpy and momentum
+# SIG - 0 for reversible ascent, 1 for pseudo-adiabatic ascent
+# IDISS - 1 to include dissipative heating, 0 otherwise
+# B - exponent of the azimuthal velocity profile in the eye
+# VREDUC - factor to reduce the gradient wind to the 10 m wind
+PARAMETERS = ('CKCD', 'SIG', 'IDISS', 'B', 'VREDUC')
+DEFAULTS = {'CKCD': 0.9, 'SIG': 0.0, 'IDISS': 1, 'B': 2.0, 'VREDUC': 0.8}
+
+# Types of the arrays returned by `pcminv`, `pcminp` and `pcsweep`
+RESULT_TYPES = (np.float32, np.float32, np.int32, np.int32, np.float32,
+                np.float32, np.float32, np.int32)
+
+# Types of the further arrays returned by `pctlp`: the derivatives of
+# `pmin` and `vmax` with respect to the SST, and along the perturbation
+# of the temperature
+SENSITIVITY_TYPES = (np.float32, np.float32, np.float32, np.float32)
+
+
+def parameterSets(**values):
+    """
+    Build the parameter sets for `pcsweep` from every combination of the
+    given values of each parameter. Parameters that are not given take
+    their default value.
+
+    Example::
+
+        >>> parameterSets(CKCD=[0.9, 0.7], B=[2.0, 1.5]).shape
+        (5, 4)
+
+    :param values: sequence of values for each of `PARAMETERS`
+
+    :returns: `numpy.ndarray` (5, npar) of parameter sets, in Fortran
+              order. The last parameter varies fastest.
+    :raises ValueError: if a parameter name is not recognised
+    """
+    unknown = set(values) - set(PARAMETERS)
+    if unknown:
+        raise ValueError(f"Unknown parameter(s) {', '.join(sorted(unknown))}. "
+                         f"Available parameters: {', '.join(PARAMETERS)}")
+    lists = [values.get(name, [DEFAULTS[name]]) for name in PARAMETERS]
+    sets = np.array(list(itertools.product(*lists)), dtype=np.float64)
+    return np.asfortranarray(sets.T)
+
+
+def emptyResult(shape=(0,), sensitivity=False):
+    """
+    Arrays returned by the kernels for no columns. The f2py wrappers of
+    the Fortran kernels need at least one column, so callers that may
+    have none (e.g. a tile with no ocean points) use this instead.
+
+    :param tuple shape: Shape of the arrays, (0,) or (0, npar)
+    :param bool sensitivity: Include the derivatives returned by `pctlp`
+
+    :returns: tuple of empty arrays of the types in `RESULT_TYPES` (and
+              `SENSITIVITY_TYPES`)
+    """
+    types = RESULT_TYPES + (SENSITIVITY_TYPES if sensitivity else ())
+    return tuple(np.empty(shape, dtype=t) for t in types)
+
+
+def cpuFeatures():
+    """
+    :returns: set of the names of the CPU features supported by this
+              machine and operating system, as detected by NumPy. Empty
+              if this version of NumPy does not report them, so only the
+              baseline build of the Fortran engine is used
+    """
+    try:
+        try:
+            from numpy._core._multiarray_umath import __cpu_features__
+        except ImportError:
+            from numpy.core._multiarray_umath import __cpu_features__
+        return {name for name, supported in __cpu_features__.items()
+                if supported}
+    except (ImportError, AttributeError) as e:
+        LOGGER.warning(f"Unable to detect the CPU features ({e}): using "
+                       "the baseline build of the Fortran engine")
+        return set()
+
+
+def loadVariant(variant=None):
+    """
+    Load a build of the Fortran engine. If `variant` is not given, the
+    build named in the `PCMIN_VARIANT` environment variable is loaded,
+    or else the first build in `VARIANTS` that the CPU supports and that
+    has been installed.
+
+    :param str variant: Name of the build (see `VARIANTS`)
+
+    :returns: the extension module
+    :raises ValueError: if the name of the build is not recognised
+    :raises ImportError: if the build (or, if no build is named, the
+                         baseline build) cannot be loaded
+    """
+    variant = variant or os.environ.get(VARIANT_ENV, '').lower() or None
+    features = cpuFeatures()
+    if variant is not None:
+        if variant not in VARIANTS:
+            raise ValueError(f"Unknown build of the Fortran engine "
+                             f"'{variant}'. Available builds: "
+                             f"{', '.join(VARIANTS)}")
+        missing = set(VARIANTS[variant][1]) - features
+        if missing:
+            LOGGER.warning(f"The CPU does not support {', '.join(sorted(missing))}, "
+                           f"required by the '{variant}' build")
+        candidates = [variant]
+    else:
+        candidates = [name for name, (_, required) in VARIANTS.items()
+                      if features.issuperset(required)]
+
+    for variant in candidates:
+        try:
+            engine = importlib.import_module(VARIANTS[variant][0])
+            break
+        except ImportError as e:
+            if variant == candidates[-1]:
+                raise
+            LOGGER.debug(f"The '{variant}' build is not available: {e}")
+    LOGGER.info(f"Loaded the '{variant}' build of the Fortran engine "
+                f"({engine.__name__})")
+    return engine
+
+
+def loadEngine(name='fortran'):
+    """
+    Load the named PI engine.
+
+    :param str name: Name of the engine (see `ENGINES`). For the
+                     ``fortran`` engine, the name may be followed by the
+                     build to load, e.g. ``fortran:avx2`` (see
+                     `loadVariant`)
+
+    :returns: module providing `pcminv`, `pcminp`, `pcsweep`,
+              `setnthreads` and `getnthreads`
+    :raises ValueError: if the engine name is not recognised
+    :raises ImportError: if the engine cannot be loaded (e.g. the
+                         Fortran extension has not been built)
+    """
+    name, _, variant = name.lower().partition(':')
+    if name not in ENGINES:
+        raise ValueError(f"Unknown PI engine '{name}'. "
+                         f"Available engines: {', '.join(ENGINES)}")
+    if name == 'fortran':
+        engine = loadVariant(variant or None)
+    elif variant:
+        raise ValueError(f"The '{name}' PI engine has only one build")
+    else:
+        engine = importlib.import_module(ENGINES[name])
+    LOGGER.info(f"Using the '{name}' PI engine ({engine.__name__})")
+    return engine
@@ -135,13 +135,14 @@ def wetBulbToVapPr(db, wb, elev, units_vp=gPressureUnits):
     vp = convert(vp, 'kPa', units_vp)
     return vp
 
-def satVapPr(temp, units_vp=gPressureUnits):
+def satVapPr(temp, units_vp=gPressureUnits, dtype=float):
     """
     Saturation vapour pressure from temperature in degrees celsius.
 
     :param float temp: Temperature (degrees celsius).
     :param str units_vp: Units of the vapour pressure to return.
                          Default is ``gPressureUnits``.
+    :param dtype: Floating point type of the result (see `convert`).
 
     :returns: saturation vapour pressure in the specified or default units.
 
@@ -157,8 +158,10 @@ def satVapPr(temp, units_vp=gPressureUnits):
         31.697124349060619
 
     """
-    vp = np.exp(((16.78 * temp) - 116.9) / (temp + 237.3))
-    vp = convert(vp, 'kPa', units_vp)
+    temp = ma.asarray(temp, dtype=dtype)
+    cast = temp.dtype.type
+    vp = np.exp(((cast(16.78) * temp) - cast(116.9)) / (temp + cast(237.3)))
+    vp = convert(vp, 'kPa', units_vp, dtype)
 
     return vp
 
@@ -323,22 +326,30 @@ def spHumToMixRat(q, units="gkg"):
     rat = gEps * q / (gEps - q)
     return rat
 
-def rHToMixRat(rh, tmp, prs, tmp_units="C"):
+def rHToMixRat(rh, tmp, prs, tmp_units="C", dtype=float):
     """
     Calculate mixing ratio from relative humidity, temperature and pressure.
 
     :param float rh: Relative humidity (%).
     :param float tmp: Temperature (any units, default degrees Celsius).
-    :param float prs: Air pressure (hPa).
+    :param float prs: Air pressure (hPa). Arrays are broadcast against
+                      `rh` and `tmp`, so for (level, lat, lon) arrays on
+                      the same pressure levels at every point, pass
+                      ``levels[:, np.newaxis, np.newaxis]``.
     :param str tmp_units: Air temperature units (default degrees Celsius).
+    :param dtype: Floating point type of the calculation and result
+                  (e.g. `numpy.float32` to halve the memory used for
+                  large arrays). Default is double precision.
 
     :returns: Mixing ratio (g/kg).
     :rtype: float
 
     """
-    es = satVapPr(convert(tmp, tmp_units, "C"), 'hPa')
-    e = (rh / 100.) * es
-    rat = vapPrToMixRat(e, prs)
+    es = satVapPr(convert(tmp, tmp_units, "C", dtype), 'hPa', dtype)
+    # As vapPrToMixRat, in the precision of `es`
+    cast = es.dtype.type
+    e = (ma.asarray(rh, dtype=dtype) / cast(100.)) * es
+    rat = cast(gEps) * e / (np.asarray(prs, dtype=dtype) - e)
     return rat
 
 def spHumToRH(q, tmp, prs):
@@ -374,19 +385,25 @@ def coriolis(lat):
     f = 2 * omega * np.sin(np.radians(lat))
     return f
 
-def convert(value, inunits, outunits):
+def convert(value, inunits, outunits, dtype=float):
     """
     Convert value from input units to output units.
 
     :param value: Value to be converted
     :param str inunits: Input units.
     :param str outunits: Output units.
+    :param dtype: Floating point type of the result. Default is double
+                  precision; pass `numpy.float32` to keep large arrays in
+                  single precision.
 
     :returns: Value converted to ``outunits`` units.
 
     """
     startValue = value
-    value = ma.array(value, dtype=float)
+    value = ma.array(value, dtype=dtype)
+    # Masked array arithmetic with Python floats is done in double
+    # precision, so give the factors the same type as the value
+    cast = value.dtype.type
     if inunits == outunits:
         # Do nothing:
         return value
@@ -461,15 +478,15 @@ def convert(value, inunits, outunits):
 
     if inunits in convert_pre:
         if outunits in convert_pre[inunits]:
-            value += convert_pre[inunits][outunits]
+            value += cast(convert_pre[inunits][outunits])
 
     if inunits in convert:
         if outunits in convert[inunits]:
-            value = value * convert[inunits][outunits]
+            value = value * cast(convert[inunits][outunits])
 
     if inunits in convert_post:
         if outunits in convert_post[inunits]:
-            value += convert_post[inunits][outunits]
+            value += cast(convert_post[inunits][outunits])
 
     return value
 
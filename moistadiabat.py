@@ -0,0 +1,321 @@
+"""
+:mod:`moistadiabat` -- tabulated reversible moist adiabats
+==========================================================
+
+.. module:: moistadiabat
+    :synopsis: Build, cache and install a table of the temperature of a
+               saturated parcel as a function of its reversible entropy,
+               total water mixing ratio and pressure.
+
+               Above the lifted condensation level, the `CAPE` routine
+               solves for the parcel temperature at each level with an
+               iterative loop. Since the parcel temperature depends only
+               on the reversible entropy `S`, the total water mixing ratio
+               `RP` and the pressure `P`, the inverse of the entropy can
+               be tabulated once. The PI engines then interpolate the
+               table (trilinear in `S`, `RP` and `log(P)`) and take a
+               single Newton step to correct the interpolated temperature,
+               falling back to the iterative loop for points outside the
+               table.
+
+               The table is built with NumPy the first time it is needed
+               and cached on disk (see `loadTable`). The dimensions of the
+               table must match the `PARAMETER` statements in `MALOOK` and
+               `SETMATAB` in `pcmin.f`.
+
+.. moduleauthor: Craig Arthur, <craig.arthur@ga.gov.au>
+
+"""
+
+import os
+import hashlib
+import logging
+from os.path import join as pjoin, isfile, dirname, expanduser
+
+import numpy as np
+
+from pcmin_numba import CPD, CL, CPVMCL, RV, RD, EPS, ALV0
+
+LOGGER = logging.getLogger(__name__)
+
+# Table axes: reversible entropy (J/kg/K), total water mixing ratio
+# (kg/kg) and log of pressure (hPa). These must match `pcmin.f`
+NTS, TS0, TDS = 476, 3400.0, 4.0
+NTR, TR0, TDR = 51, 0.0, 0.001
+NTP, TP0, TDP = 96, np.log(50.0), np.log(1100.0 / 50.0) / 95.
+
+# Lowest temperature (K) included in the table
+TMIN = 150.0
+
+# Default location of the cached table
+CACHEDIR = pjoin(expanduser('~'), '.cache', 'pcmin')
+
+
+def satVapPr(tk):
+    """
+    Saturation vapour pressure, using the same expression as `pcmin.f`.
+
+    :param tk: Temperature (K)
+
+    :returns: Saturation vapour pressure (hPa)
+    """
+    tc = tk - 273.15
+    return 6.112 * np.exp(17.67 * tc / (243.5 + tc))
+
+
+def reversibleEntropy(tk, rp, p):
+    """
+    Reversible entropy of a saturated parcel, and its derivative with
+    respect to temperature, as calculated in the `CAPE` routine.
+
+    :param tk: Parcel temperature (K)
+    :param rp: Total water mixing ratio (kg/kg)
+    :param p: Pressure (hPa)
+
+    :returns: entropy (J/kg/K) and the rate of change of entropy with
+              temperature at constant pressure (J/kg/K^2)
+    """
+    es = satVapPr(tk)
+    rg = EPS * es / (p - es)
+    alv = ALV0 + CPVMCL * (tk - 273.15)
+    sg = (CPD + rp * CL) * np.log(tk) - RD * np.log(p - es) + alv * rg / tk
+    sl = (CPD + rp * CL + alv * alv * rg / (RV * tk * tk)) / tk
+    return sg, sl
+
+
+def _maxTemperature(p):
+    """
+    Highest temperature at which a saturated parcel can exist at
+    pressure `p` (i.e. where the saturation vapour pressure is 1 hPa less
+    than the pressure, the limit used in the `CAPE` routine).
+
+    :param p: Pressure (hPa)
+
+    :returns: Temperature (K)
+    """
+    a = np.log((p - 1.0) / 6.112)
+    return 243.5 * a / (17.67 - a) + 273.15
+
+
+def solveTemperature(s, rp, p, niter=60):
+    """
+    Solve for the temperature of a saturated parcel with reversible
+    entropy `s` and total water mixing ratio `rp` at pressure `p`, by
+    bisection. Points where there is no solution between `TMIN` and the
+    highest temperature at which the parcel can be saturated are set to
+    zero.
+
+    :param s: Reversible entropy (J/kg/K)
+    :param rp: Total water mixing ratio (kg/kg)
+    :param p: Pressure (hPa)
+    :param int niter: Number of bisection steps
+
+    :returns: `numpy.ndarray` of temperature (K)
+    """
+    s, rp, p = np.broadcast_arrays(s, rp, p)
+    lo = np.full(s.shape, TMIN)
+    hi = _maxTemperature(p) - 1.0e-3
+    valid = ((reversibleEntropy(lo, rp, p)[0] <= s) &
+             (reversibleEntropy(hi, rp, p)[0] >= s))
+    for _ in range(niter):
+        mid = 0.5 * (lo + hi)
+        above = reversibleEntropy(mid, rp, p)[0] > s
+        hi = np.where(above, mid, hi)
+        lo = np.where(above, lo, mid)
+    return np.where(valid, 0.5 * (lo + hi), 0.0)
+
+
+def axes():
+    """
+    :returns: the entropy, mixing ratio and pressure axes of the table
+    """
+    return (TS0 + TDS * np.arange(NTS), TR0 + TDR * np.arange(NTR),
+            np.exp(TP0 + TDP * np.arange(NTP)))
+
+
+def buildTable():
+    """
+    Build the table of parcel temperature.
+
+    :returns: `numpy.ndarray` (NTS, NTR, NTP) of temperature (K), in
+              Fortran order. Points with no solution are zero.
+    """
+    s, rp, p = axes()
+    tab = np.empty((NTS, NTR, NTP), dtype=np.float32, order='F')
+    for k in range(NTP):
+        tab[:, :, k] = solveTemperature(s[:, None], rp[None, :], p[k])
+    return tab
+
+
+def interpolate(tab, s, rp, p, s0=TS0, ds=TDS, r0=TR0, dr=TDR,
+                p0=TP0, dp=TDP):
+    """
+    Trilinear interpolation of the table, as done in `MALOOK` in
+    `pcmin.f`.
+
+    :param tab: `numpy.ndarray` (ns, nr, np) of temperature (K)
+    :param s: Reversible entropy (J/kg/K)
+    :param rp: Total water mixing ratio (kg/kg)
+    :param p: Pressure (hPa)
+    :param float s0: First value of reversible entropy (J/kg/K)
+    :param float ds: Spacing of reversible entropy (J/kg/K)
+    :param float r0: First value of total water mixing ratio (kg/kg)
+    :param float dr: Spacing of total water mixing ratio (kg/kg)
+    :param float p0: First value of log of pressure (log(hPa))
+    :param float dp: Spacing of log of pressure
+
+    :returns: `numpy.ndarray` of temperature (K), or NaN for points
+              outside the table or next to points with no solution
+    """
+    s, rp, p = np.broadcast_arrays(np.asarray(s, dtype=float),
+                                   np.asarray(rp, dtype=float),
+                                   np.asarray(p, dtype=float))
+    ns, nr, nq = tab.shape
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x = (s - s0) / ds
+        y = (rp - r0) / dr
+        z = (np.log(p) - p0) / dp
+    inside = ((x >= 0) & (x < ns - 1) & (y >= 0) & (y < nr - 1) &
+              (z >= 0) & (z < nq - 1))
+    x, y, z = (np.where(inside, v, 0.0) for v in (x, y, z))
+    i, j, k = x.astype(int), y.astype(int), z.astype(int)
+    fx, fy, fz = x - i, y - j, z - k
+
+    tl = np.zeros(s.shape)
+    tmin = np.full(s.shape, np.inf)
+    for di, wx in ((0, 1 - fx), (1, fx)):
+        for dj, wy in ((0, 1 - fy), (1, fy)):
+            for dk, wz in ((0, 1 - fz), (1, fz)):
+                c = tab[i + di, j + dj, k + dk]
+                tl += wx * wy * wz * c
+                tmin = np.minimum(tmin, c)
+    return np.where(inside & (tmin > 0.0), tl, np.nan)
+
+
+def correct(tl, s, rp, p):
+    """
+    Apply a single Newton step to the interpolated temperature, as done
+    in the `CAPE` routine.
+
+    :param tl: Interpolated temperature (K)
+    :param s: Reversible entropy (J/kg/K)
+    :param rp: Total water mixing ratio (kg/kg)
+    :param p: Pressure (hPa)
+
+    :returns: corrected temperature (K)
+    """
+    sg, sl = reversibleEntropy(tl, rp, p)
+    return tl + (s - sg) / sl
+
+
+def tableError(tab, npoints=200000, seed=0):
+    """
+    Estimate the error of the table, before and after the Newton step,
+    at random points within the table.
+
+    :param tab: `numpy.ndarray` (NTS, NTR, NTP) of temperature (K)
+    :param int npoints: Number of points to test
+    :param int seed: Seed for the random number generator
+
+    :returns: maximum absolute error (K) of the interpolated and the
+              corrected temperature
+    """
+    rng = np.random.default_rng(seed)
+    s = TS0 + TDS * (NTS - 1) * rng.random(npoints)
+    rp = TR0 + TDR * (NTR - 1) * rng.random(npoints)
+    p = np.exp(TP0 + TDP * (NTP - 1) * rng.random(npoints))
+    with np.errstate(all='ignore'):
+        tl = interpolate(tab, s, rp, p)
+        ok = np.isfinite(tl)
+        s, rp, p, tl = s[ok], rp[ok], p[ok], tl[ok]
+        t = solveTemperature(s, rp, p)
+        ok = t > 0
+        tc = correct(tl, s, rp, p)
+    return (np.max(np.abs(tl - t)[ok], initial=0.0),
+            np.max(np.abs(tc - t)[ok], initial=0.0))
+
+
+def tableKey():
+    """
+    :returns: str hash of the constants and table axes, which is saved
+              with the table and in the name of the default cache file
+    """
+    key = repr((CPD, CL, CPVMCL, RV, RD, EPS, ALV0, TMIN,
+                NTS, TS0, TDS, NTR, TR0, TDR, NTP, TP0, TDP))
+    return hashlib.md5(key.encode()).hexdigest()[:12]
+
+
+def cacheFile(cachedir=CACHEDIR):
+    """
+    Name of the cache file. The name includes a hash of the constants
+    and table axes, so a table built with different values is not used.
+
+    :param str cachedir: Directory for the cache file
+
+    :returns: path to the cache file
+    """
+    return pjoin(cachedir, f'moistadiabat_{tableKey()}.npz')
+
+
+def loadTable(cachefile=None):
+    """
+    Load the table from the cache, building and saving it first if it
+    does not exist, or if it was built with different constants or
+    table axes (see `tableKey`).
+
+    :param str cachefile: Path to the cache file (default `cacheFile()`)
+
+    :returns: `numpy.ndarray` (NTS, NTR, NTP) of temperature (K), and the
+              maximum error (K) of the interpolated temperature
+    """
+    if cachefile is None:
+        cachefile = cacheFile()
+    if isfile(cachefile):
+        LOGGER.debug(f"Loading moist adiabat table from {cachefile}")
+        with np.load(cachefile) as data:
+            if 'key' in data and str(data['key']) == tableKey():
+                return np.asfortranarray(data['tab']), float(data['error'])
+        LOGGER.warning(f"The moist adiabat table in {cachefile} was built "
+                       "with different constants: building it again")
+
+    LOGGER.info("Building moist adiabat table")
+    tab = buildTable()
+    error, corrected = tableError(tab)
+    LOGGER.info(f"Moist adiabat table error: {error:.4f} K interpolated, "
+                f"{corrected:.2e} K after correction")
+    try:
+        os.makedirs(dirname(cachefile), exist_ok=True)
+        tmpfile = f"{cachefile}.{os.getpid()}.npz"
+        np.savez(tmpfile, tab=tab, error=error, corrected=corrected,
+                 key=tableKey())
+        os.replace(tmpfile, cachefile)
+        LOGGER.info(f"Saved moist adiabat table to {cachefile}")
+    except OSError as e:
+        LOGGER.warning(f"Unable to cache moist adiabat table: {e}")
+    return tab, error
+
+
+def useTable(engine, use=True, cachefile=None):
+    """
+    Install the table in a PI engine, or stop the engine using it.
+
+    The engine accepts the interpolated temperature after a single Newton
+    step if the step is smaller than 10 times the maximum interpolation
+    error (and at least 0.05 K); otherwise it falls back to the iterative
+    calculation.
+
+    :param engine: PI engine module (see :mod:`engines`)
+    :param bool use: If False, stop using the table
+    :param str cachefile: Path to the cache file (default `cacheFile()`)
+    """
+    if not use:
+        engine.usematab(0)
+        return
+    tab, error = loadTable(cachefile)
+    ierr = engine.setmatab(tab, TS0, TDS, TR0, TDR, TP0, TDP,
+                           max(10. * error, 0.05))
+    if ierr != 0:
+        raise ValueError("Moist adiabat table does not match the "
+                         f"dimensions expected by {engine.__name__}")
+    LOGGER.info(f"Using moist adiabat table in {engine.__name__} "
+                f"(interpolation error {error:.4f} K)")
@@ -13,6 +13,7 @@
 
 import logging
 
+import netCDF4
 from netCDF4 import Dataset
 import numpy as np
 import time
@@ -43,6 +44,38 @@ def ncLoadFile(filename):
 
     return ncobj
 
+def ncParallelSupport():
+    """
+    :returns: True if the netCDF library can open files for parallel
+              access with MPI-IO (see `ncOpenParallel`)
+    """
+    return bool(getattr(netCDF4, '__has_parallel4_support__', False) or
+                getattr(netCDF4, '__has_pnetcdf_support__', False))
+
+def ncOpenParallel(filename, comm):
+    """
+    Open an existing netCDF file for writing by all processes of an MPI
+    communicator. This must be called (and the file closed) by every
+    process of `comm`. Each process can then write its own part of a
+    variable independently of the others.
+
+    :param str filename: Path to the netCDF file, created (e.g. by
+                         `ncSaveGrid` with `zlib=False`) before the call.
+                         Variables written independently must not be
+                         compressed.
+    :param comm: `mpi4py.MPI.Comm` communicator
+    :return: :class:`netCDF4.Dataset` object
+    :rtype: :class:`netCDF4.Dataset`
+    :raises IOError: if the file cannot be opened
+    """
+    logger.debug("Opening netCDF file %s for parallel writing" % filename)
+    try:
+        ncobj = Dataset(filename, mode='a', parallel=True, comm=comm)
+    except (IOError, RuntimeError, ValueError):
+        logger.exception("Cannot open %s" % filename)
+        raise IOError
+    return ncobj
+
 def ncFileInfo(filename, group=None, variable=None, dimension=None):
     """
     Print summary information about a netCDF file.
@@ -300,7 +333,9 @@ def ncSaveGrid(filename, dimensions, variables, nodata=-9999,
                              ...}
 
         The value for the 'dims' key must be a tuple that is a subset of
-        the dimensions specified above.
+        the dimensions specified above. A variable may also include a
+        'fill_value' key, to use in place of `nodata` (e.g. for integer
+        variables that cannot hold the value of `nodata`).
 
     :param float nodata: Value to assign to missing data, default is -9999.
     :param str datatitle: Optional title to give the stored dataset.
@@ -367,13 +402,17 @@ def ncSaveGrid(filename, dimensions, variables, nodata=-9999,
             varlsd = v['least_significant_digit']
         else:
             varlsd = lsd
+        if 'fill_value' in v:
+            varfill = v['fill_value']
+        else:
+            varfill = nodata
 
         var = ncobj.createVariable(v['name'], v['dtype'],
                                    v['dims'],
                                    zlib=zlib,
                                    complevel=complevel,
                                    least_significant_digit=varlsd,
-                                   fill_value=nodata)
+                                   fill_value=varfill)
 
         if (writedata and v['values'] is not None):
             var[:] = np.array(v['values'], dtype=v['dtype'])
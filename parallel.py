@@ -11,13 +11,18 @@
                the real thing or, if the required modules are 
                not available, dummy functions that pass straight 
                through. 
-               We base our parallel processing on :term:`mpi4py`
+               We base our parallel processing on :term:`mpi4py`.
+               Without it, a pool of processes on a single node can
+               share arrays through shared memory (see `shareArray`)
 
 .. moduleauthor: Craig Arthur, <craig.arthur@ga.gov.au>
 
 """
 
 from functools import wraps
+from multiprocessing import shared_memory
+
+import numpy as np
 
 class DummyStatus(object):
     """
@@ -128,3 +133,104 @@ def disableOnWorkers(f):
         else:
             return f(*args, **kwargs)
     return wrap
+
+
+def tileType(array, tile):
+    """
+    Create the MPI datatype of a tile of an array, so that the tile can
+    be received directly into the array (see `recvArrays`), rather than
+    into a buffer that is then copied.
+
+    :param array: C-contiguous `numpy.ndarray` of shape (..., ny, nx)
+    :param tuple tile: (`slice`, `slice`) of the last two dimensions.
+                       Leading dimensions are included in full
+
+    :returns: committed `mpi4py.MPI.Datatype`, to be freed by the caller
+    """
+    from mpi4py.util.dtlib import from_numpy_dtype
+    ys, xs = tile
+    sizes = list(array.shape)
+    subsizes = sizes[:-2] + [ys.stop - ys.start, xs.stop - xs.start]
+    starts = [0] * (len(sizes) - 2) + [ys.start, xs.start]
+    datatype = from_numpy_dtype(array.dtype).Create_subarray(sizes, subsizes,
+                                                            starts)
+    datatype.Commit()
+    return datatype
+
+
+def sendArrays(comm, arrays, dest, tag):
+    """
+    Send arrays as typed buffers, without pickling them.
+
+    :param comm: MPI communicator
+    :param arrays: sequence of `numpy.ndarray`, of the types expected by
+                   the receiving process
+    :param int dest: Rank of the receiving process
+    :param int tag: Message tag
+    """
+    for array in arrays:
+        comm.Send(np.ascontiguousarray(array), dest=dest, tag=tag)
+
+
+def recvArrays(comm, arrays, datatypes, source, tag):
+    """
+    Receive arrays sent by `sendArrays` directly into the memory of
+    existing arrays.
+
+    :param comm: MPI communicator
+    :param arrays: sequence of C-contiguous `numpy.ndarray` to receive
+                   into
+    :param datatypes: sequence of the `mpi4py.MPI.Datatype` of the part of
+                      each array received (see `tileType`), or None to
+                      receive the whole array
+    :param int source: Rank of the sending process
+    :param int tag: Message tag
+    """
+    for array, datatype in zip(arrays, datatypes):
+        if datatype is None:
+            comm.Recv(array, source=source, tag=tag)
+        else:
+            comm.Recv([array, 1, datatype], source=source, tag=tag)
+
+
+def shareArray(array):
+    """
+    Copy an array to a new block of shared memory, so that the processes
+    of a pool can use it without it being pickled (see `attachArray`).
+
+    :param array: `numpy.ndarray` to share
+
+    :returns: the `multiprocessing.shared_memory.SharedMemory` block, to
+              be released with `releaseArrays`, and the (name, shape,
+              dtype) of the array, to be passed to `attachArray`
+    """
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+
+def attachArray(spec):
+    """
+    Attach to an array shared by `shareArray`. The block must be closed
+    by the caller once the array is no longer used.
+
+    :param tuple spec: (name, shape, dtype) of the array
+
+    :returns: the `multiprocessing.shared_memory.SharedMemory` block and
+              the `numpy.ndarray` in it
+    """
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def releaseArrays(blocks):
+    """
+    Release blocks of shared memory created by `shareArray`, once the
+    processes that use them are finished with them.
+
+    :param blocks: sequence of `multiprocessing.shared_memory.SharedMemory`
+    """
+    for shm in blocks:
+        shm.close()
+        shm.unlink()
@@ -1,5 +1,20 @@
       SUBROUTINE PCMIN(SST,PSL,P,T,R,NA,N,PMIN,VMAX,IFL)
 C
+C   ***   Calculate maximum wind speed and minimum central pressure   ***
+C   ***   for a single sounding, starting the minimum pressure        ***
+C   ***   iteration from the default first guess of 950 mb. See      ***
+C   ***             PCMINW for a description of the arguments.        ***
+C
+Cf2py intent(out) PMIN,VMAX,IFL
+       REAL T(NA), P(NA), R(NA)
+       CALL PCMINW(SST,PSL,P,T,R,NA,N,950.0,0,PMIN,VMAX,IFL,NP,PMC,
+     1             TO,OTL,NCMAX)
+       RETURN
+       END
+C
+      SUBROUTINE PCMINW(SST,PSL,P,T,R,NA,N,PMI,ISOLV,
+     1                  PMIN,VMAX,IFL,NP,PMC,TO,OTL,NCMAX)
+C
 C   Revised on 9/24/2005 to fix convergence problems at high pressure
 C
 C   ***   This subroutine calculates the maximum wind speed        ***
@@ -27,6 +42,32 @@ C
 C           N:  The actual number of points in the sounding
 C                (N is less than or equal to NA)
 C
+C           PMI: First guess for the minimum pressure iteration (mb),
+C                e.g. the value of PMC from the previous time or a
+C                neighbouring point. Values below 400 mb (or NaN) are
+C                replaced with the default first guess of 950 mb.
+C
+C           ISOLV: Method used to solve for the minimum pressure:
+C                0 = fixed-point iteration (the original method);
+C                1 = safeguarded secant iteration. The secant step is
+C                replaced by bisection if it falls outside the bracket
+C                of the root found so far, and steps below 400 mb are
+C                limited to 400 mb, so that a hypercane (no solution
+C                above 400 mb) is detected within a few iterations.
+C                Both methods use the same convergence test (0.2 mb),
+C                and stop with IFL=0 as soon as an iterate falls below
+C                400 mb, or after 1000 iterations in all (100 for the
+C                secant iteration, including any fixed-point iterations
+C                after a restart, as the fixed-point iteration takes
+C                no more than a few tens of iterations when it
+C                converges at all). If the
+C                iterates either side of the solution are less than
+C                0.2 mb apart without converging (as happens when the
+C                solution falls on a discontinuity at a sounding
+C                level), or the secant iteration has not converged
+C                after 50 iterations, the fixed-point iteration is
+C                started again from the first guess.
+C
 C  OUTPUT:  PMIN is the minimum central pressure, in mb
 C
 C           VMAX is the maximum surface wind speed, in m/s
@@ -36,61 +77,198 @@ C           IFL is a flag: A value of 1 means OK; a value of 0
 C              indicates no convergence (hypercane); a value of 2
 C              means that the CAPE routine failed.
 C
+C           NP is the number of iterations of the minimum pressure
+C              calculation
+C
+C           PMC is the final value of the minimum pressure iteration,
+C              in mb. Note this is not the same as PMIN, which uses a
+C              different factor for the eye profile (see CATFAC).
+C
+C           TO is the outflow temperature (K): the temperature at the
+C              level of neutral buoyancy of a saturated parcel lifted
+C              from the radius of maximum winds, at the last iteration.
+C
+C           OTL is the pressure of the outflow level (mb), from the
+C              same CAPE calculation as TO.
+C
+C           NCMAX is the largest number of iterations taken by the
+C              CAPE routine to find the lifted parcel temperature at
+C              any level, over all calls for the sounding.
+C
+C   The sounding arrays are not modified: the sounding is converted
+C   to Kelvin and gm/gm in work arrays (see PREPCOL) which are shared
+C   by all calls to CAPE.
+C
 C-----------------------------------------------------------------------------
+Cf2py intent(out) PMIN,VMAX,IFL,NP,PMC,TO,OTL,NCMAX
        REAL T(NA), P(NA), R(NA)
+       REAL TK(NA),RK(NA),TV(NA),PAR(5)
+C
+       CALL DEFPAR(PAR)
+       CALL PREPCOL(T,R,1,NA,N,1,TK,RK,TV)
+       JTOP=LEVTOP(P,N)
+       CALL PCMINK(SST,PSL,P,TK,RK,TV,NA,N,JTOP,PMI,ISOLV,PAR,
+     1             PMIN,VMAX,IFL,NP,PMC,TO,OTL,NCMAX)
+       RETURN
+       END
+C
+      SUBROUTINE PREPCOL(T,R,NCOL,NA,N,I,TK,RK,TV)
+C
+C   ***   Per-column precomputation shared by all calls to CAPE    ***
+C   ***                 for the sounding in row I                  ***
+C
+C  INPUT:   T,R: Two-dimensional arrays of dimension (NCOL,NA)
+C             containing temperature (C) and mixing ratio (g/kg), as
+C             described in PCMINV. A single sounding can be passed
+C             with NCOL=1 and I=1.
+C
+C  OUTPUT:  TK,RK,TV: One-dimensional arrays of dimension NA
+C             containing temperature (K), mixing ratio (gm/gm) and
+C             environmental virtual temperature (K).
+C
+       REAL T(NCOL,NA),R(NCOL,NA)
+       REAL TK(NA),RK(NA),TV(NA)
+C
+       EPS=287.04/461.5
+       DO 10 J=1,N
+        TK(J)=T(I,J)+273.15
+        RK(J)=R(I,J)*0.001
+        TV(J)=TK(J)*(1.+RK(J)/EPS)/(1.+RK(J))
+   10       CONTINUE
+       RETURN
+       END
+C
+      INTEGER FUNCTION LEVTOP(P,N)
+C
+C   ***   The highest of the first N levels of the pressure array   ***
+C   ***   P (mb) at or below 59 mb. Parcels are not lifted above    ***
+C   ***                      this level.                            ***
+C
+       REAL P(N)
+C
+       LEVTOP=0
+       DO 10 J=1,N
+        IF(P(J).GE.59.0)LEVTOP=J
+   10       CONTINUE
+       RETURN
+       END
+C
+      SUBROUTINE DEFPAR(PAR)
+C
+C   ***   Default values of the adjustable parameters, in the order   ***
+C   ***     used by PCMINK and PCSWEEP: CKCD, SIG, IDISS, b, VREDUC   ***
+C
+       REAL PAR(5)
 C
 C   ***   Adjustable constant: Ratio of C_k to C_D    ***
 C
-       CKCD=0.9
+       PAR(1)=0.9
 C
 C   ***   Adjustable constant for buoyancy of displaced parcels:  ***
 C   ***    0=Reversible ascent;  1=Pseudo-adiabatic ascent        ***
 C
-       SIG=0.0
+       PAR(2)=0.0
 C
 C   ***  Adjustable switch: if IDISS = 0, no dissipative heating is   ***
 C   ***     allowed; otherwise, it is                                 ***
 C
-       IDISS=1
+       PAR(3)=1.0
 C
 C   ***  Exponent, b, in assumed profile of azimuthal velocity in eye,   ***
 C   ***   V=V_m(r/r_m)^b. Used only in calculation of central pressure   ***
 C
-       b=2.0
-C
-C   *** Set level from which parcels lifted   ***
-C
-       NK=1
+       PAR(4)=2.0
 C
 C   *** Factor to reduce gradient wind to 10 m wind
 C
-       VREDUC=0.8
+       PAR(5)=0.8
+       RETURN
+       END
 C
-C   ***   Normalize certain quantities   ***
+      SUBROUTINE PCMINK(SST,PSL,P,T,R,TV,NA,N,JTOP,PMI,ISOLV,PAR,
+     1                  PMIN,VMAX,IFL,NP,PMC,TO,OTL,NCMAX)
 C
-       SSTK=SST+273.15
-       ES0=6.112*EXP(17.67*SST/(243.5+SST))
-       DO 40 I=1,N
-        R(I)=R(I)*0.001
-        T(I)=T(I)+273.15
-   40       CONTINUE
+C   ***   Minimum pressure and maximum wind speed for a sounding   ***
+C   ***   prepared by PREPCOL: T in K, R in gm/gm, TV the          ***
+C   ***   environmental virtual temperature (K) and JTOP the       ***
+C   ***   highest level to which parcels are lifted. PAR holds     ***
+C   ***   the adjustable parameters (see DEFPAR). Other            ***
+C   ***   arguments are as described in PCMINW.                    ***
 C
-C   ***   Default values   ***
+       REAL T(NA), P(NA), R(NA), TV(NA), PAR(5)
 C
-      VMAX=0.0
-       PMIN=PSL 
-       IFL=1
+C   *** Set level from which parcels lifted   ***
 C
-       NP=0
-       PM=950.0
+       NK=1
 C
 C   ***   Find environmental CAPE *** 
 C
+      IFL=1
       TP=T(NK)
       RP=R(NK)
       PP=P(NK)
-      CALL CAPE(TP,RP,PP,T,R,P,NA,N,SIG,CAPEA,TOA,IFLAG)
+      CALL CAPE(TP,RP,PP,T,TV,P,NA,N,JTOP,PAR(2),CAPEA,TOA,PNBA,NCMAX,
+     1          IFLAG)
       IF(IFLAG.NE.1)IFL=2
+C
+      CALL PCITER(SST,PSL,P,T,R,TV,NA,N,JTOP,PMI,ISOLV,PAR,CAPEA,
+     1            IFL,NP,PMC,CAPEM,CAPEMS,RAT,TVAV,TO,OTL,NCMAX)
+      CALL PCFIN(PSL,PAR,CAPEA,CAPEM,CAPEMS,RAT,TVAV,IFL,PMIN,VMAX)
+C
+       RETURN
+       END
+C
+      SUBROUTINE PCITER(SST,PSL,P,T,R,TV,NA,N,JTOP,PMI,ISOLV,PAR,
+     1                  CAPEA,IFL,NP,PMC,CAPEM,CAPEMS,RAT,TVAV,
+     2                  TO,OTL,NCMAX)
+C
+C   ***   Iteration to find the minimum pressure for a sounding    ***
+C   ***   prepared by PREPCOL, given the environmental CAPE,       ***
+C   ***   CAPEA. Only CKCD, SIG and IDISS in PAR are used.         ***
+C
+C  INPUT:   IFL: 1, or 2 if the CAPE routine has already failed
+C
+C           NCMAX: Largest number of iterations taken by the CAPE
+C             routine for the environmental CAPE
+C
+C  OUTPUT:  IFL: Set to 0 if the iteration did not converge, and to
+C             2 if the CAPE routine failed
+C
+C           NP, PMC: As described in PCMINW
+C
+C           CAPEM, CAPEMS, RAT, TVAV: CAPE and saturation CAPE at the
+C             radius of maximum winds, the dissipative heating factor
+C             and the mean virtual temperature from the last
+C             iteration, as used by PCFIN
+C
+C           TO, OTL: As described in PCMINW
+C
+C           NCMAX: Updated with the CAPE calls of the iteration
+C
+       REAL T(NA), P(NA), R(NA), TV(NA), PAR(5)
+C
+       CKCD=PAR(1)
+       SIG=PAR(2)
+       IDISS=NINT(PAR(3))
+       NK=1
+C
+C   ***   Normalize certain quantities   ***
+C
+       SSTK=SST+273.15
+       ES0=6.112*EXP(17.67*SST/(243.5+SST))
+C
+       NP=0
+       ISOL=ISOLV
+       MAXIT=1000
+       IF(ISOLV.EQ.1)MAXIT=100
+       IFLS=IFL
+       PM=950.0
+       IF(PMI.GE.400.0)PM=PMI
+       PM0=PM
+       PLO=0.0
+       PHI=1.0E4
+       PMO=PM
+       FO=0.0
 C
 C   ***   Begin iteration to find mimimum pressure   ***
 C
@@ -101,17 +279,19 @@ C
       TP=T(NK)
       PP=MIN(PM,1000.0)
       RP=0.622*R(NK)*PSL/(PP*(0.622+R(NK))-R(NK)*PSL)
-      CALL CAPE(TP,RP,PP,T,R,P,NA,N,SIG,CAPEM,TOM,IFLAG) 
+      CALL CAPE(TP,RP,PP,T,TV,P,NA,N,JTOP,SIG,CAPEM,TOM,PNBM,NCM,IFLAG) 
       IF(IFLAG.NE.1)IFL=2
+      NCMAX=MAX(NCMAX,NCM)
 C
 C  ***  Find saturation CAPE at radius of maximum winds   ***
 C
       TP=SSTK
       PP=MIN(PM,1000.0)
       RP=0.622*ES0/(PP-ES0)
-      CALL CAPE(TP,RP,PP,T,R,P,NA,N,SIG,CAPEMS,TOMS,IFLAG)
+      CALL CAPE(TP,RP,PP,T,TV,P,NA,N,JTOP,SIG,CAPEMS,TO,OTL,NCM,IFLAG)
       IF(IFLAG.NE.1)IFL=2
-      RAT=SSTK/TOMS
+      NCMAX=MAX(NCMAX,NCM)
+      RAT=SSTK/TO
       IF(IDISS.EQ.0)RAT=1.0     
 C
 C  ***  Initial estimate of minimum pressure   ***
@@ -127,55 +307,770 @@ C
 C   ***  Test for convergence   ***
 C
        IF(ABS(PNEW-PM).GT.0.2)THEN
-        PM=PNEW
         NP=NP+1
-        IF(NP.GT.1000.OR.PM.LT.400.0)THEN
-         PMIN=PSL
+        IF(NP.GT.MAXIT.OR.PNEW.LT.400.0)THEN
+         PM=PNEW
          IFL=0
          GOTO 900
         END IF
+        IF(ISOL.EQ.1)THEN
+C
+C   ***  Bracket the solution of F=PNEW-PM=0 by PLO (F>0) and    ***
+C   ***   PHI (F<0). If the bracket is narrower than the         ***
+C   ***   convergence tolerance, or the secant iteration stalls, ***
+C   ***   start again from the first guess with the fixed-point  ***
+C   ***                         iteration                        ***
+C
+         F=PNEW-PM
+         IF(F.GT.0.0)PLO=MAX(PLO,PM)
+         IF(F.LT.0.0)PHI=MIN(PHI,PM)
+         IF(PHI-PLO.LT.0.2.OR.NP.GT.50)THEN
+          ISOL=0
+          IFL=IFLS
+          PM=PM0
+          GOTO 100
+         END IF
+C
+C   ***  Secant step, replaced by bisection outside the bracket  ***
+C
+         PSEC=PNEW
+         IF(NP.GT.1.AND.F.NE.FO)PSEC=PM-F*(PM-PMO)/(F-FO)
+         PMO=PM
+         FO=F
+         IF(PLO.GT.0.0.AND.PHI.LT.1.0E4)THEN
+          IF(PSEC.LE.PLO.OR.PSEC.GE.PHI)PSEC=0.5*(PLO+PHI)
+         ELSE
+          PSEC=MIN(MAX(PSEC,400.0),PSL)
+         END IF
+         PM=PSEC
+        ELSE
+         PM=PNEW
+        END IF
         GOTO 100
-       ELSE
+       END IF
+  900       CONTINUE
+       PMC=PM
+C
+       RETURN
+       END
+C
+      SUBROUTINE PCFIN(PSL,PAR,CAPEA,CAPEM,CAPEMS,RAT,TVAV,IFL,
+     1                 PMIN,VMAX)
+C
+C   ***   Minimum central pressure and maximum wind speed from    ***
+C   ***   the last iteration of PCITER. Only CKCD, b and VREDUC   ***
+C   ***    in PAR are used. If the iteration did not converge     ***
+C   ***               (IFL=0), PMIN is set to PSL.                ***
+C
+       REAL PAR(5)
+C
+       CKCD=PAR(1)
+       b=PAR(4)
+       VREDUC=PAR(5)
+C
+       PMIN=PSL
+       IF(IFL.NE.0)THEN
         CATFAC=0.5*(1.+1./b)
 C        CAT=CKCD*RAT*CATFAC*(CAPEMS-CAPEM)
         CAT=CAPEM-CAPEA+CKCD*RAT*CATFAC*(CAPEMS-CAPEM)
         CAT=MAX(CAT,0.0)
         PMIN=PSL*EXP(-CAT/(287.04*TVAV))
        END IF
-  900       CONTINUE
        FAC=MAX(0.0,(CAPEMS-CAPEM))
        VMAX=VREDUC*SQRT(CKCD*RAT*FAC)
 C
-C   ***  Renormalize sounding arrays   ***
-C       
-       DO 910 I=1,N
-        R(I)=R(I)*1000.0
-        T(I)=T(I)-273.15
-  910       CONTINUE
+       RETURN
+       END
+C
+      SUBROUTINE PCTLK(SST,PSL,P,T,R,TV,NA,N,JTOP,PAR,DT,PMC,IFL,
+     1                 DPDS,DVDS,DPDT,DVDT)
+C
+C   ***   Tangent linear of PCMINK: the derivatives of the minimum   ***
+C   ***   central pressure and the maximum wind speed with respect   ***
+C   ***   to the SST and to a perturbation of the temperature of     ***
+C   ***           the sounding, at the solution of PCMINK.           ***
+C
+C  INPUT:   SST,PSL,P,T,R,TV,NA,N,JTOP,PAR: As described in PCMINK.
+C
+C           DT: One-dimensional array of dimension NA containing the
+C             perturbation of the temperature (K) at each level, e.g.
+C             1 in a layer and 0 elsewhere. The mixing ratio is held
+C             fixed.
+C
+C           PMC, IFL: The final value of the minimum pressure iteration
+C             and the flag returned by PCMINK.
+C
+C  OUTPUT:  DPDS, DVDS: The derivatives of PMIN (mb/K) and VMAX
+C             (m/s/K) with respect to the SST.
+C
+C           DPDT, DVDT: The derivatives of PMIN (mb) and VMAX (m/s)
+C             along DT.
+C
+C   The CAPE calculations of the last iteration of PCITER are repeated
+C   with their tangent linear (see CAPETL), in three directions: the
+C   SST, the temperature of the sounding and the minimum pressure PM.
+C   The iteration solves PM=G(PM), so the derivative of PM with respect
+C   to an input X is (dG/dX)/(1-dG/dPM), and the iteration itself is
+C   not differentiated. The derivatives are zero unless IFL is 1.
+C
+       REAL T(NA), P(NA), R(NA), TV(NA), PAR(5), DT(NA)
+       REAL DTE(NA,3),DTVE(NA,3),DTP(3),DRP(3),DPP(3)
+       REAL DCA(3),DTOA(3),DCM(3),DTOM(3),DCMS(3),DTO(3)
+       REAL DRAT(3),DTVAV(3),DCAT(3),DG(3),DPM(2),DQ(2,2)
+C
+       DPDS=0.0
+       DVDS=0.0
+       DPDT=0.0
+       DVDT=0.0
+       IF(IFL.NE.1)RETURN
+       CKCD=PAR(1)
+       SIG=PAR(2)
+       IDISS=NINT(PAR(3))
+       b=PAR(4)
+       VREDUC=PAR(5)
+       NK=1
+       EPS=287.04/461.5
+C
+C   ***   Directions: 1 = SST, 2 = temperature of the sounding,   ***
+C   ***             3 = minimum pressure of the iteration          ***
+C
+       DO 10 J=1,N
+        DTE(J,1)=0.0
+        DTE(J,2)=DT(J)
+        DTE(J,3)=0.0
+        DTVE(J,1)=0.0
+        DTVE(J,2)=DT(J)*(1.+R(J)/EPS)/(1.+R(J))
+        DTVE(J,3)=0.0
+   10       CONTINUE
+C
+C   ***   Environmental CAPE   ***
+C
+       DO 20 K=1,3
+        DTP(K)=DTE(NK,K)
+        DRP(K)=0.0
+        DPP(K)=0.0
+   20       CONTINUE
+       CALL CAPETL(T(NK),R(NK),P(NK),T,TV,P,NA,N,JTOP,SIG,3,DTP,DRP,
+     1             DPP,DTE,DTVE,CAPEA,TOA,DCA,DTOA,IFLAG)
+C
+C   ***   CAPE at radius of maximum winds   ***
+C
+       SSTK=SST+273.15
+       ES0=6.112*EXP(17.67*SST/(243.5+SST))
+       DES0=ES0*17.67*243.5/(243.5+SST)**2
+       PP=MIN(PMC,1000.0)
+       DPDM=1.0
+       IF(PMC.GT.1000.0)DPDM=0.0
+       RP=0.622*R(NK)*PSL/(PP*(0.622+R(NK))-R(NK)*PSL)
+       DRP(3)=-RP*(0.622+R(NK))*DPDM/(PP*(0.622+R(NK))-R(NK)*PSL)
+       DPP(3)=DPDM
+       CALL CAPETL(T(NK),RP,PP,T,TV,P,NA,N,JTOP,SIG,3,DTP,DRP,DPP,
+     1             DTE,DTVE,CAPEM,TOM,DCM,DTOM,IFLAG)
+C
+C   ***   Saturation CAPE at radius of maximum winds   ***
+C
+       RS0=0.622*ES0/(PP-ES0)
+       DTP(1)=1.0
+       DTP(2)=0.0
+       DTP(3)=0.0
+       DRP(1)=0.622*PP*DES0/(PP-ES0)**2
+       DRP(2)=0.0
+       DRP(3)=-RS0*DPDM/(PP-ES0)
+       CALL CAPETL(SSTK,RS0,PP,T,TV,P,NA,N,JTOP,SIG,3,DTP,DRP,DPP,
+     1             DTE,DTVE,CAPEMS,TO,DCMS,DTO,IFLAG)
+C
+C   ***   Dissipative heating factor and mean virtual temperature   ***
+C
+       RAT=SSTK/TO
+       TV1=T(1)*(1.+R(1)/0.622)/(1.+R(1))
+       FV=(1.+RS0/0.622)/(1.+RS0)
+       TVAV=0.5*(TV1+SSTK*FV)
+       DO 30 K=1,3
+        DRAT(K)=-RAT*DTO(K)/TO
+        IF(IDISS.EQ.0)DRAT(K)=0.0
+        DTVAV(K)=0.5*SSTK*(1./0.622-1.)*DRP(K)/(1.+RS0)**2
+   30       CONTINUE
+       IF(IDISS.EQ.0)THEN
+        RAT=1.0
+       ELSE
+        DRAT(1)=DRAT(1)+1.0/TO
+       END IF
+       DTVAV(1)=DTVAV(1)+0.5*FV
+       DTVAV(2)=DTVAV(2)+0.5*DT(1)*(1.+R(1)/0.622)/(1.+R(1))
+C
+C   ***   Derivatives of G, the new estimate of the minimum    ***
+C   ***   pressure, and of the solution PM=G(PM)               ***
+C
+       CAT=CAPEM-CAPEA+0.5*CKCD*RAT*(CAPEMS-CAPEM)
+       DO 40 K=1,3
+        DCAT(K)=DCM(K)-DCA(K)+0.5*CKCD*(DRAT(K)*(CAPEMS-CAPEM)+
+     1          RAT*(DCMS(K)-DCM(K)))
+        IF(CAT.LE.0.0)DCAT(K)=0.0
+   40       CONTINUE
+       CAT=MAX(CAT,0.0)
+       G=PSL*EXP(-CAT/(287.04*TVAV))
+       DO 45 K=1,3
+        DG(K)=-G*(DCAT(K)-CAT*DTVAV(K)/TVAV)/(287.04*TVAV)
+   45       CONTINUE
+C
+C   ***   Minimum central pressure and maximum wind speed, as in  ***
+C   ***   PCFIN, and their total derivatives for the SST (K=1)    ***
+C   ***          and the temperature of the sounding (K=2)        ***
+C
+       CATFAC=0.5*(1.+1./b)
+       CAT=CAPEM-CAPEA+CKCD*RAT*CATFAC*(CAPEMS-CAPEM)
+       PMIN=PSL*EXP(-CAT/(287.04*TVAV))
+       FAC=MAX(0.0,(CAPEMS-CAPEM))
+       VMAX=VREDUC*SQRT(CKCD*RAT*FAC)
+       DO 50 K=1,2
+        DPM(K)=DG(K)/(1.0-DG(3))
+        DCAK=DCA(K)+DCA(3)*DPM(K)
+        DCMK=DCM(K)+DCM(3)*DPM(K)
+        DCMSK=DCMS(K)+DCMS(3)*DPM(K)
+        DRATK=DRAT(K)+DRAT(3)*DPM(K)
+        DTVAVK=DTVAV(K)+DTVAV(3)*DPM(K)
+        DCATK=DCMK-DCAK+CKCD*CATFAC*(DRATK*(CAPEMS-CAPEM)+
+     1        RAT*(DCMSK-DCMK))
+        DQ(1,K)=0.0
+        IF(CAT.GT.0.0)
+     1   DQ(1,K)=-PMIN*(DCATK-CAT*DTVAVK/TVAV)/(287.04*TVAV)
+        DQ(2,K)=0.0
+        IF(VMAX.GT.0.0)DQ(2,K)=0.5*VMAX*(DRATK/RAT+(DCMSK-DCMK)/FAC)
+   50       CONTINUE
+       DPDS=DQ(1,1)
+       DVDS=DQ(2,1)
+       DPDT=DQ(1,2)
+       DVDT=DQ(2,2)
+C
+       RETURN
+       END
+C
+      SUBROUTINE PCMINS(SST,PSL,P,T,R,TV,NA,N,JTOP,PMI,ISOLV,NPAR,PAR,
+     1                  PMIN,VMAX,IFL,NP,PMC,TO,OTL,NCMAX)
+C
+C   ***   As PCMINK, for NPAR sets of the adjustable parameters   ***
+C
+C  PAR(5,NPAR) holds CKCD, SIG, IDISS, b and VREDUC for each set (see
+C  DEFPAR), and PMIN, VMAX, IFL, NP, PMC, TO, OTL and NCMAX are
+C  arrays of dimension NPAR. The environmental CAPE depends only on SIG, so is calculated
+C  once for each value of SIG. The minimum pressure iteration depends
+C  only on CKCD, SIG and IDISS, so sets that differ only in b or VREDUC
+C  share the iteration.
+C
+       REAL T(NA), P(NA), R(NA), TV(NA), PAR(5,NPAR)
+       REAL PMIN(NPAR), VMAX(NPAR), PMC(NPAR), TO(NPAR), OTL(NPAR)
+       INTEGER IFL(NPAR), NP(NPAR), NCMAX(NPAR)
+       REAL CAPEA(NPAR),CAPEM(NPAR),CAPEMS(NPAR),RAT(NPAR),TVAV(NPAR)
+       INTEGER IFLA(NPAR),NCA(NPAR)
+C
+       NK=1
+       DO 20 K=1,NPAR
+C
+C   ***   Find an earlier set with the same SIG (JS), and with the   ***
+C   ***              same CKCD, SIG and IDISS (JI)                   ***
+C
+        JS=0
+        JI=0
+        DO 10 J=K-1,1,-1
+         IF(PAR(2,J).EQ.PAR(2,K))THEN
+          JS=J
+          IF(PAR(1,J).EQ.PAR(1,K).AND.PAR(3,J).EQ.PAR(3,K))JI=J
+         END IF
+   10        CONTINUE
+C
+        IF(JI.GT.0)THEN
+         CAPEA(K)=CAPEA(JI)
+         IFLA(K)=IFLA(JI)
+         NCA(K)=NCA(JI)
+         IFL(K)=IFL(JI)
+         NP(K)=NP(JI)
+         PMC(K)=PMC(JI)
+         CAPEM(K)=CAPEM(JI)
+         CAPEMS(K)=CAPEMS(JI)
+         RAT(K)=RAT(JI)
+         TVAV(K)=TVAV(JI)
+         TO(K)=TO(JI)
+         OTL(K)=OTL(JI)
+         NCMAX(K)=NCMAX(JI)
+        ELSE
+         IF(JS.GT.0)THEN
+          CAPEA(K)=CAPEA(JS)
+          IFLA(K)=IFLA(JS)
+          NCA(K)=NCA(JS)
+         ELSE
+          TP=T(NK)
+          RP=R(NK)
+          PP=P(NK)
+          CALL CAPE(TP,RP,PP,T,TV,P,NA,N,JTOP,PAR(2,K),CAPEA(K),TOA,
+     1              PNBA,NCA(K),IFLA(K))
+         END IF
+         IFL(K)=1
+         IF(IFLA(K).NE.1)IFL(K)=2
+         NCMAX(K)=NCA(K)
+         CALL PCITER(SST,PSL,P,T,R,TV,NA,N,JTOP,PMI,ISOLV,PAR(1,K),
+     1               CAPEA(K),IFL(K),NP(K),PMC(K),CAPEM(K),CAPEMS(K),
+     2               RAT(K),TVAV(K),TO(K),OTL(K),NCMAX(K))
+        END IF
+        CALL PCFIN(PSL,PAR(1,K),CAPEA(K),CAPEM(K),CAPEMS(K),RAT(K),
+     1             TVAV(K),IFL(K),PMIN(K),VMAX(K))
+   20       CONTINUE
+C
+       RETURN
+       END
+C
+      SUBROUTINE PCMINV(SST,PSL,P,T,R,NCOL,NA,N,PMINIT,ISOLV,
+     1                  PMIN,VMAX,IFL,NITER,PMC,TO,OTL,NCMAX)
+C
+C   ***   Batched version of PCMIN: calculates the maximum wind    ***
+C   ***   speed and minimum central pressure for NCOL soundings    ***
+C   ***                      in a single call.                     ***
+C
+C  INPUT:   SST: One-dimensional array of dimension NCOL containing
+C             sea surface temperature in C
+C
+C           PSL: One-dimensional array of dimension NCOL containing
+C             sea level pressure (mb)
+C
+C           P,T,R: Two-dimensional arrays of dimension (NCOL,NA)
+C             containing pressure (mb), temperature (C),
+C             and mixing ratio (g/kg). Each row is a sounding,
+C             arranged as described in PCMIN (lowest index is the
+C             lowest model level).
+C
+C           NCOL: The number of soundings
+C
+C           NA: The second dimension of P,T and R
+C
+C           N:  The actual number of points in each sounding
+C                (N is less than or equal to NA)
+C
+C           PMINIT: One-dimensional array of dimension NCOL containing
+C             the first guess for the minimum pressure iteration (mb),
+C             e.g. PMC from a previous call. Optional in the Python
+C             interface (default 950 mb).
+C
+C           ISOLV: Method used to solve for the minimum pressure (see
+C             PCMINW). Optional in the Python interface (default 0).
+C
+C  OUTPUT:  PMIN, VMAX, IFL: One-dimensional arrays of dimension NCOL,
+C             with the same meaning as in PCMIN.
+C
+C           NITER: One-dimensional array of dimension NCOL containing
+C             the number of iterations of the minimum pressure
+C             calculation for each sounding.
+C
+C           PMC: One-dimensional array of dimension NCOL containing
+C             the final value of the minimum pressure iteration (mb).
+C
+C           TO, OTL, NCMAX: One-dimensional arrays of dimension NCOL
+C             containing the outflow temperature (K), the pressure of
+C             the outflow level (mb) and the largest number of
+C             iterations taken by the CAPE routine (see PCMINW).
+C
+C   The input arrays are not modified. Each sounding is converted to
+C   contiguous work arrays by PREPCOL before calling PCMINK. If all
+C   soundings are on the same pressure levels, use PCMINP instead.
+C
+C   When compiled with OpenMP, the loop over soundings is shared
+C   between threads (see SETNTHREADS), and the Python wrapper releases
+C   the GIL for the duration of the call.
+C
+C-----------------------------------------------------------------------------
+Cf2py threadsafe
+Cf2py intent(in) SST,PSL,P,T,R
+Cf2py intent(out) PMIN,VMAX,IFL,NITER,PMC,TO,OTL,NCMAX
+Cf2py integer intent(hide),depend(T) :: NCOL=shape(T,0)
+Cf2py integer intent(hide),depend(T) :: NA=shape(T,1)
+Cf2py integer optional,depend(T) :: N=shape(T,1)
+Cf2py real optional,intent(in),dimension(NCOL),depend(NCOL) :: PMINIT=950.
+Cf2py integer optional,intent(in) :: ISOLV=0
+       INTEGER NCOL,NA,N,ISOLV
+       REAL SST(NCOL),PSL(NCOL),PMINIT(NCOL)
+       REAL P(NCOL,NA),T(NCOL,NA),R(NCOL,NA)
+       REAL PMIN(NCOL),VMAX(NCOL),PMC(NCOL),TO(NCOL),OTL(NCOL)
+       INTEGER IFL(NCOL),NITER(NCOL),NCMAX(NCOL)
+       REAL PC(NA),TK(NA),RK(NA),TV(NA),PAR(5)
+C
+       CALL DEFPAR(PAR)
+C$OMP PARALLEL DO PRIVATE(I,J,JTOP,PC,TK,RK,TV) SCHEDULE(DYNAMIC,16)
+       DO 20 I=1,NCOL
+        DO 10 J=1,N
+         PC(J)=P(I,J)
+   10        CONTINUE
+        JTOP=LEVTOP(PC,N)
+        CALL PREPCOL(T,R,NCOL,NA,N,I,TK,RK,TV)
+        CALL PCMINK(SST(I),PSL(I),PC,TK,RK,TV,NA,N,JTOP,PMINIT(I),
+     1              ISOLV,PAR,PMIN(I),VMAX(I),IFL(I),NITER(I),PMC(I),
+     2              TO(I),OTL(I),NCMAX(I))
+   20       CONTINUE
+C$OMP END PARALLEL DO
+C
+       RETURN
+       END
+C
+      SUBROUTINE PCMINP(SST,PSL,P,T,R,NCOL,NA,N,PMINIT,ISOLV,
+     1                  PMIN,VMAX,IFL,NITER,PMC,TO,OTL,NCMAX)
+C
+C   ***   As PCMINV, for NCOL soundings that share the same        ***
+C   ***                    pressure levels.                        ***
+C
+C  INPUT:   P: One-dimensional array of dimension NA containing the
+C             pressure (mb) of each level, lowest level first. The
+C             same levels are used for every sounding, so no
+C             pressure array of dimension (NCOL,NA) is needed.
+C
+C           Other arguments are as described in PCMINV.
+C
+C-----------------------------------------------------------------------------
+Cf2py threadsafe
+Cf2py intent(in) SST,PSL,P,T,R
+Cf2py intent(out) PMIN,VMAX,IFL,NITER,PMC,TO,OTL,NCMAX
+Cf2py integer intent(hide),depend(T) :: NCOL=shape(T,0)
+Cf2py integer intent(hide),depend(T) :: NA=shape(T,1)
+Cf2py integer optional,depend(T) :: N=shape(T,1)
+Cf2py real optional,intent(in),dimension(NCOL),depend(NCOL) :: PMINIT=950.
+Cf2py integer optional,intent(in) :: ISOLV=0
+       INTEGER NCOL,NA,N,ISOLV
+       REAL SST(NCOL),PSL(NCOL),PMINIT(NCOL)
+       REAL P(NA),T(NCOL,NA),R(NCOL,NA)
+       REAL PMIN(NCOL),VMAX(NCOL),PMC(NCOL),TO(NCOL),OTL(NCOL)
+       INTEGER IFL(NCOL),NITER(NCOL),NCMAX(NCOL)
+       REAL TK(NA),RK(NA),TV(NA),PAR(5)
+C
+       CALL DEFPAR(PAR)
+       JTOP=LEVTOP(P,N)
+C$OMP PARALLEL DO PRIVATE(I,TK,RK,TV) SCHEDULE(DYNAMIC,16)
+       DO 20 I=1,NCOL
+        CALL PREPCOL(T,R,NCOL,NA,N,I,TK,RK,TV)
+        CALL PCMINK(SST(I),PSL(I),P,TK,RK,TV,NA,N,JTOP,PMINIT(I),
+     1              ISOLV,PAR,PMIN(I),VMAX(I),IFL(I),NITER(I),PMC(I),
+     2              TO(I),OTL(I),NCMAX(I))
+   20       CONTINUE
+C$OMP END PARALLEL DO
+C
+       RETURN
+       END
+C
+      SUBROUTINE PCTLP(SST,PSL,P,T,R,DT,NCOL,NA,N,PMINIT,ISOLV,
+     1                 PMIN,VMAX,IFL,NITER,PMC,TO,OTL,NCMAX,
+     2                 DPDS,DVDS,DPDT,DVDT)
+C
+C   ***   As PCMINP, also returning the derivatives of PMIN and    ***
+C   ***   VMAX with respect to the SST and to a perturbation of    ***
+C   ***   the temperature of the soundings, from the tangent       ***
+C   ***              linear of the kernel (see PCTLK).             ***
+C
+C  INPUT:   DT: One-dimensional array of dimension NA containing the
+C             perturbation of the temperature (K) at each level, in
+C             the same order as P, e.g. 1 in the layer of interest and
+C             0 elsewhere.
+C
+C           Other arguments are as described in PCMINP.
+C
+C  OUTPUT:  DPDS, DVDS: One-dimensional arrays of dimension NCOL
+C             containing the derivatives of PMIN (mb/K) and VMAX
+C             (m/s/K) with respect to the SST.
+C
+C           DPDT, DVDT: One-dimensional arrays of dimension NCOL
+C             containing the derivatives of PMIN (mb) and VMAX (m/s)
+C             along DT, e.g. per K of warming of the layer.
+C
+C           The derivatives are zero where IFL is not 1. Other
+C           arguments are as described in PCMINP.
+C
+C   The derivatives take three further CAPE calculations for each
+C   sounding, rather than a full calculation for each perturbed input.
+C
+C-----------------------------------------------------------------------------
+Cf2py threadsafe
+Cf2py intent(in) SST,PSL,P,T,R,DT
+Cf2py intent(out) PMIN,VMAX,IFL,NITER,PMC,TO,OTL,NCMAX
+Cf2py intent(out) DPDS,DVDS,DPDT,DVDT
+Cf2py integer intent(hide),depend(T) :: NCOL=shape(T,0)
+Cf2py integer intent(hide),depend(T) :: NA=shape(T,1)
+Cf2py integer optional,depend(T) :: N=shape(T,1)
+Cf2py real optional,intent(in),dimension(NCOL),depend(NCOL) :: PMINIT=950.
+Cf2py integer optional,intent(in) :: ISOLV=0
+       INTEGER NCOL,NA,N,ISOLV
+       REAL SST(NCOL),PSL(NCOL),PMINIT(NCOL)
+       REAL P(NA),T(NCOL,NA),R(NCOL,NA),DT(NA)
+       REAL PMIN(NCOL),VMAX(NCOL),PMC(NCOL),TO(NCOL),OTL(NCOL)
+       REAL DPDS(NCOL),DVDS(NCOL),DPDT(NCOL),DVDT(NCOL)
+       INTEGER IFL(NCOL),NITER(NCOL),NCMAX(NCOL)
+       REAL TK(NA),RK(NA),TV(NA),PAR(5)
+C
+       CALL DEFPAR(PAR)
+       JTOP=LEVTOP(P,N)
+C$OMP PARALLEL DO PRIVATE(I,TK,RK,TV) SCHEDULE(DYNAMIC,16)
+       DO 20 I=1,NCOL
+        CALL PREPCOL(T,R,NCOL,NA,N,I,TK,RK,TV)
+        CALL PCMINK(SST(I),PSL(I),P,TK,RK,TV,NA,N,JTOP,PMINIT(I),
+     1              ISOLV,PAR,PMIN(I),VMAX(I),IFL(I),NITER(I),PMC(I),
+     2              TO(I),OTL(I),NCMAX(I))
+        CALL PCTLK(SST(I),PSL(I),P,TK,RK,TV,NA,N,JTOP,PAR,DT,PMC(I),
+     1             IFL(I),DPDS(I),DVDS(I),DPDT(I),DVDT(I))
+   20       CONTINUE
+C$OMP END PARALLEL DO
+C
+       RETURN
+       END
+C
+      SUBROUTINE PCSWEEP(SST,PSL,P,T,R,PAR,NCOL,NA,N,NPAR,PMINIT,ISOLV,
+     1                   PMIN,VMAX,IFL,NITER,PMC,TO,OTL,NCMAX)
+C
+C   ***   As PCMINP, for NPAR sets of the adjustable parameters,   ***
+C   ***      evaluated for each sounding in a single pass.         ***
+C
+C  INPUT:   PAR: Two-dimensional array of dimension (5,NPAR)
+C             containing CKCD, SIG, IDISS, b and VREDUC for each
+C             parameter set (see DEFPAR). The sounding is prepared
+C             once, and the environmental CAPE and the minimum pressure
+C             iteration are shared between sets where possible (see
+C             PCMINS).
+C
+C           PMINIT: First guess for the minimum pressure iteration,
+C             used for all parameter sets.
+C
+C           Other arguments are as described in PCMINP.
+C
+C  OUTPUT:  PMIN, VMAX, IFL, NITER, PMC, TO, OTL, NCMAX:
+C             Two-dimensional arrays of dimension (NCOL,NPAR), with the
+C             same meaning as in PCMINV.
+C
+C-----------------------------------------------------------------------------
+Cf2py threadsafe
+Cf2py intent(in) SST,PSL,P,T,R,PAR
+Cf2py intent(out) PMIN,VMAX,IFL,NITER,PMC,TO,OTL,NCMAX
+Cf2py integer intent(hide),depend(T) :: NCOL=shape(T,0)
+Cf2py integer intent(hide),depend(T) :: NA=shape(T,1)
+Cf2py integer intent(hide),depend(PAR) :: NPAR=shape(PAR,1)
+Cf2py integer optional,depend(T) :: N=shape(T,1)
+Cf2py real optional,intent(in),dimension(NCOL),depend(NCOL) :: PMINIT=950.
+Cf2py integer optional,intent(in) :: ISOLV=0
+       INTEGER NCOL,NA,N,NPAR,ISOLV
+       REAL SST(NCOL),PSL(NCOL),PMINIT(NCOL),PAR(5,NPAR)
+       REAL P(NA),T(NCOL,NA),R(NCOL,NA)
+       REAL PMIN(NCOL,NPAR),VMAX(NCOL,NPAR),PMC(NCOL,NPAR)
+       REAL TO(NCOL,NPAR),OTL(NCOL,NPAR)
+       INTEGER IFL(NCOL,NPAR),NITER(NCOL,NPAR),NCMAX(NCOL,NPAR)
+       REAL TK(NA),RK(NA),TV(NA)
+       REAL PMINK(NPAR),VMAXK(NPAR),PMCK(NPAR),TOK(NPAR),OTLK(NPAR)
+       INTEGER IFLK(NPAR),NPK(NPAR),NCK(NPAR)
+C
+       JTOP=LEVTOP(P,N)
+C$OMP PARALLEL DO PRIVATE(I,K,TK,RK,TV,PMINK,VMAXK,PMCK,IFLK,NPK,
+C$OMP&  TOK,OTLK,NCK) SCHEDULE(DYNAMIC,16)
+       DO 20 I=1,NCOL
+        CALL PREPCOL(T,R,NCOL,NA,N,I,TK,RK,TV)
+        CALL PCMINS(SST(I),PSL(I),P,TK,RK,TV,NA,N,JTOP,PMINIT(I),
+     1              ISOLV,NPAR,PAR,PMINK,VMAXK,IFLK,NPK,PMCK,TOK,OTLK,
+     2              NCK)
+        DO 10 K=1,NPAR
+         PMIN(I,K)=PMINK(K)
+         VMAX(I,K)=VMAXK(K)
+         IFL(I,K)=IFLK(K)
+         NITER(I,K)=NPK(K)
+         PMC(I,K)=PMCK(K)
+         TO(I,K)=TOK(K)
+         OTL(I,K)=OTLK(K)
+         NCMAX(I,K)=NCK(K)
+   10        CONTINUE
+   20       CONTINUE
+C$OMP END PARALLEL DO
+C
+       RETURN
+       END
 C
+      SUBROUTINE SETNTHREADS(NTHREADS)
+C
+C   ***   Set the number of OpenMP threads used by PCMINV. Has no   ***
+C   ***       effect if the code was compiled without OpenMP.       ***
+C
+       INTEGER NTHREADS
+C$     CALL OMP_SET_NUM_THREADS(MAX(NTHREADS,1))
+       RETURN
+       END
+C
+      SUBROUTINE GETNTHREADS(NTHREADS)
+C
+C   ***   Return the maximum number of OpenMP threads available to  ***
+C   ***      PCMINV, or 1 if the code was compiled without OpenMP.  ***
+C
+Cf2py intent(out) NTHREADS
+       INTEGER NTHREADS
+C$     INTEGER OMP_GET_MAX_THREADS
+       NTHREADS=1
+C$     NTHREADS=OMP_GET_MAX_THREADS()
+       RETURN
+       END
+C
+      BLOCK DATA MATABD
+C
+C   ***   The moist adiabat table is not used until set by SETMATAB  ***
+C
+       PARAMETER (NTS=476,NTR=51,NTP=96)
+       COMMON /MATAB/ MATON,TS0,TDS,TR0,TDR,TP0,TDP,TDT,
+     1                TABM(NTS,NTR,NTP)
+       DATA MATON,TDS/0,0.0/
+      END
+C
+      SUBROUTINE SETMATAB(TAB,NS,NR,NQ,S0,DS,R0,DR,P0,DP,DT,IERR)
+C
+C   ***   Install the table of reversible moist adiabats used by    ***
+C   ***   CAPE (see MALOOK). The table is built by moistadiabat.py  ***
+C
+C  INPUT:   TAB: Three-dimensional array of dimension (NS,NR,NQ)
+C             containing the temperature (K) of a saturated parcel as a
+C             function of reversible entropy S0+DS*(I-1) (J/kg/K), total
+C             water mixing ratio R0+DR*(J-1) (gm/gm) and the logarithm
+C             of pressure P0+DP*(K-1) (mb). Points with no solution
+C             are set to zero.
+C
+C           DT: The largest correction (K) to the interpolated
+C             temperature that is accepted before falling back to the
+C             iterative calculation.
+C
+C  OUTPUT:  IERR is 0 if the table was installed, or 1 if its
+C             dimensions do not match those in the MATAB common block.
+C
+Cf2py intent(out) IERR
+Cf2py integer intent(hide),depend(TAB) :: NS=shape(TAB,0)
+Cf2py integer intent(hide),depend(TAB) :: NR=shape(TAB,1)
+Cf2py integer intent(hide),depend(TAB) :: NQ=shape(TAB,2)
+       PARAMETER (NTS=476,NTR=51,NTP=96)
+       COMMON /MATAB/ MATON,TS0,TDS,TR0,TDR,TP0,TDP,TDT,
+     1                TABM(NTS,NTR,NTP)
+       INTEGER NS,NR,NQ,IERR
+       REAL TAB(NS,NR,NQ)
+C
+       IERR=1
+       IF(NS.NE.NTS.OR.NR.NE.NTR.OR.NQ.NE.NTP)RETURN
+       DO 30 K=1,NTP
+        DO 20 J=1,NTR
+         DO 10 I=1,NTS
+          TABM(I,J,K)=TAB(I,J,K)
+   10         CONTINUE
+   20        CONTINUE
+   30       CONTINUE
+       TS0=S0
+       TDS=DS
+       TR0=R0
+       TDR=DR
+       TP0=P0
+       TDP=DP
+       TDT=DT
+       MATON=1
+       IERR=0
+       RETURN
+       END
+C
+      SUBROUTINE USEMATAB(ION)
+C
+C   ***   Turn use of the moist adiabat table on (ION=1) or off    ***
+C   ***   (ION=0). The table must have been set with SETMATAB.     ***
+C
+       PARAMETER (NTS=476,NTR=51,NTP=96)
+       COMMON /MATAB/ MATON,TS0,TDS,TR0,TDR,TP0,TDP,TDT,
+     1                TABM(NTS,NTR,NTP)
+       INTEGER ION
+C
+       IF(ION.EQ.0)THEN
+        MATON=0
+       ELSE IF(TDS.GT.0.0)THEN
+        MATON=1
+       END IF
+       RETURN
+       END
+C
+      SUBROUTINE MALOOK(S,RP,PJ,TL,DT,IOK)
+C
+C   ***   Look up the temperature TL (K) of a saturated parcel with    ***
+C   ***   reversible entropy S and total water mixing ratio RP at      ***
+C   ***   pressure PJ (mb), by trilinear interpolation of the table    ***
+C   ***   set by SETMATAB. DT is the largest correction accepted.      ***
+C   ***   IOK is 0 if the table is not in use, or the point is         ***
+C   ***     outside the table or next to points with no solution.      ***
+C
+       PARAMETER (NTS=476,NTR=51,NTP=96)
+       COMMON /MATAB/ MATON,TS0,TDS,TR0,TDR,TP0,TDP,TDT,
+     1                TABM(NTS,NTR,NTP)
+C
+       IOK=0
+       IF(MATON.NE.1)RETURN
+       X=(S-TS0)/TDS
+       Y=(RP-TR0)/TDR
+       Z=(LOG(PJ)-TP0)/TDP
+       IF(.NOT.(X.GE.0.0.AND.X.LT.REAL(NTS-1)))RETURN
+       IF(.NOT.(Y.GE.0.0.AND.Y.LT.REAL(NTR-1)))RETURN
+       IF(.NOT.(Z.GE.0.0.AND.Z.LT.REAL(NTP-1)))RETURN
+       I=INT(X)+1
+       J=INT(Y)+1
+       K=INT(Z)+1
+       FX=X-REAL(I-1)
+       FY=Y-REAL(J-1)
+       FZ=Z-REAL(K-1)
+       IF(MIN(TABM(I,J,K),TABM(I+1,J,K),TABM(I,J+1,K),
+     1    TABM(I+1,J+1,K),TABM(I,J,K+1),TABM(I+1,J,K+1),
+     2    TABM(I,J+1,K+1),TABM(I+1,J+1,K+1)).LE.0.0)RETURN
+       T00=(1.-FX)*TABM(I,J,K)+FX*TABM(I+1,J,K)
+       T10=(1.-FX)*TABM(I,J+1,K)+FX*TABM(I+1,J+1,K)
+       T01=(1.-FX)*TABM(I,J,K+1)+FX*TABM(I+1,J,K+1)
+       T11=(1.-FX)*TABM(I,J+1,K+1)+FX*TABM(I+1,J+1,K+1)
+       TL=(1.-FZ)*((1.-FY)*T00+FY*T10)+FZ*((1.-FY)*T01+FY*T11)
+       DT=TDT
+       IOK=1
        RETURN
        END
 C        
-      SUBROUTINE CAPE(TP,RP,PP,T,R,P,ND,N,SIG,CAPED,TOB,IFLAG)
+      SUBROUTINE CAPE(TP,RP,PP,T,TV,P,ND,N,JTOP,SIG,CAPED,TOB,PNB,
+     1                NCMAX,IFLAG)
+C
+C   ***   CAPE of a lifted parcel. See CAPEP for a description of   ***
+C   ***                       the arguments.                        ***
+C
+      REAL T(ND),TV(ND),P(ND),TVRDIF(100),TGP(100)
+C
+      CALL CAPEP(TP,RP,PP,T,TV,P,ND,N,JTOP,SIG,CAPED,TOB,PNB,NCMAX,
+     1           IFLAG,TVRDIF,TGP,S,PLCL,JMIN,INB)
+      RETURN
+      END
+C
+      SUBROUTINE CAPEP(TP,RP,PP,T,TV,P,ND,N,JTOP,SIG,CAPED,TOB,PNB,
+     1                 NCMAX,IFLAG,TVRDIF,TGP,S,PLCL,JMIN,INB)
 C
 C     This subroutine calculates the CAPE of a parcel with pressure PP (mb), 
 C       temperature TP (K) and mixing ratio RP (gm/gm) given a sounding
-C       of temperature (T in K) and mixing ratio (R in gm/gm) as a function
-C       of pressure (P in mb). ND is the dimension of the arrays T,R and P,
-C       while N is the actual number of points in the sounding. CAPED is
+C       of temperature (T in K) and virtual temperature (TV in K) as a
+C       function of pressure (P in mb). ND is the dimension of the arrays
+C       T,TV and P, while N is the actual number of points in the sounding,
+C       and JTOP is the highest level at or below 59 mb (see LEVTOP). CAPED is
 C       the calculated value of CAPE and TOB is the temperature at the
-C       level of neutral buoyancy.  IFLAG is a flag
+C       level of neutral buoyancy, and PNB its pressure (mb). NCMAX is the
+C       largest number of iterations taken to find the lifted parcel
+C       temperature at any level.  IFLAG is a flag
 C       integer. If IFLAG = 1, routine is successful; if it is 0, routine did
 C       not run owing to improper sounding (e.g.no water vapor at parcel level).
 C       IFLAG=2 indicates that routine did not converge.                 
 C
-      REAL T(ND),R(ND),P(ND),TVRDIF(100)   
+C     The state of the lifted parcel is also returned, for the tangent
+C       linear calculation in CAPETL. TVRDIF and TGP are arrays of
+C       dimension 100 containing the difference in virtual temperature
+C       between the parcel and the environment (K) and the parcel
+C       temperature (K) at each level. S is the reversible entropy of
+C       the parcel, PLCL the lifted condensation pressure (mb), JMIN the
+C       first level above the parcel and INB the level of neutral
+C       buoyancy (1 if the parcel is not buoyant at any level).
+C
+      REAL T(ND),TV(ND),P(ND),TVRDIF(100),TGP(100)
       REAL NA
 C
 C   ***   Default values   ***
 C      
       CAPED=0.0
       TOB=T(1)
+      PNB=P(1)
+      NCMAX=0
+      INB=1
       IFLAG=1
 C
 C   ***   Check that sounding is suitable    ***
@@ -216,17 +1111,16 @@ C
 C
 C   ***  Begin updraft loop   ***
 C
-       NCMAX=0
        DO J=1,N
         TVRDIF(J)=0.0
        END DO
 C
        JMIN=1E6
-       DO 200 J=1,N
+       DO 200 J=1,JTOP
 C
-C    ***   Don't bother lifting parcel above 60 mb and skip sections of sounding below parcel level  ***
+C    ***   Don't bother lifting parcel above 60 mb (JTOP) and skip sections of sounding below parcel level  ***
 C
-      IF(P(J).LT.59.0.OR.P(J).GE.PP)GOTO 200
+      IF(P(J).GE.PP)GOTO 200
 C
        JMIN=MIN(JMIN,J)
 C
@@ -239,7 +1133,7 @@ C
 C   ***   Calculate buoyancy   ***
 C  
          TLVR=TG*(1.+RG/EPS)/(1.+RG)
-         TVRDIF(J)=TLVR-T(J)*(1.+R(J)/EPS)/(1.+R(J))
+         TVRDIF(J)=TLVR-TV(J)
         ELSE
 C
 C   ***  Parcel quantities above lifted condensation level  ***
@@ -248,11 +1142,34 @@ C
          TJC=T(J)-273.15 
          ES=6.112*EXP(17.67*TJC/(243.5+TJC)) 
          RG=EPS*ES/(P(J)-ES)
+         NC=0
+C
+C   ***  Look up the lifted parcel temperature in the moist adiabat   ***
+C   ***   table (if set), and correct it with a single Newton step.   ***
+C   ***   If the correction is too large, use the iteration below.    ***
+C
+         CALL MALOOK(S,RP,P(J),TL,DTL,IOK)
+         IF(IOK.EQ.1)THEN
+          TC=TL-273.15
+          EL=6.112*EXP(17.67*TC/(243.5+TC))
+          RL=EPS*EL/(P(J)-EL)
+          ALV=ALV0+CPVMCL*TC
+          SL=(CPD+RP*CL+ALV*ALV*RL/(RV*TL*TL))/TL
+          SG=(CPD+RP*CL)*LOG(TL)-RD*LOG(P(J)-EL)+ALV*RL/TL
+          TGNEW=TL+(S-SG)/SL
+          TC=TGNEW-273.15
+          ENEW=6.112*EXP(17.67*TC/(243.5+TC))
+          IF(ABS(TGNEW-TL).LE.DTL.AND.ENEW.LT.(P(J)-1.0))THEN
+           TG=TGNEW
+           RG=EPS*ENEW/(P(J)-ENEW)
+           NC=1
+           GOTO 130
+          END IF
+         END IF
 C
 C   ***  Iteratively calculate lifted parcel temperature and mixing   ***
 C   ***                ratio for reversible ascent                    ***
 C
-         NC=0
   120         CONTINUE
          NC=NC+1
 C
@@ -281,20 +1198,23 @@ C
 C   ***   Bail out if things get out of hand   ***
 C
           IF(NC.GT.500.OR.ENEW.GT.(P(J)-1.0))THEN
+            NCMAX=MAX(NC,NCMAX)
             IFLAG=2
             RETURN
           END IF
           RG=EPS*ENEW/(P(J)-ENEW)           
           GOTO 120
          END IF
+  130         CONTINUE
          NCMAX=MAX(NC,NCMAX)
 C
 C   *** Calculate buoyancy   ***
 C
         RMEAN=SIG*RG+(1.-SIG)*RP
          TLVR=TG*(1.+RG/EPS)/(1.+RMEAN)
-         TVRDIF(J)=TLVR-T(J)*(1.+R(J)/EPS)/(1.+R(J))
+         TVRDIF(J)=TLVR-TV(J)
         END IF
+        TGP(J)=TG
   200       CONTINUE
 C
 C  ***  Begin loop to find NA, PA, and CAPE from reversible ascent ***
@@ -330,12 +1250,14 @@ C   ***   Find residual positive area above INB and TO  ***
 C
        PAT=0.0
        TOB=T(INB)
+       PNB=P(INB)
        IF(INB.LT.N)THEN
         PINB=(P(INB+1)*TVRDIF(INB)-P(INB)*TVRDIF(INB+1))/
      1   (TVRDIF(INB)-TVRDIF(INB+1))
         PAT=RD*TVRDIF(INB)*(P(INB)-PINB)/(P(INB)+PINB)
          TOB=(T(INB)*(PINB-P(INB+1))+T(INB+1)*(P(INB)-PINB))/
      1    (P(INB)-P(INB+1))
+        PNB=PINB
        END IF
 C
 C   ***   Find CAPE  ***
@@ -345,4 +1267,158 @@ C
        END IF
 C
        RETURN
-       END
\ No newline at end of file
+       END
+C
+      SUBROUTINE CAPETL(TP,RP,PP,T,TV,P,ND,N,JTOP,SIG,NV,DTP,DRP,DPP,
+     1                  DT,DTV,CAPED,TOB,DCAPE,DTOB,IFLAG)
+C
+C   ***   Tangent linear of CAPEP: the CAPE and the temperature at   ***
+C   ***   the level of neutral buoyancy of a lifted parcel, and      ***
+C   ***   their derivatives along NV directions of perturbation of   ***
+C   ***                        the inputs.                           ***
+C
+C  INPUT:   TP,RP,PP,T,TV,P,ND,N,JTOP,SIG: As described in CAPEP.
+C
+C           NV: The number of directions
+C
+C           DTP,DRP,DPP: One-dimensional arrays of dimension NV
+C             containing the perturbation of the parcel temperature
+C             (K), mixing ratio (gm/gm) and pressure (mb) in each
+C             direction.
+C
+C           DT,DTV: Two-dimensional arrays of dimension (ND,NV)
+C             containing the perturbation of the temperature and the
+C             virtual temperature of the sounding (K) in each
+C             direction.
+C
+C  OUTPUT:  CAPED,TOB,IFLAG: As described in CAPEP.
+C
+C           DCAPE,DTOB: One-dimensional arrays of dimension NV
+C             containing the derivative of CAPED (J/kg) and TOB (K) in
+C             each direction. They are zero if IFLAG is not 1.
+C
+C   The perturbation of the lifted parcel temperature at each level is
+C   found from the perturbation of its entropy, at the converged
+C   temperature, rather than by differentiating the iteration. Changes
+C   in the levels that bound the integral (the first level above the
+C   parcel, the lifted condensation level and the level of neutral
+C   buoyancy) are discrete, so do not contribute.
+C
+      REAL T(ND),TV(ND),P(ND),DT(ND,NV),DTV(ND,NV)
+      REAL DTP(NV),DRP(NV),DPP(NV),DCAPE(NV),DTOB(NV)
+      REAL TVRDIF(100),TGP(100),DTVR(100,NV),DS(NV)
+C
+      CALL CAPEP(TP,RP,PP,T,TV,P,ND,N,JTOP,SIG,CAPED,TOB,PNB,NCMAX,
+     1           IFLAG,TVRDIF,TGP,S,PLCL,JMIN,INB)
+      DO 10 K=1,NV
+       DCAPE(K)=0.0
+       DTOB(K)=0.0
+       IF(IFLAG.EQ.1)DTOB(K)=DT(1,K)
+   10       CONTINUE
+      IF(IFLAG.NE.1.OR.INB.EQ.1)RETURN
+C
+C   ***   Thermodynamic constants, as in CAPEP   ***
+C
+      CPD=1005.7
+      CPV=1870.0
+      CL=2500.0
+      CPVMCL=CPV-CL
+      RV=461.5
+      RD=287.04
+      EPS=RD/RV
+      ALV0=2.501E6
+C
+C   ***   Perturbation of the reversible entropy of the parcel   ***
+C
+      TPC=TP-273.15
+      ESP=6.112*EXP(17.67*TPC/(243.5+TPC))
+      DESDT=ESP*17.67*243.5/(243.5+TPC)**2
+      EVP=RP*PP/(EPS+RP)
+      RH=EVP/ESP
+      RH=MIN(RH,1.0)
+      ALV=ALV0+CPVMCL*TPC
+      DO 20 K=1,NV
+       DEVP=(PP*EPS*DRP(K)/(EPS+RP)+RP*DPP(K))/(EPS+RP)
+       DRH=0.0
+       IF(EVP.LT.ESP)DRH=(DEVP-RH*DESDT*DTP(K))/ESP
+       DS(K)=(CL*LOG(TP)+ALV/TP-RV*LOG(RH))*DRP(K)+
+     1   (CPD+RP*CL+CPVMCL*RP-ALV*RP/TP)*DTP(K)/TP-
+     2   RD*(DPP(K)-DEVP)/(PP-EVP)-RP*RV*DRH/RH
+   20       CONTINUE
+C
+C   ***   Perturbation of the virtual temperature difference at    ***
+C   ***   each level, up to the level above the level of neutral   ***
+C   ***                        buoyancy                            ***
+C
+      DO 50 J=JMIN,MIN(INB+1,N)
+       DO 30 K=1,NV
+        DTVR(J,K)=0.0
+   30        CONTINUE
+       IF(J.GT.JTOP)GOTO 50
+       TG=TGP(J)
+       IF(P(J).GE.PLCL)THEN
+C
+C   ***   Below the lifted condensation level: dry adiabat   ***
+C
+        FV=(1.+RP/EPS)/(1.+RP)
+        DO 35 K=1,NV
+         DTG=TG*(DTP(K)/TP-RD*DPP(K)/(CPD*PP))
+         DTVR(J,K)=DTG*FV+TG*(1./EPS-1.)*DRP(K)/(1.+RP)**2-DTV(J,K)
+   35         CONTINUE
+       ELSE
+C
+C   ***   Above the lifted condensation level: the entropy of the  ***
+C   ***   saturated parcel is conserved, so its temperature        ***
+C   ***   changes by the change of entropy divided by the rate of  ***
+C   ***   change of entropy with temperature at constant pressure  ***
+C
+        TC=TG-273.15
+        ES=6.112*EXP(17.67*TC/(243.5+TC))
+        DESDT=ES*17.67*243.5/(243.5+TC)**2
+        RG=EPS*ES/(P(J)-ES)
+        DRGDT=EPS*P(J)*DESDT/(P(J)-ES)**2
+        ALV=ALV0+CPVMCL*TC
+        SGT=(CPD+RP*CL)/TG+RD*DESDT/(P(J)-ES)+
+     1      (CPVMCL*RG+ALV*DRGDT-ALV*RG/TG)/TG
+        RMEAN=SIG*RG+(1.-SIG)*RP
+        TLVR=TG*(1.+RG/EPS)/(1.+RMEAN)
+        DO 40 K=1,NV
+         DTG=(DS(K)-CL*LOG(TG)*DRP(K))/SGT
+         DRG=DRGDT*DTG
+         DRM=SIG*DRG+(1.-SIG)*DRP(K)
+         DTVR(J,K)=(DTG*(1.+RG/EPS)+TG*DRG/EPS-TLVR*DRM)/(1.+RMEAN)-
+     1             DTV(J,K)
+   40         CONTINUE
+       END IF
+   50       CONTINUE
+C
+C   ***   Perturbation of CAPE (the sum of the positive and   ***
+C   ***   negative areas) and of the outflow temperature      ***
+C
+      IF(INB.LT.N)THEN
+       P0=P(INB)
+       P1=P(INB+1)
+       A=TVRDIF(INB)
+       B=TVRDIF(INB+1)
+       PINB=(P1*A-P0*B)/(A-B)
+      END IF
+      PMA=(PP+P(JMIN))
+      PFAC=RD*(PP-P(JMIN))/PMA
+      DO 70 K=1,NV
+       D=PFAC*DTVR(JMIN,K)+2.*RD*P(JMIN)*TVRDIF(JMIN)*DPP(K)/PMA**2
+       DO 60 J=JMIN+1,INB
+        D=D+RD*(DTVR(J,K)+DTVR(J-1,K))*(P(J-1)-P(J))/(P(J)+P(J-1))
+   60        CONTINUE
+       DTOB(K)=DT(INB,K)
+       IF(INB.LT.N)THEN
+        DPINB=(P0-P1)*(B*DTVR(INB,K)-A*DTVR(INB+1,K))/(A-B)**2
+        D=D+RD*(DTVR(INB,K)*(P0-PINB)/(P0+PINB)-
+     1          2.*A*P0*DPINB/(P0+PINB)**2)
+        DTOB(K)=(DT(INB,K)*(PINB-P1)+DT(INB+1,K)*(P0-PINB)+
+     1           (T(INB)-T(INB+1))*DPINB)/(P0-P1)
+       END IF
+       IF(CAPED.GT.0.0)DCAPE(K)=D
+   70       CONTINUE
+C
+      RETURN
+      END
\ No newline at end of file
@@ -0,0 +1,393 @@
+"""
+:mod:`pcmin_emulator` -- Statistical emulator of the PI kernel
+==============================================================
+
+.. module:: pcmin_emulator
+    :synopsis: A regression model of PMIN and VMAX, fitted to the output
+               of the PI kernel, for screening large numbers of
+               scenarios (e.g. CMIP model/period combinations) before
+               running the full calculation.
+
+               The predictors are a few properties of each sounding (see
+               `FEATURES`): the SST, the sea level pressure, the
+               temperature and mixing ratio at the lowest level, the
+               temperature at 500 hPa, and the temperature and pressure
+               of the coldest level between 300 hPa and the highest
+               level parcels are lifted to, a proxy for the outflow
+               level. VMAX and the pressure deficit (PSL - PMIN) are
+               fitted by least squares to a quadratic polynomial of the
+               standardised predictors. Evaluating the model takes a few
+               array operations, so it calculates PI for millions of
+               columns a second.
+
+               The model is fitted with `fit` (see `train_emulator.py`)
+               and saved to a `.npz` file, along with the RMS and mean
+               error of each output on columns held out of the fit. It
+               is loaded with `setmodel`, or on first use from the file
+               named in the `PCMIN_EMULATOR` environment variable (by
+               default `emulator.npz` in `~/.cache/pcmin`).
+
+               This provides the same interface as the f2py-wrapped
+               extension (`pcminv`, `pcminp`, `pcsweep`, `setnthreads`,
+               `getnthreads`, `setmatab`, `usematab`), so can be used in
+               place of the kernel by `calculate.py`. Only the default
+               values of the adjustable parameters are emulated. The
+               returned `to` and `otl` are the temperature (K) and
+               pressure (hPa) of the coldest level, and there are no
+               iterations, so `niter` and `ncmax` are zero.
+
+.. moduleauthor: Craig Arthur, <craig.arthur@ga.gov.au>
+
+"""
+
+import os
+import logging
+from os.path import join as pjoin, expanduser
+
+import numpy as np
+
+from engines import PARAMETERS, DEFAULTS, parameterSets
+
+LOGGER = logging.getLogger(__name__)
+
+# Predictors of the model: SST (C), sea level pressure (hPa),
+# temperature (C) and mixing ratio (g/kg) at the lowest level,
+# temperature at 500 hPa (C), and the temperature (C) and log of the
+# pressure (hPa) of the coldest level in the outflow layer
+FEATURES = ('sst', 'psl', 't_low', 'r_low', 't_500', 't_out', 'logp_out')
+
+# Outputs of the model, in the order of the columns of the coefficients
+TARGETS = ('vmax', 'deficit')
+
+# Bottom and top of the layer searched for the coldest level (hPa). The
+# top is the highest level parcels are lifted to in `pcmin.f`
+OUTFLOW_LAYER = (300.0, 59.0)
+
+# Environment variable naming the model file, and its default location
+MODEL_ENV = 'PCMIN_EMULATOR'
+MODELFILE = pjoin(expanduser('~'), '.cache', 'pcmin', 'emulator.npz')
+
+# Model in use (see `setmodel`)
+_MODEL = None
+
+
+def _interpolate(p, t, pt):
+    """
+    Interpolate each sounding to the pressure `pt`, linearly in the log
+    of pressure.
+
+    :param p: `numpy.ndarray` (nlev,) or (ncol, nlev) of pressure (hPa),
+              decreasing with level
+    :param t: `numpy.ndarray` (ncol, nlev) of the values to interpolate
+    :param float pt: Pressure (hPa)
+
+    :returns: `numpy.ndarray` (ncol,) of the value at `pt`
+    """
+    nlev = t.shape[1]
+    if np.ndim(p) == 1:
+        # The same levels in every column
+        k = int(np.clip(np.sum(p >= pt) - 1, 0, nlev - 2))
+        p0, p1 = float(p[k]), float(p[k + 1])
+        t0, t1 = t[:, k].astype(np.float64), t[:, k + 1].astype(np.float64)
+    else:
+        k = np.clip(np.sum(p >= pt, axis=1) - 1, 0, nlev - 2)[:, None]
+        p0, p1 = (np.take_along_axis(p, k + i, axis=1)[:, 0].astype(np.float64)
+                  for i in (0, 1))
+        t0, t1 = (np.take_along_axis(t, k + i, axis=1)[:, 0].astype(np.float64)
+                  for i in (0, 1))
+    w = np.log(p0 / pt) / np.log(p0 / p1)
+    return t0 + w * (t1 - t0)
+
+
+def features(sst, psl, p, t, r):
+    """
+    Calculate the predictors of each sounding.
+
+    :param sst: `numpy.ndarray` (ncol,) of sea surface temperature (C)
+    :param psl: `numpy.ndarray` (ncol,) of sea level pressure (hPa)
+    :param p: `numpy.ndarray` (nlev,) or (ncol, nlev) of pressure (hPa)
+    :param t: `numpy.ndarray` (ncol, nlev) of temperature (C)
+    :param r: `numpy.ndarray` (ncol, nlev) of mixing ratio (g/kg)
+
+    Soundings are ordered from the lowest level upwards, as for the
+    kernel.
+
+    :returns: `numpy.ndarray` (ncol, nfeature) of the predictors in
+              `FEATURES`
+    """
+    p = np.asarray(p)
+    t = np.asarray(t)
+    pb = np.broadcast_to(p, t.shape)
+    # Only the levels within the outflow layer in some column are searched
+    inlayer = (p <= OUTFLOW_LAYER[0]) & (p >= OUTFLOW_LAYER[1])
+    levels = np.flatnonzero(inlayer.reshape(-1, t.shape[1]).any(axis=0))
+    tl, pl = t[:, levels], pb[:, levels]
+    if p.ndim > 1:
+        tl = np.where(inlayer[:, levels], tl, np.inf)
+    kout = np.argmin(tl, axis=1)[:, None]
+    x = np.empty((t.shape[0], len(FEATURES)))
+    x[:, 0] = sst
+    x[:, 1] = psl
+    x[:, 2] = t[:, 0]
+    x[:, 3] = np.asarray(r)[:, 0]
+    x[:, 4] = _interpolate(p, t, 500.)
+    x[:, 5] = np.take_along_axis(tl, kout, axis=1)[:, 0]
+    x[:, 6] = np.log(np.take_along_axis(pl, kout, axis=1)[:, 0])
+    return x
+
+
+def design(x, mean, scale):
+    """
+    Quadratic polynomial of the standardised predictors.
+
+    :param x: `numpy.ndarray` (ncol, nfeature) of predictors
+    :param mean: `numpy.ndarray` (nfeature,) of the mean of each predictor
+    :param scale: `numpy.ndarray` (nfeature,) of the standard deviation
+                  of each predictor
+
+    :returns: `numpy.ndarray` (ncol, nterm) of the constant, linear and
+              quadratic terms
+    """
+    z = (x - mean) / scale
+    i, j = np.triu_indices(z.shape[1])
+    return np.concatenate([np.ones((len(z), 1)), z, z[:, i] * z[:, j]],
+                          axis=1)
+
+
+def fit(sst, psl, p, t, r, pmin, vmax, ifl, holdout=0.2, seed=0):
+    """
+    Fit the model to the output of the PI kernel.
+
+    Only columns where the kernel converged (`ifl` is 1) are used. A
+    fraction `holdout` of them, picked at random, is left out of the fit
+    and used to estimate the error of the model.
+
+    :param sst, psl, p, t, r: Soundings, as for `features`
+    :param pmin: `numpy.ndarray` (ncol,) of minimum central pressure
+                 (hPa) calculated by the kernel
+    :param vmax: `numpy.ndarray` (ncol,) of maximum wind speed (m/s)
+                 calculated by the kernel
+    :param ifl: `numpy.ndarray` (ncol,) of the kernel flag
+    :param float holdout: Fraction of columns used to estimate the error
+    :param int seed: Seed of the random choice of held out columns
+
+    :returns: dict of the model: the mean and scale of the predictors,
+              the coefficients (nterm, 2), the range of each predictor
+              in the fit, and the RMS (`rmse`) and mean (`bias`) error of
+              VMAX and PMIN on the held out columns
+    :raises ValueError: if there are too few columns to fit the model
+    """
+    x = features(sst, psl, p, t, r)
+    y = np.stack([vmax, np.asarray(psl) - np.asarray(pmin)], axis=1)
+    ok = (np.asarray(ifl) == 1) & np.isfinite(x).all(axis=1) & \
+        np.isfinite(y).all(axis=1)
+    x, y = x[ok], y[ok].astype(np.float64)
+    rng = np.random.default_rng(seed)
+    test = rng.random(len(x)) < holdout
+    nterm = design(x[:1], 0., 1.).shape[1]
+    if np.sum(~test) < 2 * nterm or not test.any():
+        raise ValueError(f"Too few columns ({len(x)}) to fit the emulator")
+
+    mean, scale = x[~test].mean(axis=0), x[~test].std(axis=0)
+    scale[scale == 0] = 1.
+    coef = np.linalg.lstsq(design(x[~test], mean, scale), y[~test],
+                           rcond=None)[0]
+    model = {'mean': mean, 'scale': scale, 'coef': coef,
+             'lower': x[~test].min(axis=0), 'upper': x[~test].max(axis=0),
+             'ntrain': np.sum(~test), 'ntest': np.sum(test)}
+    # Error against the kernel, on the columns not used in the fit
+    pred = predict(model, x[test])
+    err = pred - y[test]
+    err[:, 1] = -err[:, 1]  # deficit to PMIN
+    model['rmse'] = np.sqrt(np.mean(err ** 2, axis=0))
+    model['bias'] = np.mean(err, axis=0)
+    return model
+
+
+def predict(model, x):
+    """
+    Evaluate the model.
+
+    :param dict model: Model (see `fit`)
+    :param x: `numpy.ndarray` (ncol, nfeature) of predictors
+
+    :returns: `numpy.ndarray` (ncol, 2) of VMAX (m/s) and pressure deficit
+              (hPa), neither less than zero
+    """
+    # The polynomial is evaluated as c + z.b + z.Q.z, rather than forming
+    # the quadratic terms of `design`, which is several times faster
+    coef = model['coef']
+    nfeature = x.shape[1]
+    i, j = np.triu_indices(nfeature)
+    quad = np.zeros((nfeature, nfeature, coef.shape[1]))
+    quad[i, j] = coef[1 + nfeature:]
+    z = (x - model['mean']) / model['scale']
+    y = coef[0] + z @ coef[1:1 + nfeature]
+    for k in range(coef.shape[1]):
+        y[:, k] += np.einsum('ij,ij->i', z @ quad[:, :, k], z)
+    return np.maximum(y, 0.)
+
+
+def saveModel(model, filename):
+    """
+    Save a model to a `.npz` file.
+
+    :param dict model: Model (see `fit`)
+    :param str filename: Path to the file
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+    np.savez(filename, features=np.array(FEATURES), **model)
+
+
+def loadModel(filename):
+    """
+    Load a model saved by `saveModel`.
+
+    :param str filename: Path to the file
+
+    :returns: dict of the model
+    :raises ValueError: if the model was fitted to different predictors
+    """
+    with np.load(filename) as data:
+        model = {key: data[key] for key in data.files}
+    if tuple(model.pop('features')) != FEATURES:
+        raise ValueError(f"The emulator in {filename} was fitted to "
+                         "different predictors")
+    return model
+
+
+def setmodel(filename=None):
+    """
+    Load the model used by `pcminv`.
+
+    :param str filename: Path to the model file (default the file named
+                         in the `PCMIN_EMULATOR` environment variable, or
+                         `MODELFILE`)
+
+    :returns: dict of the model
+    """
+    global _MODEL
+    filename = filename or os.environ.get(MODEL_ENV, MODELFILE)
+    _MODEL = loadModel(filename)
+    LOGGER.info(f"Loaded emulator from {filename}: RMS error against the "
+                f"kernel {_MODEL['rmse'][0]:.2f} m/s (VMAX) and "
+                f"{_MODEL['rmse'][1]:.2f} hPa (PMIN), on "
+                f"{int(_MODEL['ntest'])} columns")
+    return _MODEL
+
+
+def modelError():
+    """
+    :returns: (2,) arrays of the RMS and mean error of VMAX (m/s) and
+              PMIN (hPa) against the kernel, estimated when the model
+              was fitted
+    """
+    model = _MODEL if _MODEL is not None else setmodel()
+    return model['rmse'], model['bias']
+
+
+def pcminv(sst, psl, p, t, r, n=None, pminit=None, isolv=0):
+    """
+    Emulate the batched PI calculation, with the same interface as the
+    `PCMINV` subroutine in `pcmin.f`.
+
+    :param sst: `numpy.ndarray` (ncol,) of sea surface temperature (C)
+    :param psl: `numpy.ndarray` (ncol,) of sea level pressure (hPa)
+    :param p: `numpy.ndarray` (ncol, nlev) of pressure (hPa)
+    :param t: `numpy.ndarray` (ncol, nlev) of temperature (C)
+    :param r: `numpy.ndarray` (ncol, nlev) of mixing ratio (g/kg)
+    :param int n: Number of points in each sounding (default nlev)
+    :param pminit: Ignored (there is no iteration)
+    :param int isolv: Ignored
+
+    :returns: `pmin`, `vmax`, `ifl`, `niter`, `pmc`, `to`, `otl` and
+              `ncmax` arrays of shape (ncol,). `ifl` is 1 where the
+              prediction is valid and 0 elsewhere, and `pmc` is `pmin`
+    """
+    model = _MODEL if _MODEL is not None else setmodel()
+    if n is None:
+        n = np.shape(t)[1]
+    p = np.asarray(p)[..., :n]
+    t = np.asarray(t)[:, :n]
+    r = np.asarray(r)[:, :n]
+    with np.errstate(all='ignore'):
+        x = features(sst, psl, p, t, r)
+        vmax, deficit = predict(model, x).T
+    ok = np.isfinite(vmax) & np.isfinite(deficit)
+    pmin = np.asarray(psl, dtype=np.float32) - deficit.astype(np.float32)
+    ncol = len(vmax)
+    return (pmin, vmax.astype(np.float32), ok.astype(np.int32),
+            np.zeros(ncol, dtype=np.int32), pmin.copy(),
+            (x[:, 5] + 273.15).astype(np.float32),
+            np.exp(x[:, 6]).astype(np.float32),
+            np.zeros(ncol, dtype=np.int32))
+
+
+def pcminp(sst, psl, p, t, r, n=None, pminit=None, isolv=0):
+    """
+    As `pcminv`, for soundings that share the same pressure levels, with
+    the same interface as the `PCMINP` subroutine in `pcmin.f`.
+
+    :param p: `numpy.ndarray` (nlev,) of pressure (hPa), used for every
+              column
+
+    Other arguments and the return values are as for `pcminv`.
+    """
+    return pcminv(sst, psl, p, t, r, n, pminit, isolv)
+
+
+def pcsweep(sst, psl, p, t, r, par, n=None, pminit=None, isolv=0):
+    """
+    As `pcminp`, with the same interface as the `PCSWEEP` subroutine in
+    `pcmin.f`. Only the default parameters are emulated, so every set
+    must be the default set.
+
+    :param par: `numpy.ndarray` (5, npar) of parameter sets
+
+    :returns: `pmin`, `vmax`, `ifl`, `niter`, `pmc`, `to`, `otl` and
+              `ncmax` arrays of shape (ncol, npar)
+    :raises ValueError: if a parameter set is not the default set
+    """
+    par = np.asarray(par)
+    if not np.allclose(par, parameterSets()):
+        raise ValueError("The emulator is only fitted for the default "
+                         "parameters: " +
+                         ", ".join(f"{name}={DEFAULTS[name]:g}"
+                                   for name in PARAMETERS))
+    result = pcminp(sst, psl, p, t, r, n, pminit, isolv)
+    return tuple(np.repeat(a[:, None], par.shape[1], axis=1)
+                 for a in result)
+
+
+def setnthreads(nthreads):
+    """
+    The emulator is a single matrix product, so this has no effect.
+
+    :param int nthreads: Number of threads (ignored)
+    """
+    pass
+
+
+def getnthreads():
+    """
+    :returns: The number of threads used by `pcminv` (always 1)
+    """
+    return 1
+
+
+def setmatab(tab, s0, ds, r0, dr, p0, dp, dt):
+    """
+    The emulator does not lift parcels, so has no use for the moist
+    adiabat table (see :mod:`moistadiabat`).
+
+    :returns: 0
+    """
+    return 0
+
+
+def usematab(ion):
+    """
+    The emulator does not use the moist adiabat table, so this has no
+    effect.
+    """
+    pass
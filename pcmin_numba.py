@@ -0,0 +1,759 @@
+"""
+:mod:`pcmin_numba` -- Numba implementation of the PI kernel
+===========================================================
+
+.. module:: pcmin_numba
+    :synopsis: A line-by-line port of the `PCMIN` and `CAPE` subroutines
+               in `pcmin.f`, compiled with :term:`numba`. This provides
+               the same interface as the f2py-wrapped extension
+               (`pcminv`, `pcminp`, `pcsweep`, `setnthreads`,
+               `getnthreads`, `setmatab`, `usematab`), so it can be used where the Fortran extension
+               cannot be built.
+
+               If numba is not available, the functions run as plain
+               (slow) Python. This is only useful for testing.
+
+.. moduleauthor: Craig Arthur, <craig.arthur@ga.gov.au>
+
+"""
+
+import math
+import numpy as np
+
+try:
+    import numba
+    from numba import njit, prange
+except (ImportError, ModuleNotFoundError):
+    numba = None
+    prange = range
+
+    def njit(*args, **kwargs):
+        """
+        Dummy decorator used when numba is not available.
+
+        """
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda f: f
+
+# Thermodynamic constants, as used in `pcmin.f`
+CPD = 1005.7
+CPV = 1870.0
+CL = 2500.0
+CPVMCL = CPV - CL
+RV = 461.5
+RD = 287.04
+EPS = RD / RV
+ALV0 = 2.501E6
+
+# Adjustable constants, as used in `pcmin.f`
+CKCD = 0.9
+SIG = 0.0
+IDISS = 1
+B = 2.0
+NK = 0
+VREDUC = 0.8
+
+# Moist adiabat table (see :mod:`moistadiabat`) and its parameters:
+# [in use, S0, DS, R0, DR, log(P0), DlogP, largest correction]
+_MATAB = np.zeros((1, 1, 1), dtype=np.float32)
+_MAPAR = np.zeros(8)
+
+
+@njit(cache=True)
+def malook(s, rp, pj, tab, tabpar):
+    """
+    Look up the temperature of a saturated parcel in the moist adiabat
+    table, by trilinear interpolation (see `MALOOK` in `pcmin.f`).
+
+    :param float s: Reversible entropy (J/kg/K)
+    :param float rp: Total water mixing ratio (kg/kg)
+    :param float pj: Pressure (hPa)
+    :param tab: `numpy.ndarray` (ns, nr, np) of temperature (K)
+    :param tabpar: `numpy.ndarray` of table parameters (see `setmatab`)
+
+    :returns: temperature (K) and a flag (1 = OK, 0 = the table is not in
+              use, or the point is outside the table or next to points
+              with no solution)
+    """
+    if tabpar[0] != 1.0:
+        return 0.0, 0
+    x = (s - tabpar[1]) / tabpar[2]
+    y = (rp - tabpar[3]) / tabpar[4]
+    z = (math.log(pj) - tabpar[5]) / tabpar[6]
+    ns, nr, nq = tab.shape
+    if not (x >= 0.0 and x < ns - 1 and y >= 0.0 and y < nr - 1 and
+            z >= 0.0 and z < nq - 1):
+        return 0.0, 0
+    i, j, k = int(x), int(y), int(z)
+    fx, fy, fz = x - i, y - j, z - k
+    tl = 0.0
+    for di in range(2):
+        wx = fx if di else 1.0 - fx
+        for dj in range(2):
+            wy = fy if dj else 1.0 - fy
+            for dk in range(2):
+                wz = fz if dk else 1.0 - fz
+                c = tab[i + di, j + dj, k + dk]
+                if c <= 0.0:
+                    return 0.0, 0
+                tl += wx * wy * wz * c
+    return tl, 1
+
+
+@njit(cache=True)
+def prepcol(p, t, r, n):
+    """
+    Per-column precomputation shared by all calls to `cape` (see
+    `PREPCOL` in `pcmin.f`). The input arrays are not modified.
+
+    :param p: `numpy.ndarray` of pressure (hPa), surface first
+    :param t: `numpy.ndarray` of temperature (C)
+    :param r: `numpy.ndarray` of mixing ratio (g/kg)
+    :param int n: Number of points in the sounding
+
+    :returns: arrays of temperature (K), mixing ratio (kg/kg) and
+              environmental virtual temperature (K), and the number of
+              levels at or below 59 hPa (parcels are not lifted above
+              these levels)
+    """
+    tk = np.empty(n)
+    rk = np.empty(n)
+    tv = np.empty(n)
+    jtop = 0
+    for j in range(n):
+        tk[j] = t[j] + 273.15
+        rk[j] = r[j] * 0.001
+        tv[j] = tk[j] * (1. + rk[j] / EPS) / (1. + rk[j])
+        if p[j] >= 59.0:
+            jtop = j + 1
+    return tk, rk, tv, jtop
+
+
+@njit(cache=True)
+def cape(tp, rp, pp, t, tv, p, n, jtop, sig, tvrdif, tab=None, tabpar=None):
+    """
+    Calculate the CAPE of a parcel with pressure `pp` (hPa), temperature
+    `tp` (K) and mixing ratio `rp` (kg/kg), given a sounding of
+    temperature (`t`, K) and virtual temperature (`tv`, K) as a function
+    of pressure (`p`, hPa). The sounding is ordered from the surface
+    upwards.
+
+    :param float tp: Parcel temperature (K)
+    :param float rp: Parcel mixing ratio (kg/kg)
+    :param float pp: Parcel pressure (hPa)
+    :param t: `numpy.ndarray` of temperature (K)
+    :param tv: `numpy.ndarray` of virtual temperature (K)
+    :param p: `numpy.ndarray` of pressure (hPa)
+    :param int n: Number of points in the sounding
+    :param int jtop: Number of levels at or below 59 hPa (see `prepcol`)
+    :param float sig: 0 for reversible ascent, 1 for pseudo-adiabatic ascent
+    :param tvrdif: `numpy.ndarray` (n,) work array for the virtual
+                   temperature difference between parcel and environment
+    :param tab: Optional moist adiabat table (see `malook`)
+    :param tabpar: Parameters of the moist adiabat table
+
+    :returns: CAPE (J/kg), temperature (K) and pressure (hPa) at the
+              level of neutral buoyancy, the largest number of iterations
+              taken to find the lifted parcel temperature at any level,
+              and a flag (1 = OK, 0 = improper sounding, 2 = no
+              convergence)
+    """
+    caped = 0.0
+    tob = t[0]
+    pnb = p[0]
+    ncmax = 0
+
+    if rp < 1.0E-6 or tp < 200.0:
+        return caped, tob, pnb, ncmax, 0
+
+    # Parcel quantities, including reversible entropy, S
+    tpc = tp - 273.15
+    esp = 6.112 * math.exp(17.67 * tpc / (243.5 + tpc))
+    evp = rp * pp / (EPS + rp)
+    rh = evp / esp
+    rh = min(rh, 1.0)
+    alv = ALV0 + CPVMCL * tpc
+    s = ((CPD + rp * CL) * math.log(tp) - RD * math.log(pp - evp) +
+         alv * rp / tp - rp * RV * math.log(rh))
+
+    # Lifted condensation pressure, PLCL
+    chi = tp / (1669.0 - 122.0 * rh - tp)
+    plcl = pp * (rh ** chi)
+
+    tvrdif[:n] = 0.0
+    jmin = 1000000
+    for j in range(jtop):
+        # Don't lift parcel above 60 hPa (jtop), and skip levels below
+        # the parcel
+        if p[j] >= pp:
+            continue
+        jmin = min(jmin, j)
+
+        if p[j] >= plcl:
+            # Parcel quantities below the LCL
+            tg = tp * (p[j] / pp) ** (RD / CPD)
+            rg = rp
+            tlvr = tg * (1. + rg / EPS) / (1. + rg)
+            tvrdif[j] = tlvr - tv[j]
+        else:
+            # Parcel quantities above the LCL: iteratively calculate
+            # lifted parcel temperature and mixing ratio for reversible
+            # ascent
+            tg = t[j]
+            tjc = t[j] - 273.15
+            es = 6.112 * math.exp(17.67 * tjc / (243.5 + tjc))
+            rg = EPS * es / (p[j] - es)
+            nc = 0
+            found = False
+
+            # Look up the parcel temperature in the moist adiabat table
+            # and correct it with a single Newton step. If the correction
+            # is too large, use the iteration below
+            if tab is not None:
+                tl, iok = malook(s, rp, p[j], tab, tabpar)
+                if iok == 1:
+                    tc = tl - 273.15
+                    el = 6.112 * math.exp(17.67 * tc / (243.5 + tc))
+                    rl = EPS * el / (p[j] - el)
+                    alv = ALV0 + CPVMCL * tc
+                    sl = (CPD + rp * CL + alv * alv * rl / (RV * tl * tl)) / tl
+                    sg = ((CPD + rp * CL) * math.log(tl) -
+                          RD * math.log(p[j] - el) + alv * rl / tl)
+                    tgnew = tl + (s - sg) / sl
+                    tc = tgnew - 273.15
+                    enew = 6.112 * math.exp(17.67 * tc / (243.5 + tc))
+                    if abs(tgnew - tl) <= tabpar[7] and enew < (p[j] - 1.0):
+                        tg = tgnew
+                        rg = EPS * enew / (p[j] - enew)
+                        nc = 1
+                        found = True
+
+            while not found:
+                nc += 1
+                alv = ALV0 + CPVMCL * (tg - 273.15)
+                sl = (CPD + rp * CL + alv * alv * rg / (RV * tg * tg)) / tg
+                em = rg * p[j] / (EPS + rg)
+                sg = ((CPD + rp * CL) * math.log(tg) -
+                      RD * math.log(p[j] - em) + alv * rg / tg)
+                if nc < 3:
+                    ap = 0.3
+                else:
+                    ap = 1.0
+                tgnew = tg + ap * (s - sg) / sl
+                if abs(tgnew - tg) > 0.001:
+                    tg = tgnew
+                    tc = tg - 273.15
+                    enew = 6.112 * math.exp(17.67 * tc / (243.5 + tc))
+                    # Bail out if things get out of hand
+                    if nc > 500 or enew > (p[j] - 1.0):
+                        return 0.0, t[0], p[0], max(nc, ncmax), 2
+                    rg = EPS * enew / (p[j] - enew)
+                else:
+                    break
+            ncmax = max(nc, ncmax)
+
+            rmean = sig * rg + (1. - sig) * rp
+            tlvr = tg * (1. + rg / EPS) / (1. + rmean)
+            tvrdif[j] = tlvr - tv[j]
+
+    # Find maximum level of positive buoyancy, INB
+    inb = 0
+    for j in range(n - 1, jmin - 1, -1):
+        if tvrdif[j] > 0.0:
+            inb = max(inb, j)
+    if inb == 0:
+        return caped, tob, pnb, ncmax, 1
+
+    # Find positive and negative areas and CAPE
+    pa = 0.0
+    na = 0.0
+    for j in range(jmin + 1, inb + 1):
+        pfac = RD * (tvrdif[j] + tvrdif[j - 1]) * (p[j - 1] - p[j]) / (p[j] + p[j - 1])
+        pa = pa + max(pfac, 0.0)
+        na = na - min(pfac, 0.0)
+
+    # Area between parcel pressure and first level above it
+    pma = pp + p[jmin]
+    pfac = RD * (pp - p[jmin]) / pma
+    pa = pa + pfac * max(tvrdif[jmin], 0.0)
+    na = na - pfac * min(tvrdif[jmin], 0.0)
+
+    # Residual positive area above INB, and TO
+    pat = 0.0
+    tob = t[inb]
+    pnb = p[inb]
+    if inb < n - 1:
+        pinb = ((p[inb + 1] * tvrdif[inb] - p[inb] * tvrdif[inb + 1]) /
+                (tvrdif[inb] - tvrdif[inb + 1]))
+        pat = RD * tvrdif[inb] * (p[inb] - pinb) / (p[inb] + pinb)
+        tob = ((t[inb] * (pinb - p[inb + 1]) + t[inb + 1] * (p[inb] - pinb)) /
+               (p[inb] - p[inb + 1]))
+        pnb = pinb
+
+    caped = pa + pat - na
+    caped = max(caped, 0.0)
+    return caped, tob, pnb, ncmax, 1
+
+
+@njit(cache=True)
+def iterate(sstk, es0, psl, p, tk, rk, tv, n, jtop, pmi, isolv, ckcd, sig,
+            idiss, capea, ifl, ncmax, tvrdif, tab, tabpar):
+    """
+    Iteration to find the minimum pressure for a sounding prepared by
+    `prepcol`, given the environmental CAPE (see `PCITER` in `pcmin.f`).
+
+    :param float sstk: Sea surface temperature (K)
+    :param float es0: Saturation vapour pressure at the sea surface (hPa)
+    :param float ckcd: Ratio of C_k to C_D
+    :param float sig: 0 for reversible ascent, 1 for pseudo-adiabatic ascent
+    :param int idiss: 0 for no dissipative heating, 1 otherwise
+    :param float capea: Environmental CAPE (J/kg)
+    :param int ifl: 1, or 2 if the CAPE routine has already failed
+    :param int ncmax: Largest number of iterations taken by `cape` for
+                      the environmental CAPE
+
+    Other arguments are as for `pcmin` and `cape`.
+
+    :returns: the flag, the number of iterations, the final value of the
+              minimum pressure iteration (hPa), the CAPE and saturation
+              CAPE at the radius of maximum winds, the dissipative heating
+              factor and the mean virtual temperature from the last
+              iteration (see `final`), the outflow temperature (K) and
+              level (hPa), and `ncmax` updated with the calls to `cape`
+    """
+    nump = 0
+    secant = isolv == 1
+    maxit = 100 if secant else 1000
+    iflstart = ifl
+    pm = 950.0
+    if pmi >= 400.0:
+        pm = pmi
+    pm0 = pm
+    plo = 0.0
+    phi = 1.0e4
+    pmo = pm
+    fo = 0.0
+
+    while True:
+        # CAPE at radius of maximum winds
+        tp = tk[NK]
+        pp = min(pm, 1000.0)
+        rp = 0.622 * rk[NK] * psl / (pp * (0.622 + rk[NK]) - rk[NK] * psl)
+        capem, tom, pnbm, ncm, iflag = cape(tp, rp, pp, tk, tv, p, n, jtop,
+                                            sig, tvrdif, tab, tabpar)
+        if iflag != 1:
+            ifl = 2
+        ncmax = max(ncmax, ncm)
+
+        # Saturation CAPE at radius of maximum winds
+        tp = sstk
+        pp = min(pm, 1000.0)
+        rp = 0.622 * es0 / (pp - es0)
+        capems, to, otl, ncm, iflag = cape(tp, rp, pp, tk, tv, p, n, jtop,
+                                           sig, tvrdif, tab, tabpar)
+        if iflag != 1:
+            ifl = 2
+        ncmax = max(ncmax, ncm)
+        rat = sstk / to
+        if idiss == 0:
+            rat = 1.0
+
+        # Estimate of minimum pressure
+        rs0 = rp
+        tv1 = tk[0] * (1. + rk[0] / 0.622) / (1. + rk[0])
+        tvav = 0.5 * (tv1 + sstk * (1. + rs0 / 0.622) / (1. + rs0))
+        cat = capem - capea + 0.5 * ckcd * rat * (capems - capem)
+        cat = max(cat, 0.0)
+        pnew = psl * math.exp(-cat / (287.04 * tvav))
+
+        # Test for convergence
+        if abs(pnew - pm) > 0.2:
+            nump += 1
+            if nump > maxit or pnew < 400.0:
+                pm = pnew
+                ifl = 0
+                break
+            if secant:
+                # Bracket the solution of f = pnew - pm = 0 by plo
+                # (f > 0) and phi (f < 0). If the bracket is narrower
+                # than the convergence tolerance, or the secant iteration
+                # stalls, start again from the first guess with the
+                # fixed-point iteration
+                f = pnew - pm
+                if f > 0.0:
+                    plo = max(plo, pm)
+                if f < 0.0:
+                    phi = min(phi, pm)
+                if phi - plo < 0.2 or nump > 50:
+                    secant = False
+                    ifl = iflstart
+                    pm = pm0
+                    continue
+                # Secant step, replaced by bisection outside the bracket
+                psec = pnew
+                if nump > 1 and f != fo:
+                    psec = pm - f * (pm - pmo) / (f - fo)
+                pmo = pm
+                fo = f
+                if plo > 0.0 and phi < 1.0e4:
+                    if psec <= plo or psec >= phi:
+                        psec = 0.5 * (plo + phi)
+                else:
+                    psec = min(max(psec, 400.0), psl)
+                pm = psec
+            else:
+                pm = pnew
+        else:
+            break
+
+    return ifl, nump, pm, capem, capems, rat, tvav, to, otl, ncmax
+
+
+@njit(cache=True)
+def final(psl, ckcd, b, vreduc, capea, capem, capems, rat, tvav, ifl):
+    """
+    Minimum central pressure and maximum wind speed from the last
+    iteration of `iterate` (see `PCFIN` in `pcmin.f`). If the iteration
+    did not converge (`ifl` = 0), the minimum pressure is `psl`.
+
+    :returns: minimum central pressure (hPa) and maximum surface wind
+              speed (m/s)
+    """
+    pmin = psl
+    if ifl != 0:
+        catfac = 0.5 * (1. + 1. / b)
+        cat = capem - capea + ckcd * rat * catfac * (capems - capem)
+        cat = max(cat, 0.0)
+        pmin = psl * math.exp(-cat / (287.04 * tvav))
+    fac = max(0.0, (capems - capem))
+    vmax = vreduc * math.sqrt(ckcd * rat * fac)
+    return pmin, vmax
+
+
+@njit(cache=True)
+def pcmin(sst, psl, p, t, r, n, pmi=950.0, isolv=0, tab=None, tabpar=None):
+    """
+    Calculate the maximum wind speed and minimum central pressure
+    achievable in tropical cyclones, given a sounding and a sea surface
+    temperature. The input arrays are not modified.
+
+    :param float sst: Sea surface temperature (C)
+    :param float psl: Sea level pressure (hPa)
+    :param p: `numpy.ndarray` of pressure (hPa), surface first
+    :param t: `numpy.ndarray` of temperature (C)
+    :param r: `numpy.ndarray` of mixing ratio (g/kg)
+    :param int n: Number of points in the sounding
+    :param float pmi: First guess for the minimum pressure iteration
+                      (hPa), e.g. `pmc` from a previous call. Values below
+                      400 hPa (or NaN) are replaced with the default of
+                      950 hPa.
+    :param int isolv: Method used to solve for the minimum pressure:
+                      0 = fixed-point iteration, 1 = safeguarded secant
+                      iteration (see `PCMINW` in `pcmin.f`)
+    :param tab: Optional moist adiabat table (see `malook`)
+    :param tabpar: Parameters of the moist adiabat table
+
+    :returns: minimum central pressure (hPa), maximum surface wind speed
+              (m/s), a flag (1 = OK, 0 = no convergence (hypercane),
+              2 = CAPE routine failed), the number of iterations, the
+              final value of the minimum pressure iteration (hPa), the
+              outflow temperature (K) and level (hPa), and the largest
+              number of iterations taken by `cape` at any level
+    """
+    sstk = sst + 273.15
+    es0 = 6.112 * math.exp(17.67 * sst / (243.5 + sst))
+    tk, rk, tv, jtop = prepcol(p, t, r, n)
+    tvrdif = np.empty(n)
+
+    # Environmental CAPE
+    ifl = 1
+    capea, toa, pnba, ncmax, iflag = cape(tk[NK], rk[NK], p[NK], tk, tv, p,
+                                          n, jtop, SIG, tvrdif, tab, tabpar)
+    if iflag != 1:
+        ifl = 2
+
+    ifl, nump, pm, capem, capems, rat, tvav, to, otl, ncmax = iterate(
+        sstk, es0, psl, p, tk, rk, tv, n, jtop, pmi, isolv, CKCD, SIG, IDISS,
+        capea, ifl, ncmax, tvrdif, tab, tabpar)
+    pmin, vmax = final(psl, CKCD, B, VREDUC, capea, capem, capems, rat, tvav,
+                       ifl)
+    return pmin, vmax, ifl, nump, pm, to, otl, ncmax
+
+
+@njit(cache=True)
+def pcmins(sst, psl, p, t, r, n, pmi, isolv, par, tab, tabpar, pmin, vmax,
+           ifl, nump, pmc, to, otl, ncmax):
+    """
+    As `pcmin`, for several sets of the adjustable parameters (see
+    `PCMINS` in `pcmin.f`). The environmental CAPE is calculated once
+    for each value of `sig`, and sets that differ only in `b` or
+    `vreduc` share the minimum pressure iteration.
+
+    :param par: `numpy.ndarray` (5, npar) of CKCD, SIG, IDISS, B and
+                VREDUC for each parameter set
+    :param pmin, vmax, ifl, nump, pmc, to, otl, ncmax: `numpy.ndarray`
+        (npar,) filled with the results for each set
+
+    Other arguments are as for `pcmin`.
+    """
+    npar = par.shape[1]
+    sstk = sst + 273.15
+    es0 = 6.112 * math.exp(17.67 * sst / (243.5 + sst))
+    tk, rk, tv, jtop = prepcol(p, t, r, n)
+    tvrdif = np.empty(n)
+    capea = np.empty(npar)
+    ifla = np.empty(npar, dtype=np.int32)
+    nca = np.empty(npar, dtype=np.int32)
+    capem = np.empty(npar)
+    capems = np.empty(npar)
+    rat = np.empty(npar)
+    tvav = np.empty(npar)
+
+    for k in range(npar):
+        # Earlier sets with the same SIG (js), and with the same CKCD,
+        # SIG and IDISS (ji)
+        js = -1
+        ji = -1
+        for j in range(k - 1, -1, -1):
+            if par[1, j] == par[1, k]:
+                js = j
+                if par[0, j] == par[0, k] and par[2, j] == par[2, k]:
+                    ji = j
+
+        if ji >= 0:
+            capea[k] = capea[ji]
+            ifla[k] = ifla[ji]
+            nca[k] = nca[ji]
+            ifl[k] = ifl[ji]
+            nump[k] = nump[ji]
+            pmc[k] = pmc[ji]
+            capem[k] = capem[ji]
+            capems[k] = capems[ji]
+            rat[k] = rat[ji]
+            tvav[k] = tvav[ji]
+            to[k] = to[ji]
+            otl[k] = otl[ji]
+            ncmax[k] = ncmax[ji]
+        else:
+            if js >= 0:
+                capea[k] = capea[js]
+                ifla[k] = ifla[js]
+                nca[k] = nca[js]
+            else:
+                capea[k], toa, pnba, nca[k], ifla[k] = cape(
+                    tk[NK], rk[NK], p[NK], tk, tv, p, n, jtop, par[1, k],
+                    tvrdif, tab, tabpar)
+            flag = 1
+            if ifla[k] != 1:
+                flag = 2
+            (ifl[k], nump[k], pmc[k], capem[k], capems[k], rat[k],
+             tvav[k], to[k], otl[k], ncmax[k]) = iterate(
+                 sstk, es0, psl, p, tk, rk, tv, n, jtop, pmi, isolv,
+                 par[0, k], par[1, k], int(round(par[2, k])), capea[k],
+                 flag, nca[k], tvrdif, tab, tabpar)
+        pmin[k], vmax[k] = final(psl, par[0, k], par[3, k], par[4, k],
+                                 capea[k], capem[k], capems[k], rat[k],
+                                 tvav[k], ifl[k])
+
+
+@njit(parallel=True, cache=True)
+def _pcminv(sst, psl, p, t, r, n, pminit, isolv, tab, tabpar, pmin, vmax,
+            ifl, niter, pmc, to, otl, ncmax):
+    """
+    Loop over columns in parallel, filling the output arrays.
+
+    """
+    for i in prange(sst.shape[0]):
+        (pmin[i], vmax[i], ifl[i], niter[i], pmc[i], to[i], otl[i],
+         ncmax[i]) = pcmin(sst[i], psl[i], p[i], t[i], r[i], n, pminit[i],
+                           isolv, tab, tabpar)
+
+
+@njit(parallel=True, cache=True)
+def _pcminp(sst, psl, p, t, r, n, pminit, isolv, tab, tabpar, pmin, vmax,
+            ifl, niter, pmc, to, otl, ncmax):
+    """
+    Loop over columns in parallel, filling the output arrays. All
+    columns share the pressure levels `p`.
+
+    """
+    for i in prange(sst.shape[0]):
+        (pmin[i], vmax[i], ifl[i], niter[i], pmc[i], to[i], otl[i],
+         ncmax[i]) = pcmin(sst[i], psl[i], p, t[i], r[i], n, pminit[i],
+                           isolv, tab, tabpar)
+
+
+@njit(parallel=True, cache=True)
+def _pcsweep(sst, psl, p, t, r, n, pminit, isolv, par, tab, tabpar, pmin,
+             vmax, ifl, niter, pmc, to, otl, ncmax):
+    """
+    Loop over columns in parallel, filling the (ncol, npar) output
+    arrays. All columns share the pressure levels `p`.
+
+    """
+    for i in prange(sst.shape[0]):
+        pcmins(sst[i], psl[i], p, t[i], r[i], n, pminit[i], isolv, par,
+               tab, tabpar, pmin[i], vmax[i], ifl[i], niter[i], pmc[i], to[i],
+               otl[i], ncmax[i])
+
+
+def _batch(kernel, sst, psl, p, t, r, n, pminit, isolv):
+    """
+    Convert the inputs of `pcminv` or `pcminp`, allocate the outputs and
+    call the compiled loop over columns.
+
+    """
+    sst = np.ascontiguousarray(sst, dtype=np.float64)
+    psl = np.ascontiguousarray(psl, dtype=np.float64)
+    p = np.ascontiguousarray(p, dtype=np.float64)
+    t = np.ascontiguousarray(t, dtype=np.float64)
+    r = np.ascontiguousarray(r, dtype=np.float64)
+    if n is None:
+        n = t.shape[1]
+
+    ncol = sst.shape[0]
+    if pminit is None:
+        pminit = np.full(ncol, 950.0)
+    pminit = np.ascontiguousarray(pminit, dtype=np.float64)
+    pmin = np.empty(ncol, dtype=np.float32)
+    vmax = np.empty(ncol, dtype=np.float32)
+    ifl = np.empty(ncol, dtype=np.int32)
+    niter = np.empty(ncol, dtype=np.int32)
+    pmc = np.empty(ncol, dtype=np.float32)
+    to = np.empty(ncol, dtype=np.float32)
+    otl = np.empty(ncol, dtype=np.float32)
+    ncmax = np.empty(ncol, dtype=np.int32)
+    kernel(sst, psl, p, t, r, n, pminit, isolv, _MATAB, _MAPAR,
+           pmin, vmax, ifl, niter, pmc, to, otl, ncmax)
+    return pmin, vmax, ifl, niter, pmc, to, otl, ncmax
+
+
+def pcminv(sst, psl, p, t, r, n=None, pminit=None, isolv=0):
+    """
+    Batched version of `pcmin`, with the same interface as the
+    `PCMINV` subroutine in `pcmin.f`.
+
+    :param sst: `numpy.ndarray` (ncol,) of sea surface temperature (C)
+    :param psl: `numpy.ndarray` (ncol,) of sea level pressure (hPa)
+    :param p: `numpy.ndarray` (ncol, nlev) of pressure (hPa)
+    :param t: `numpy.ndarray` (ncol, nlev) of temperature (C)
+    :param r: `numpy.ndarray` (ncol, nlev) of mixing ratio (g/kg)
+    :param int n: Number of points in each sounding (default nlev)
+    :param pminit: Optional `numpy.ndarray` (ncol,) of first guess for
+                   the minimum pressure iteration (hPa). Default 950 hPa.
+    :param int isolv: Method used to solve for the minimum pressure
+                      (see `pcmin`). Default 0 (fixed-point iteration).
+
+    :returns: `pmin`, `vmax`, `ifl`, `niter`, `pmc`, `to`, `otl` and
+              `ncmax` arrays of shape (ncol,)
+    """
+    return _batch(_pcminv, sst, psl, p, t, r, n, pminit, isolv)
+
+
+def pcminp(sst, psl, p, t, r, n=None, pminit=None, isolv=0):
+    """
+    As `pcminv`, for soundings that share the same pressure levels, with
+    the same interface as the `PCMINP` subroutine in `pcmin.f`.
+
+    :param p: `numpy.ndarray` (nlev,) of pressure (hPa), used for every
+              column
+
+    Other arguments and the return values are as for `pcminv`.
+    """
+    return _batch(_pcminp, sst, psl, p, t, r, n, pminit, isolv)
+
+
+def pcsweep(sst, psl, p, t, r, par, n=None, pminit=None, isolv=0):
+    """
+    As `pcminp`, for several sets of the adjustable parameters, with the
+    same interface as the `PCSWEEP` subroutine in `pcmin.f`.
+
+    :param par: `numpy.ndarray` (5, npar) of CKCD, SIG, IDISS, B and
+                VREDUC for each parameter set
+
+    Other arguments are as for `pcminp`.
+
+    :returns: `pmin`, `vmax`, `ifl`, `niter`, `pmc`, `to`, `otl` and
+              `ncmax` arrays of shape (ncol, npar)
+    """
+    sst = np.ascontiguousarray(sst, dtype=np.float64)
+    psl = np.ascontiguousarray(psl, dtype=np.float64)
+    p = np.ascontiguousarray(p, dtype=np.float64)
+    t = np.ascontiguousarray(t, dtype=np.float64)
+    r = np.ascontiguousarray(r, dtype=np.float64)
+    par = np.ascontiguousarray(par, dtype=np.float64)
+    if n is None:
+        n = t.shape[1]
+
+    ncol, npar = sst.shape[0], par.shape[1]
+    if pminit is None:
+        pminit = np.full(ncol, 950.0)
+    pminit = np.ascontiguousarray(pminit, dtype=np.float64)
+    pmin = np.empty((ncol, npar), dtype=np.float32)
+    vmax = np.empty((ncol, npar), dtype=np.float32)
+    ifl = np.empty((ncol, npar), dtype=np.int32)
+    niter = np.empty((ncol, npar), dtype=np.int32)
+    pmc = np.empty((ncol, npar), dtype=np.float32)
+    to = np.empty((ncol, npar), dtype=np.float32)
+    otl = np.empty((ncol, npar), dtype=np.float32)
+    ncmax = np.empty((ncol, npar), dtype=np.int32)
+    _pcsweep(sst, psl, p, t, r, n, pminit, isolv, par, _MATAB, _MAPAR,
+             pmin, vmax, ifl, niter, pmc, to, otl, ncmax)
+    return pmin, vmax, ifl, niter, pmc, to, otl, ncmax
+
+
+def setnthreads(nthreads):
+    """
+    Set the number of threads used by `pcminv`.
+
+    :param int nthreads: Number of threads
+    """
+    if numba is not None:
+        numba.set_num_threads(max(1, min(nthreads, numba.config.NUMBA_NUM_THREADS)))
+
+
+def getnthreads():
+    """
+    :returns: The number of threads used by `pcminv`
+    """
+    if numba is not None:
+        return numba.get_num_threads()
+    return 1
+
+
+def setmatab(tab, s0, ds, r0, dr, p0, dp, dt):
+    """
+    Install the moist adiabat table used by `cape`, with the same
+    interface as the `SETMATAB` subroutine in `pcmin.f`.
+
+    :param tab: `numpy.ndarray` (ns, nr, np) of the temperature (K) of a
+                saturated parcel as a function of reversible entropy,
+                total water mixing ratio and log of pressure
+    :param float s0: First value of reversible entropy (J/kg/K)
+    :param float ds: Spacing of reversible entropy (J/kg/K)
+    :param float r0: First value of total water mixing ratio (kg/kg)
+    :param float dr: Spacing of total water mixing ratio (kg/kg)
+    :param float p0: First value of log of pressure (log(hPa))
+    :param float dp: Spacing of log of pressure
+    :param float dt: Largest correction (K) to the interpolated
+                     temperature that is accepted
+
+    :returns: 0 if the table was installed, 1 if it is not 3-dimensional
+    """
+    global _MATAB
+    if np.ndim(tab) != 3:
+        return 1
+    _MATAB = np.ascontiguousarray(tab, dtype=np.float32)
+    _MAPAR[:] = (1.0, s0, ds, r0, dr, p0, dp, dt)
+    return 0
+
+
+def usematab(ion):
+    """
+    Turn use of the moist adiabat table on (1) or off (0). The table must
+    have been set with `setmatab`.
+
+    :param int ion: 1 to use the table, 0 otherwise
+    """
+    _MAPAR[0] = 1.0 if (ion and _MAPAR[2] > 0.0) else 0.0
@@ -0,0 +1,615 @@
+"""
+:mod:`pcmin_numpy` -- Vectorised NumPy implementation of the PI kernel
+======================================================================
+
+.. module:: pcmin_numpy
+    :synopsis: An implementation of the `PCMIN` and `CAPE` subroutines
+               in `pcmin.f` that iterates all columns in lockstep using
+               NumPy arrays. Both the minimum pressure iteration and the
+               reversible ascent iteration in `CAPE` keep an active set
+               of columns (or levels), and converged columns drop out of
+               the active set at each iteration.
+
+               This provides the same interface as the f2py-wrapped
+               extension (`pcminv`, `pcminp`, `pcsweep`, `setnthreads`,
+               `getnthreads`, `setmatab`, `usematab`), and requires no compiled code.
+
+.. moduleauthor: Craig Arthur, <craig.arthur@ga.gov.au>
+
+"""
+
+import numpy as np
+
+from pcmin_numba import (CPD, CL, CPVMCL, RV, RD, EPS, ALV0,
+                         CKCD, SIG, IDISS, B, NK, VREDUC)
+
+# Moist adiabat table (see :mod:`moistadiabat`) and its parameters:
+# [in use, S0, DS, R0, DR, log(P0), DlogP, largest correction]
+_MATAB = None
+_MAPAR = np.zeros(8)
+
+
+def cape(tp, rp, pp, t, tv, p, usable, sig=SIG):
+    """
+    Calculate the CAPE of parcels with pressure `pp` (hPa), temperature
+    `tp` (K) and mixing ratio `rp` (kg/kg), given soundings of
+    temperature (`t`, K) and virtual temperature (`tv`, K) as a function
+    of pressure (`p`, hPa). Soundings are ordered from the surface
+    upwards.
+
+    :param tp: `numpy.ndarray` (ncol,) of parcel temperature (K)
+    :param rp: `numpy.ndarray` (ncol,) of parcel mixing ratio (kg/kg)
+    :param pp: `numpy.ndarray` (ncol,) of parcel pressure (hPa)
+    :param t: `numpy.ndarray` (ncol, nlev) of temperature (K)
+    :param tv: `numpy.ndarray` (ncol, nlev) of virtual temperature (K)
+    :param p: `numpy.ndarray` (ncol, nlev) of pressure (hPa)
+    :param usable: `numpy.ndarray` (ncol, nlev) of bool, False for levels
+                   above 59 hPa, through which parcels are not lifted
+    :param float sig: 0 for reversible ascent, 1 for pseudo-adiabatic ascent
+
+    :returns: (ncol,) arrays of CAPE (J/kg), temperature (K) and
+              pressure (hPa) at the level of neutral buoyancy, the
+              largest number of iterations taken to find the lifted
+              parcel temperature at any level, and a flag (1 = OK,
+              0 = improper sounding, 2 = no convergence)
+    """
+    ncol, n = t.shape
+    cols = np.arange(ncol)
+    caped = np.zeros(ncol)
+    tob = t[:, 0].copy()
+    ncmax = np.zeros(ncol, dtype=np.int32)
+    iflag = np.ones(ncol, dtype=np.int32)
+
+    bad = (rp < 1.0E-6) | (tp < 200.0)
+    iflag[bad] = 0
+
+    # Parcel quantities, including reversible entropy, S
+    tpc = tp - 273.15
+    esp = 6.112 * np.exp(17.67 * tpc / (243.5 + tpc))
+    evp = rp * pp / (EPS + rp)
+    rh = np.minimum(evp / esp, 1.0)
+    alv = ALV0 + CPVMCL * tpc
+    s = ((CPD + rp * CL) * np.log(tp) - RD * np.log(pp - evp) +
+         alv * rp / tp - rp * RV * np.log(rh))
+
+    # Lifted condensation pressure, PLCL
+    chi = tp / (1669.0 - 122.0 * rh - tp)
+    plcl = pp * (rh ** chi)
+
+    # Levels through which the parcel is lifted: not above 60 hPa, and
+    # not below the parcel level
+    lifted = usable & (p < pp[:, None]) & ~bad[:, None]
+    hasany = lifted.any(axis=1)
+    jmin = np.argmax(lifted, axis=1)
+
+    tvrdif = np.zeros((ncol, n))
+
+    # Parcel quantities below the LCL
+    dry = lifted & (p >= plcl[:, None])
+    ic, jc = np.nonzero(dry)
+    tg = tp[ic] * (p[ic, jc] / pp[ic]) ** (RD / CPD)
+    rg = rp[ic]
+    tvrdif[ic, jc] = tg * (1. + rg / EPS) / (1. + rg) - tv[ic, jc]
+
+    # Parcel quantities above the LCL: iteratively calculate lifted parcel
+    # temperature and mixing ratio for reversible ascent, for all levels
+    # of all columns at once
+    ic, jc = np.nonzero(lifted & ~dry)
+    tgout = np.empty(len(ic))
+    rgout = np.empty(len(ic))
+    failed = np.zeros(ncol, dtype=bool)
+
+    idx = np.arange(len(ic))
+    pj = p[ic, jc]
+    rpj = rp[ic]
+    sj = s[ic]
+    tg = t[ic, jc]
+    tjc = tg - 273.15
+    es = 6.112 * np.exp(17.67 * tjc / (243.5 + tjc))
+    rg = EPS * es / (pj - es)
+
+    # Look up the parcel temperature in the moist adiabat table and
+    # correct it with a single Newton step. Points where the correction
+    # is too large use the iteration below
+    if _MAPAR[0] == 1.0 and idx.size > 0:
+        from moistadiabat import interpolate
+        tl = interpolate(_MATAB, sj, rpj, pj, *_MAPAR[1:7])
+        tc = tl - 273.15
+        el = 6.112 * np.exp(17.67 * tc / (243.5 + tc))
+        rl = EPS * el / (pj - el)
+        alv = ALV0 + CPVMCL * tc
+        sl = (CPD + rpj * CL + alv * alv * rl / (RV * tl * tl)) / tl
+        sg = (CPD + rpj * CL) * np.log(tl) - RD * np.log(pj - el) + alv * rl / tl
+        tgnew = tl + (sj - sg) / sl
+        tc = tgnew - 273.15
+        enew = 6.112 * np.exp(17.67 * tc / (243.5 + tc))
+        found = (np.abs(tgnew - tl) <= _MAPAR[7]) & (enew < (pj - 1.0))
+        tgout[found] = tgnew[found]
+        rgout[found] = (EPS * enew / (pj - enew))[found]
+        ncmax[ic[found]] = 1
+        keep = ~found
+        idx, pj, rpj, sj, tg, rg = (idx[keep], pj[keep], rpj[keep],
+                                    sj[keep], tg[keep], rg[keep])
+
+    nc = 0
+    while idx.size > 0:
+        nc += 1
+        alv = ALV0 + CPVMCL * (tg - 273.15)
+        sl = (CPD + rpj * CL + alv * alv * rg / (RV * tg * tg)) / tg
+        em = rg * pj / (EPS + rg)
+        sg = (CPD + rpj * CL) * np.log(tg) - RD * np.log(pj - em) + alv * rg / tg
+        ap = 0.3 if nc < 3 else 1.0
+        tgnew = tg + ap * (sj - sg) / sl
+
+        # Converged points drop out of the active set
+        active = np.abs(tgnew - tg) > 0.001
+        done = ~active
+        tgout[idx[done]] = tg[done]
+        rgout[idx[done]] = rg[done]
+        # nc only increases, so the last assignment is the column maximum
+        ncmax[ic[idx[done]]] = nc
+
+        idx, pj, rpj, sj, tg = (idx[active], pj[active], rpj[active],
+                                sj[active], tgnew[active])
+        tc = tg - 273.15
+        enew = 6.112 * np.exp(17.67 * tc / (243.5 + tc))
+
+        # Bail out if things get out of hand. All remaining levels of a
+        # failed column are dropped from the active set
+        blowup = (nc > 500) | (enew > (pj - 1.0))
+        failed[ic[idx[blowup]]] = True
+        ncmax[ic[idx[blowup]]] = nc
+        active = ~failed[ic[idx]]
+        idx, pj, rpj, sj, tg, enew = (idx[active], pj[active], rpj[active],
+                                      sj[active], tg[active], enew[active])
+        rg = EPS * enew / (pj - enew)
+
+    ok = ~failed[ic]
+    ic, jc, tg, rg = ic[ok], jc[ok], tgout[ok], rgout[ok]
+    rmean = sig * rg + (1. - sig) * rp[ic]
+    tvrdif[ic, jc] = tg * (1. + rg / EPS) / (1. + rmean) - tv[ic, jc]
+    iflag[failed] = 2
+
+    # Find maximum level of positive buoyancy, INB
+    jj = np.arange(n)[None, :]
+    positive = (tvrdif > 0.0) & (jj >= jmin[:, None]) & hasany[:, None]
+    inb = np.where(positive.any(axis=1),
+                   n - 1 - np.argmax(positive[:, ::-1], axis=1), 0)
+    calc = (inb > 0) & (iflag == 1)
+
+    # Find positive and negative areas and CAPE
+    pfac = np.zeros((ncol, n))
+    pfac[:, 1:] = (RD * (tvrdif[:, 1:] + tvrdif[:, :-1]) *
+                   (p[:, :-1] - p[:, 1:]) / (p[:, 1:] + p[:, :-1]))
+    inrange = (jj > jmin[:, None]) & (jj <= inb[:, None])
+    pa = np.where(inrange, np.maximum(pfac, 0.0), 0.0).sum(axis=1)
+    na = -np.where(inrange, np.minimum(pfac, 0.0), 0.0).sum(axis=1)
+
+    # Area between parcel pressure and first level above it
+    pjmin = p[cols, jmin]
+    tvjmin = tvrdif[cols, jmin]
+    pfac = RD * (pp - pjmin) / (pp + pjmin)
+    pa = pa + pfac * np.maximum(tvjmin, 0.0)
+    na = na - pfac * np.minimum(tvjmin, 0.0)
+
+    # Residual positive area above INB, and TO
+    inb1 = np.minimum(inb + 1, n - 1)
+    pinb, pinb1 = p[cols, inb], p[cols, inb1]
+    tinb, tinb1 = t[cols, inb], t[cols, inb1]
+    tvinb, tvinb1 = tvrdif[cols, inb], tvrdif[cols, inb1]
+    residual = calc & (inb < n - 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pnb = (pinb1 * tvinb - pinb * tvinb1) / (tvinb - tvinb1)
+        pat = np.where(residual, RD * tvinb * (pinb - pnb) / (pinb + pnb), 0.0)
+        tnb = (tinb * (pnb - pinb1) + tinb1 * (pinb - pnb)) / (pinb - pinb1)
+
+    tob = np.where(calc, np.where(residual, tnb, tinb), tob)
+    pnb = np.where(calc, np.where(residual, pnb, pinb), p[:, 0])
+    caped = np.where(calc, np.maximum(pa + pat - na, 0.0), caped)
+    return caped, tob, pnb, ncmax, iflag
+
+
+def iterate(sstk, es0, psl, p, tk, rk, tv, usable, capea, capefail,
+            ncmaxa, pminit=None, isolv=0, ckcd=CKCD, sig=SIG, idiss=IDISS):
+    """
+    Iteration to find the minimum pressure for all columns in lockstep,
+    given the environmental CAPE (see `PCITER` in `pcmin.f`). Columns
+    drop out of the active set once the minimum pressure has converged.
+
+    :param sstk: `numpy.ndarray` (ncol,) of sea surface temperature (K)
+    :param es0: `numpy.ndarray` (ncol,) of saturation vapour pressure at
+                the sea surface (hPa)
+    :param psl: `numpy.ndarray` (ncol,) of sea level pressure (hPa)
+    :param p: `numpy.ndarray` (ncol, nlev) of pressure (hPa)
+    :param tk: `numpy.ndarray` (ncol, nlev) of temperature (K)
+    :param rk: `numpy.ndarray` (ncol, nlev) of mixing ratio (kg/kg)
+    :param tv: `numpy.ndarray` (ncol, nlev) of virtual temperature (K)
+    :param usable: `numpy.ndarray` (ncol, nlev) of bool (see `cape`)
+    :param capea: `numpy.ndarray` (ncol,) of environmental CAPE (J/kg)
+    :param capefail: `numpy.ndarray` (ncol,) of bool, True where the CAPE
+                     routine has already failed
+    :param ncmaxa: `numpy.ndarray` (ncol,) of the largest number of
+                   iterations taken by `cape` for the environmental CAPE
+    :param pminit: Optional first guess for the minimum pressure (see
+                   `pcmin`)
+    :param int isolv: Method used to solve for the minimum pressure (see
+                      `pcmin`)
+    :param float ckcd: Ratio of C_k to C_D
+    :param float sig: 0 for reversible ascent, 1 for pseudo-adiabatic ascent
+    :param int idiss: 0 for no dissipative heating, 1 otherwise
+
+    :returns: (ncol,) arrays of the flag, the number of iterations, the
+              final value of the minimum pressure iteration (hPa), the
+              CAPE and saturation CAPE at the radius of maximum winds,
+              the dissipative heating factor and the mean virtual
+              temperature from the last iteration (see `final`), the
+              outflow temperature (K) and level (hPa), and `ncmaxa`
+              updated with the calls to `cape`
+    """
+    ncol = sstk.shape[0]
+    capefail = capefail.copy()
+    hypercane = np.zeros(ncol, dtype=bool)
+    capemd = np.zeros(ncol)
+    capemsd = np.zeros(ncol)
+    ratd = np.zeros(ncol)
+    tvavd = np.zeros(ncol)
+    tod = np.zeros(ncol)
+    otld = np.zeros(ncol)
+    ncmax = ncmaxa.copy()
+
+    tv1 = tk[:, 0] * (1. + rk[:, 0] / 0.622) / (1. + rk[:, 0])
+
+    idx = np.arange(ncol)
+    pm = np.full(ncol, 950.0)
+    if pminit is not None:
+        pm = np.where(pminit >= 400.0, pminit, pm)
+    pm0 = pm.copy()
+    nump = np.zeros(ncol, dtype=int)
+    # Columns still using the secant iteration
+    secant = np.full(ncol, isolv == 1)
+    maxit = 100 if isolv == 1 else 1000
+    capefail0 = capefail.copy()
+    pmc = np.zeros(ncol)
+    plo = np.zeros(ncol)
+    phi = np.full(ncol, 1.0e4)
+    pmo = pm.copy()
+    fo = np.zeros(ncol)
+    while idx.size > 0:
+        tki, tvi, pi, usi = tk[idx], tv[idx], p[idx], usable[idx]
+        rnk = rk[idx, NK]
+        pslx = psl[idx]
+        sstkx = sstk[idx]
+
+        # CAPE at radius of maximum winds
+        pp = np.minimum(pm, 1000.0)
+        rp = 0.622 * rnk * pslx / (pp * (0.622 + rnk) - rnk * pslx)
+        capem, tom, pnbm, ncm, iflag = cape(tki[:, NK], rp, pp, tki, tvi,
+                                            pi, usi, sig)
+        capefail[idx] |= (iflag != 1)
+        ncmax[idx] = np.maximum(ncmax[idx], ncm)
+
+        # Saturation CAPE at radius of maximum winds
+        rp = 0.622 * es0[idx] / (pp - es0[idx])
+        capems, to, otl, ncm, iflag = cape(sstkx, rp, pp, tki, tvi, pi, usi,
+                                           sig)
+        capefail[idx] |= (iflag != 1)
+        ncmax[idx] = np.maximum(ncmax[idx], ncm)
+        rat = sstkx / to
+        if idiss == 0:
+            rat = np.ones_like(rat)
+
+        # Estimate of minimum pressure
+        rs0 = rp
+        tvav = 0.5 * (tv1[idx] + sstkx * (1. + rs0 / 0.622) / (1. + rs0))
+        capea_ = capea[idx]
+        cat = np.maximum(capem - capea_ + 0.5 * ckcd * rat * (capems - capem), 0.0)
+        pnew = pslx * np.exp(-cat / (287.04 * tvav))
+
+        # Test for convergence
+        active = np.abs(pnew - pm) > 0.2
+        conv = ~active
+
+        nump[idx[active]] += 1
+
+        fail = active & ((nump[idx] > maxit) | (pnew < 400.0))
+
+        # Bracket the solution of f = pnew - pm = 0 by plo (f > 0) and
+        # phi (f < 0). If the bracket of a secant column is narrower
+        # than the convergence tolerance, or its secant iteration
+        # stalls, it starts again from the first guess with the
+        # fixed-point iteration
+        f = pnew - pm
+        sec = secant[idx]
+        plo = np.where(sec & (f > 0.0), np.maximum(plo, pm), plo)
+        phi = np.where(sec & (f < 0.0), np.minimum(phi, pm), phi)
+        restart = active & ~fail & sec & ((phi - plo < 0.2) |
+                                          (nump[idx] > 50))
+        step = pnew
+        if isolv == 1:
+            # Secant step, replaced by bisection outside the bracket
+            psec = np.where((nump[idx] > 1) & (f != fo),
+                            pm - f * (pm - pmo) / (f - fo), pnew)
+            pmo, fo = pm, f
+            bracket = (plo > 0.0) & (phi < 1.0e4)
+            outside = (psec <= plo) | (psec >= phi)
+            psec = np.where(bracket,
+                            np.where(outside, 0.5 * (plo + phi), psec),
+                            np.minimum(np.maximum(psec, 400.0), pslx))
+            step = np.where(sec, psec, pnew)
+        pm = np.where(fail, pnew,
+                      np.where(restart, pm0[idx],
+                               np.where(active, step, pm)))
+        ri = idx[restart]
+        secant[ri] = False
+        capefail[ri] = capefail0[ri]
+        hypercane[idx[fail]] = True
+
+        done = conv | fail
+        di = idx[done]
+        pmc[di] = pm[done]
+        capemd[di], capemsd[di] = capem[done], capems[done]
+        ratd[di], tvavd[di] = rat[done], tvav[done]
+        tod[di], otld[di] = to[done], otl[done]
+
+        keep = ~done
+        idx, pm = idx[keep], pm[keep]
+        plo, phi, pmo, fo = plo[keep], phi[keep], pmo[keep], fo[keep]
+
+    ifl = np.where(hypercane, 0, np.where(capefail, 2, 1)).astype(np.int32)
+    return ifl, nump, pmc, capemd, capemsd, ratd, tvavd, tod, otld, ncmax
+
+
+def final(psl, capea, capem, capems, rat, tvav, ifl, ckcd=CKCD, b=B,
+          vreduc=VREDUC):
+    """
+    Minimum central pressure and maximum wind speed from the last
+    iteration of `iterate` (see `PCFIN` in `pcmin.f`). Where the
+    iteration did not converge (`ifl` = 0), the minimum pressure is
+    `psl`.
+
+    :returns: (ncol,) arrays of minimum central pressure (hPa) and
+              maximum surface wind speed (m/s)
+    """
+    catfac = 0.5 * (1. + 1. / b)
+    cat = np.maximum(capem - capea + ckcd * rat * catfac * (capems - capem), 0.0)
+    pmin = np.where(ifl != 0, psl * np.exp(-cat / (287.04 * tvav)), psl)
+    fac = np.maximum(0.0, capems - capem)
+    vmax = vreduc * np.sqrt(ckcd * rat * fac)
+    return pmin, vmax
+
+
+def sweep(sst, psl, p, t, r, par, pminit=None, isolv=0):
+    """
+    Calculate the maximum wind speed and minimum central pressure for
+    several sets of the adjustable parameters (see `PCMINS` in
+    `pcmin.f`). The soundings are prepared once, the environmental CAPE
+    is calculated once for each value of SIG, and sets that differ only
+    in B or VREDUC share the minimum pressure iteration.
+
+    :param par: `numpy.ndarray` (5, npar) of CKCD, SIG, IDISS, B and
+                VREDUC for each parameter set
+
+    Other arguments are as for `pcmin`.
+
+    :returns: (ncol, npar) arrays of `pmin`, `vmax`, `ifl`, `niter`,
+              `pmc`, `to`, `otl` and `ncmax` (see `pcmin`)
+    """
+    ncol, npar = sst.shape[0], par.shape[1]
+    sstk = sst + 273.15
+    es0 = 6.112 * np.exp(17.67 * sst / (243.5 + sst))
+    # Quantities shared by all calls to `cape` (the input arrays are not
+    # modified)
+    tk = t + 273.15
+    rk = r * 0.001
+    tv = tk * (1. + rk / EPS) / (1. + rk)
+    usable = p >= 59.0
+
+    pmin = np.empty((ncol, npar))
+    vmax = np.empty((ncol, npar))
+    ifl = np.empty((ncol, npar), dtype=np.int32)
+    nump = np.empty((ncol, npar), dtype=int)
+    pmc = np.empty((ncol, npar))
+    to = np.empty((ncol, npar))
+    otl = np.empty((ncol, npar))
+    ncmax = np.empty((ncol, npar), dtype=np.int32)
+
+    envcape = {}
+    iterations = {}
+    for k in range(npar):
+        ckcd, sig, idiss, b, vreduc = par[:, k]
+        idiss = int(round(idiss))
+        # Environmental CAPE
+        if sig not in envcape:
+            capea, toa, pnba, nca, iflag = cape(tk[:, NK], rk[:, NK],
+                                                p[:, NK], tk, tv, p, usable,
+                                                sig)
+            envcape[sig] = (capea, iflag != 1, nca)
+        capea, capefail, nca = envcape[sig]
+
+        key = (ckcd, sig, idiss)
+        if key not in iterations:
+            iterations[key] = iterate(sstk, es0, psl, p, tk, rk, tv, usable,
+                                      capea, capefail, nca, pminit, isolv,
+                                      ckcd, sig, idiss)
+        (flag, n, pm, capem, capems, rat, tvav, to[:, k], otl[:, k],
+         ncmax[:, k]) = iterations[key]
+        pmin[:, k], vmax[:, k] = final(psl, capea, capem, capems, rat, tvav,
+                                       flag, ckcd, b, vreduc)
+        ifl[:, k], nump[:, k], pmc[:, k] = flag, n, pm
+    return pmin, vmax, ifl, nump, pmc, to, otl, ncmax
+
+
+def pcmin(sst, psl, p, t, r, pminit=None, isolv=0):
+    """
+    Calculate the maximum wind speed and minimum central pressure
+    achievable in tropical cyclones, given soundings and sea surface
+    temperatures. All columns are iterated in lockstep; columns drop out
+    of the active set once the minimum pressure has converged.
+
+    :param sst: `numpy.ndarray` (ncol,) of sea surface temperature (C)
+    :param psl: `numpy.ndarray` (ncol,) of sea level pressure (hPa)
+    :param p: `numpy.ndarray` (ncol, nlev) of pressure (hPa), surface first
+    :param t: `numpy.ndarray` (ncol, nlev) of temperature (C)
+    :param r: `numpy.ndarray` (ncol, nlev) of mixing ratio (g/kg)
+    :param pminit: Optional `numpy.ndarray` (ncol,) of first guess for
+                   the minimum pressure iteration (hPa). Values below
+                   400 hPa (or NaN) are replaced with the default of 950 hPa.
+    :param int isolv: Method used to solve for the minimum pressure:
+                      0 = fixed-point iteration, 1 = safeguarded secant
+                      iteration (see `PCMINW` in `pcmin.f`)
+
+    :returns: (ncol,) arrays of minimum central pressure (hPa), maximum
+              surface wind speed (m/s), a flag (1 = OK, 0 = no
+              convergence (hypercane), 2 = CAPE routine failed), the
+              number of iterations, the final value of the minimum
+              pressure iteration (hPa), the outflow temperature (K) and
+              level (hPa), and the largest number of iterations taken by
+              `cape` at any level
+    """
+    par = np.array([[CKCD], [SIG], [IDISS], [B], [VREDUC]], dtype=np.float64)
+    return tuple(a[:, 0] for a in sweep(sst, psl, p, t, r, par, pminit,
+                                        isolv))
+
+
+def _cast(pmin, vmax, ifl, niter, pmc, to, otl, ncmax):
+    """
+    Convert the results to the types returned by the Fortran engine.
+
+    """
+    return (pmin.astype(np.float32), vmax.astype(np.float32), ifl,
+            niter.astype(np.int32), pmc.astype(np.float32),
+            to.astype(np.float32), otl.astype(np.float32), ncmax)
+
+
+def pcminv(sst, psl, p, t, r, n=None, pminit=None, isolv=0):
+    """
+    Batched PI calculation, with the same interface as the `PCMINV`
+    subroutine in `pcmin.f`.
+
+    :param sst: `numpy.ndarray` (ncol,) of sea surface temperature (C)
+    :param psl: `numpy.ndarray` (ncol,) of sea level pressure (hPa)
+    :param p: `numpy.ndarray` (ncol, nlev) of pressure (hPa)
+    :param t: `numpy.ndarray` (ncol, nlev) of temperature (C)
+    :param r: `numpy.ndarray` (ncol, nlev) of mixing ratio (g/kg)
+    :param int n: Number of points in each sounding (default nlev)
+    :param pminit: Optional `numpy.ndarray` (ncol,) of first guess for
+                   the minimum pressure iteration (hPa). Default 950 hPa.
+    :param int isolv: Method used to solve for the minimum pressure
+                      (see `pcmin`). Default 0 (fixed-point iteration).
+
+    :returns: `pmin`, `vmax`, `ifl`, `niter`, `pmc`, `to`, `otl` and
+              `ncmax` arrays of shape (ncol,)
+    """
+    if n is None:
+        n = np.shape(t)[1]
+    sst = np.asarray(sst, dtype=np.float64)
+    psl = np.asarray(psl, dtype=np.float64)
+    p = np.asarray(p, dtype=np.float64)[:, :n]
+    t = np.asarray(t, dtype=np.float64)[:, :n]
+    r = np.asarray(r, dtype=np.float64)[:, :n]
+
+    if pminit is not None:
+        pminit = np.asarray(pminit, dtype=np.float64)
+
+    with np.errstate(all='ignore'):
+        result = pcmin(sst, psl, p, t, r, pminit, isolv)
+    return _cast(*result)
+
+
+def pcminp(sst, psl, p, t, r, n=None, pminit=None, isolv=0):
+    """
+    As `pcminv`, for soundings that share the same pressure levels, with
+    the same interface as the `PCMINP` subroutine in `pcmin.f`.
+
+    :param p: `numpy.ndarray` (nlev,) of pressure (hPa), used for every
+              column. It is broadcast (without copying) to the shape of
+              `t`.
+
+    Other arguments and the return values are as for `pcminv`.
+    """
+    p = np.asarray(p, dtype=np.float64)
+    return pcminv(sst, psl, np.broadcast_to(p, np.shape(t)), t, r, n,
+                  pminit, isolv)
+
+
+def pcsweep(sst, psl, p, t, r, par, n=None, pminit=None, isolv=0):
+    """
+    As `pcminp`, for several sets of the adjustable parameters, with the
+    same interface as the `PCSWEEP` subroutine in `pcmin.f`.
+
+    :param par: `numpy.ndarray` (5, npar) of CKCD, SIG, IDISS, B and
+                VREDUC for each parameter set
+
+    Other arguments are as for `pcminp`.
+
+    :returns: `pmin`, `vmax`, `ifl`, `niter`, `pmc`, `to`, `otl` and
+              `ncmax` arrays of shape (ncol, npar)
+    """
+    if n is None:
+        n = np.shape(t)[1]
+    sst = np.asarray(sst, dtype=np.float64)
+    psl = np.asarray(psl, dtype=np.float64)
+    p = np.broadcast_to(np.asarray(p, dtype=np.float64), np.shape(t))[:, :n]
+    t = np.asarray(t, dtype=np.float64)[:, :n]
+    r = np.asarray(r, dtype=np.float64)[:, :n]
+    par = np.asarray(par, dtype=np.float64)
+
+    if pminit is not None:
+        pminit = np.asarray(pminit, dtype=np.float64)
+
+    with np.errstate(all='ignore'):
+        result = sweep(sst, psl, p, t, r, par, pminit, isolv)
+    return _cast(*result)
+
+
+def setnthreads(nthreads):
+    """
+    The NumPy engine is single-threaded, so this has no effect.
+
+    :param int nthreads: Number of threads (ignored)
+    """
+    pass
+
+
+def getnthreads():
+    """
+    :returns: The number of threads used by `pcminv` (always 1)
+    """
+    return 1
+
+
+def setmatab(tab, s0, ds, r0, dr, p0, dp, dt):
+    """
+    Install the moist adiabat table used by `cape`, with the same
+    interface as the `SETMATAB` subroutine in `pcmin.f`.
+
+    :param tab: `numpy.ndarray` (ns, nr, np) of the temperature (K) of a
+                saturated parcel as a function of reversible entropy,
+                total water mixing ratio and log of pressure
+    :param float s0: First value of reversible entropy (J/kg/K)
+    :param float ds: Spacing of reversible entropy (J/kg/K)
+    :param float r0: First value of total water mixing ratio (kg/kg)
+    :param float dr: Spacing of total water mixing ratio (kg/kg)
+    :param float p0: First value of log of pressure (log(hPa))
+    :param float dp: Spacing of log of pressure
+    :param float dt: Largest correction (K) to the interpolated
+                     temperature that is accepted
+
+    :returns: 0 if the table was installed, 1 if it is not 3-dimensional
+    """
+    global _MATAB
+    if np.ndim(tab) != 3:
+        return 1
+    _MATAB = np.asarray(tab, dtype=np.float64)
+    _MAPAR[:] = (1.0, s0, ds, r0, dr, p0, dp, dt)
+    return 0
+
+
+def usematab(ion):
+    """
+    Turn use of the moist adiabat table on (1) or off (0). The table must
+    have been set with `setmatab`.
+
+    :param int ion: 1 to use the table, 0 otherwise
+    """
+    _MAPAR[0] = 1.0 if (ion and _MATAB is not None) else 0.0
@@ -1,7 +1,27 @@
 from numpy.distutils.core import Extension
 
-ext1 = Extension(name = 'pcmin',
-                 sources = ['pcmin.f'])
+# The batched kernel (PCMINV) is parallelised with OpenMP. Without the
+# OpenMP flags the directives are treated as comments and the kernel
+# runs on a single thread.
+#
+# The kernel is built several times, for different instruction sets.
+# `engines.loadEngine` loads the best build the CPU supports (see
+# `engines.VARIANTS`), so the same installation can be used on nodes
+# with and without AVX-512. Contraction of multiplies and adds into FMA
+# instructions is turned off, so every build gives identical results.
+VARIANTS = {
+    'pcmin': [],
+    'pcmin_avx2': ['-mavx2', '-mfma', '-ffp-contract=off'],
+    'pcmin_avx512': ['-mavx512f', '-mavx512cd', '-mavx512bw', '-mavx512dq',
+                     '-mavx512vl', '-mfma', '-mprefer-vector-width=512',
+                     '-ffp-contract=off'],
+}
+
+extensions = [Extension(name = name,
+                        sources = ['pcmin.f'],
+                        extra_f77_compile_args = ['-fopenmp'] + flags,
+                        extra_link_args = ['-fopenmp'])
+              for name, flags in VARIANTS.items()]
 
 
 if __name__ == "__main__":
@@ -10,5 +30,5 @@ if __name__ == "__main__":
           description       = "Python wrapper for potential intensity calculation",
           author            = "Craig Arthur",
           author_email      = "craig.arthur@ga.gov.au",
-          ext_modules = [ext1]
-          )
\ No newline at end of file
+          ext_modules = extensions
+          )
@@ -0,0 +1,45 @@
+"""
+Idealised tropical soundings shared by the tests.
+"""
+
+import numpy as np
+
+# Pressure levels (hPa) of the soundings, from the surface upwards
+LEVELS = np.array([1000, 975, 950, 925, 900, 875, 850, 825, 800, 775, 750,
+                   700, 650, 600, 550, 500, 450, 400, 350, 300, 250, 225,
+                   200, 175, 150, 125, 100, 70, 50], dtype=np.float32)
+
+
+def soundings(ncol=5000, seed=3):
+    """
+    Idealised soundings: a constant lapse rate from a surface air
+    temperature a little below the SST up to a tropopause at 100 hPa,
+    warming slightly above, with a relative humidity that decreases with
+    height. The SST, sea level pressure, temperature and humidity are
+    varied at random about typical tropical values.
+
+    :param int ncol: Number of soundings
+    :param int seed: Seed of the random number generator
+
+    :returns: SST (C), SLP (hPa), pressure (hPa), temperature (C) and
+              mixing ratio (g/kg) arrays, the last three (ncol, nlevels)
+    """
+    rng = np.random.default_rng(seed)
+    sst = rng.uniform(18., 32., ncol)
+    slp = rng.uniform(1000., 1016., ncol)
+    t0 = sst - rng.uniform(0.5, 2.0, ncol) + 273.15
+    # Temperature (K) for a lapse rate of about 6.5 K/km
+    exponent = rng.uniform(0.17, 0.21, ncol)
+    t = t0[:, None] * (LEVELS[None, :] / 1000.) ** exponent[:, None]
+    ttrop = t[:, LEVELS == 100.]
+    above = LEVELS < 100.
+    t[:, above] = ttrop + 4. * np.log(100. / LEVELS[above])
+    t = t - 273.15
+    rh = rng.uniform(0.5, 0.9, ncol)[:, None] * (LEVELS[None, :] / 1000.) ** 2
+    es = 6.112 * np.exp(17.67 * t / (t + 243.5))
+    r = 622. * rh * es / (LEVELS[None, :] - rh * es)
+    p = np.broadcast_to(LEVELS, t.shape)
+    return (sst.astype(np.float32), slp.astype(np.float32),
+            np.asfortranarray(p, dtype=np.float32),
+            np.asfortranarray(t, dtype=np.float32),
+            np.asfortranarray(r, dtype=np.float32))
@@ -0,0 +1,115 @@
+"""
+Tests of the driver functions in `calculate.py`.
+"""
+
+import numpy as np
+import pytest
+
+from soundings import LEVELS, soundings
+from columns import oceanIndex
+import calculate
+
+
+def grid(ny=10, nx=20, seed=3):
+    """
+    The idealised soundings on a (ny, nx) grid, as read from the input
+    files: SST masked over land, and the levels from the top down.
+
+    :returns: SST and SLP (ny, nx), temperature and mixing ratio
+              (nz, ny, nx) and the pressure levels
+    """
+    sst, slp, p, t, r = soundings(ny * nx, seed)
+    land = np.zeros(ny * nx, dtype=bool)
+    land[::7] = True
+    sst = np.ma.masked_array(sst, land).reshape(ny, nx)
+    cube = lambda a: np.ascontiguousarray(a[:, ::-1].T).reshape(-1, ny, nx)
+    return sst, slp.reshape(ny, nx), cube(t), cube(r), LEVELS[::-1]
+
+
+def test_screen():
+    engine = pytest.importorskip('pcmin')
+    sst, slp, tt, rr, levels = grid()
+    index = oceanIndex(np.ma.getmaskarray(sst))
+    full = calculate.calculate(sst, slp, None, tt, rr, levels, engine,
+                               index=index)
+    screened = calculate.calculate(sst, slp, None, tt, rr, levels, engine,
+                                   index=index, screen=24.)
+    cold = ~np.ma.getmaskarray(sst) & (sst.filled(np.nan) < 24.)
+    assert cold.any()
+    pmin, vmax, ifl = screened[:3]
+    np.testing.assert_array_equal(ifl[cold], calculate.IFL_SCREENED)
+    np.testing.assert_array_equal(vmax[cold], 0.)
+    np.testing.assert_array_equal(pmin[cold], slp[cold])
+    for a, b in zip(screened, full):
+        np.testing.assert_array_equal(a[~cold], b[~cold])
+
+    stats = calculate.resultStats(dict(zip(calculate.RESULTS, screened)))
+    assert stats['screened'] == cold.sum()
+    assert stats['ocean'] == len(index)
+    assert stats['calculated'] == len(index) - cold.sum()
+
+
+def test_level_slice(caplog):
+    # Levels as read from the ERA5 files, from the top down, and in
+    # the reverse order
+    levels = LEVELS[::-1]
+    window = calculate.levelSlice(levels, 50., 900.)
+    np.testing.assert_array_equal(levels[window],
+                                  levels[(levels >= 50.) & (levels <= 900.)])
+    window = calculate.levelSlice(LEVELS, bottom=500.)
+    np.testing.assert_array_equal(LEVELS[window], LEVELS[LEVELS <= 500.])
+    assert calculate.levelSlice(levels) == slice(0, len(levels))
+    with pytest.raises(ValueError):
+        calculate.levelSlice(levels, 1010.)
+
+    # Only a window that drops the first level above 59 hPa is reported
+    assert 'excludes' not in caplog.text
+    window = calculate.levelSlice(LEVELS, 100.)
+    np.testing.assert_array_equal(LEVELS[window], LEVELS[LEVELS >= 100.])
+    assert 'excludes the 50.0 hPa level' in caplog.text
+
+
+def test_tile_slices():
+    ny, nx = 11, 17
+    tiles = calculate.tileSlices(ny, nx, (4, 5))
+    assert len(tiles) == 3 * 4
+    # Every point of the domain is in exactly one tile
+    count = np.zeros((ny, nx), dtype=int)
+    for ys, xs in tiles:
+        count[ys, xs] += 1
+    np.testing.assert_array_equal(count, 1)
+    assert tiles[-1] == (slice(8, 11), slice(15, 17))
+    assert calculate.tileSlices(ny, nx) == [(slice(0, ny), slice(0, nx))]
+    with pytest.raises(ValueError):
+        calculate.tileSlices(ny, nx, (0, 5))
+
+
+def test_checkpoint(tmp_path):
+    path = str(tmp_path / 'checkpoint')
+    signature = calculate.checkpointSignature('secant', 4)
+    assert signature != calculate.checkpointSignature('fixed', 4)
+    rng = np.random.default_rng(0)
+    saved = {'pmin': rng.normal(size=(4, 3, 5)).astype(np.float32),
+             'ifl': rng.integers(0, 3, size=(4, 3, 5)).astype(np.uint8)}
+    for tdx in (0, 2, 3):
+        calculate.saveCheckpoint(path, tdx, {name: a[tdx] for name, a in
+                                             saved.items()}, signature)
+    # A time that was only partly written, and one that is not a
+    # checkpoint file at all, are calculated again
+    (tmp_path / 'checkpoint' / '0001.npz.partial').write_bytes(b'PK')
+    (tmp_path / 'checkpoint' / '0003.npz').write_bytes(b'not a zip file')
+
+    outputs = {name: np.zeros_like(a) for name, a in saved.items()}
+    done = calculate.loadCheckpoint(path, outputs, signature)
+    assert done == {0, 2}
+    for name, a in saved.items():
+        np.testing.assert_array_equal(outputs[name][[0, 2]], a[[0, 2]])
+
+    # Results of a time that do not match the arrays of the month
+    calculate.saveCheckpoint(path, 1, {'pmin': np.zeros((2, 2))}, signature)
+    assert calculate.loadCheckpoint(path, outputs, signature) == {0, 2}
+
+    # A checkpoint saved with other options is removed
+    other = calculate.checkpointSignature('fixed', 4)
+    assert calculate.loadCheckpoint(path, outputs, other) == set()
+    assert not (tmp_path / 'checkpoint').exists()
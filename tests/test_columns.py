@@ -0,0 +1,32 @@
+"""
+Tests of the index of ocean columns (`columns.py`).
+"""
+
+import numpy as np
+
+from columns import columnIndex, packColumns, scatter
+
+
+def test_pack_and_scatter():
+    rng = np.random.default_rng(0)
+    ny, nx, nz = 6, 8, 5
+    lon, lat = np.arange(nx) * 0.25, np.arange(ny) * 0.25
+    land = rng.uniform(size=(ny, nx)) < 0.4
+    index = columnIndex(lon, lat, land, cachedir=None)
+    np.testing.assert_array_equal(index, np.flatnonzero(~land))
+    assert columnIndex(lon, lat, land, cachedir=None) is index
+
+    # Packed columns are the ocean points, with the levels reversed
+    arr = rng.normal(size=(nz, ny, nx))
+    packed = packColumns(arr, index)
+    assert packed.shape == (len(index), nz)
+    assert packed.dtype == np.float32 and packed.flags.f_contiguous
+    jj, ii = np.unravel_index(index, (ny, nx))
+    np.testing.assert_array_equal(packed,
+                                  arr[::-1, jj, ii].T.astype(np.float32))
+
+    # Scattering the packed surface level puts it back on the grid
+    grid = scatter(packed[:, -1], index, (ny, nx))
+    np.testing.assert_array_equal(grid[~land],
+                                  arr[0][~land].astype(np.float32))
+    assert np.isnan(grid[land]).all()
@@ -0,0 +1,25 @@
+"""
+Tests of the table of moist adiabats (`moistadiabat.py`) used in the CAPE
+calculation of the Fortran kernel.
+"""
+
+import numpy as np
+import pytest
+
+from soundings import soundings
+
+pcmin = pytest.importorskip('pcmin')
+import moistadiabat
+
+
+def test_table_matches_iteration(tmp_path):
+    data = soundings(2000, seed=11)
+    iterated = pcmin.pcminv(*data)
+    moistadiabat.useTable(pcmin, cachefile=str(tmp_path / 'table.npz'))
+    try:
+        tabulated = pcmin.pcminv(*data)
+    finally:
+        moistadiabat.useTable(pcmin, False)
+    np.testing.assert_array_equal(tabulated[2], iterated[2])
+    ok = iterated[2] == 1
+    np.testing.assert_allclose(tabulated[1][ok], iterated[1][ok], atol=0.05)
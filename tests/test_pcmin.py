@@ -0,0 +1,125 @@
+"""
+Tests of the Fortran PI kernel (`pcmin.f`) on a fixed set of idealised
+tropical soundings. The extension must be built first (see README.md).
+"""
+
+import numpy as np
+import pytest
+
+from soundings import LEVELS, soundings
+from engines import parameterSets
+
+pcmin = pytest.importorskip('pcmin')
+
+
+@pytest.fixture(scope='module')
+def data():
+    return soundings()
+
+
+def test_soundings(data):
+    # Most of the soundings should have a valid solution, or the other
+    # tests check little
+    ifl = pcmin.pcminv(*data)[2]
+    assert np.mean(ifl == 1) > 0.9
+
+
+def test_batched_matches_single(data):
+    sst, slp, p, t, r = data
+    n = len(LEVELS)
+    single = np.array([pcmin.pcmin(sst[i], slp[i], p[i], t[i], r[i], n)
+                       for i in range(len(sst))])
+    batched = pcmin.pcminv(sst, slp, p, t, r, n)
+    np.testing.assert_array_equal(batched[0], single[:, 0])
+    np.testing.assert_array_equal(batched[1], single[:, 1])
+    np.testing.assert_array_equal(batched[2], single[:, 2])
+
+
+@pytest.mark.parametrize('guess', [None, 850., 700.])
+def test_secant_matches_fixed_point(data, guess):
+    # Where the secant iteration (ISOLV=1) stalls it falls back to the
+    # fixed-point iteration from the same first guess, so converges to
+    # the same root wherever the fixed-point iteration does
+    pminit = None
+    if guess is not None:
+        pminit = np.full(len(data[0]), guess, dtype=np.float32)
+    fixed = pcmin.pcminv(*data, pminit=pminit)
+    secant = pcmin.pcminv(*data, pminit=pminit, isolv=1)
+    ok = fixed[2] == 1
+    np.testing.assert_array_equal(secant[2][ok], 1)
+    np.testing.assert_allclose(secant[0][ok], fixed[0][ok], atol=1.0)
+    np.testing.assert_allclose(secant[1][ok], fixed[1][ok], atol=0.5)
+
+
+def test_secant_hypercane():
+    # A cold upper troposphere over a warm ocean gives many columns with
+    # no solution, which the fixed-point iteration only gives up on after
+    # 1000 iterations. The secant iteration should stop far sooner
+    sst, slp, p, t, r = soundings(3000, seed=7)
+    sst = sst + 8.
+    t = np.asfortranarray(t - 8.)
+    fixed = pcmin.pcminv(sst, slp, p, t, r)
+    secant = pcmin.pcminv(sst, slp, p, t, r, isolv=1)
+    hypercane = secant[2] == 0
+    assert hypercane.sum() > 100
+    np.testing.assert_array_equal(fixed[2][hypercane], 0)
+    assert secant[3][hypercane].max() <= 101
+
+
+def test_inputs_unchanged(data):
+    # The kernels convert the temperature and humidity into work arrays,
+    # rather than in place and back again
+    sst, slp, p, t, r = data
+    t1, r1 = np.array(t[0]), np.array(r[0])
+    pcmin.pcmin(sst[0], slp[0], p[0], t1, r1, len(LEVELS))
+    np.testing.assert_array_equal(t1, t[0])
+    np.testing.assert_array_equal(r1, r[0])
+    copies = [np.copy(a, order='F') for a in data]
+    pcmin.pcminv(*copies)
+    for a, b in zip(copies, data):
+        np.testing.assert_array_equal(a, b)
+
+
+def test_shared_levels_match_batched(data):
+    # PCMINP takes one pressure axis for every column
+    sst, slp, p, t, r = data
+    batched = pcmin.pcminv(sst, slp, p, t, r)
+    shared = pcmin.pcminp(sst, slp, LEVELS, t, r)
+    for a, b in zip(shared, batched):
+        np.testing.assert_array_equal(a, b)
+
+
+def test_sweep_default_set(data):
+    # The sweep shares the environmental CAPE and the minimum pressure
+    # iteration between sets, but the default set (the first, here) must
+    # give the same results as PCMINP
+    sst, slp, p, t, r = data
+    par = parameterSets(CKCD=[0.9, 0.7], SIG=[0.0, 1.0], B=[2.0, 1.5])
+    sweep = pcmin.pcsweep(sst, slp, LEVELS, t, r, par)
+    shared = pcmin.pcminp(sst, slp, LEVELS, t, r)
+    for a, b in zip(sweep, shared):
+        np.testing.assert_array_equal(a[:, 0], b)
+
+
+def test_tangent_linear_matches_differences(data):
+    # Derivatives of PCTLP with respect to the SST and to a warming of
+    # the 300-200 hPa layer, against central differences of PCMINP.
+    # Where a difference is exactly zero (e.g. the layer is above the
+    # outflow level) the derivative is zero too, and is not compared
+    sst, slp, p, t, r = data
+    dt = ((LEVELS <= 300.) & (LEVELS >= 200.)).astype(np.float32)
+    tl = pcmin.pctlp(sst, slp, LEVELS, t, r, dt)
+    h = 0.1
+    cases = (((sst + h, slp, LEVELS, t, r), (sst - h, slp, LEVELS, t, r),
+              tl[8:10]),
+             ((sst, slp, LEVELS, np.asfortranarray(t + h * dt), r),
+              (sst, slp, LEVELS, np.asfortranarray(t - h * dt), r),
+              tl[10:12]))
+    for up, down, derivatives in cases:
+        up, down = pcmin.pcminp(*up), pcmin.pcminp(*down)
+        ok = (tl[2] == 1) & (up[2] == 1) & (down[2] == 1)
+        for k, derivative in enumerate(derivatives):
+            fd = (up[k] - down[k]) / (2. * h)
+            use = ok & (fd != 0.)
+            error = np.abs(derivative - fd)[use] / np.abs(fd[use])
+            assert np.median(error) < 0.01
@@ -0,0 +1,23 @@
+"""
+Tests of the Numba port of the PI kernel (`pcmin_numba.py`) against the
+Fortran kernel on random soundings.
+"""
+
+import numpy as np
+import pytest
+
+from soundings import soundings
+
+pytest.importorskip('numba')
+pcmin = pytest.importorskip('pcmin')
+import pcmin_numba
+
+
+def test_matches_fortran():
+    data = soundings(1000, seed=5)
+    fortran = pcmin.pcminv(*data)
+    port = pcmin_numba.pcminv(*data)
+    np.testing.assert_array_equal(port[2], fortran[2])
+    ok = fortran[2] == 1
+    np.testing.assert_allclose(port[0][ok], fortran[0][ok], atol=0.2)
+    np.testing.assert_allclose(port[1][ok], fortran[1][ok], atol=0.05)
@@ -0,0 +1,22 @@
+"""
+Tests of the vectorised NumPy PI kernel (`pcmin_numpy.py`) against the
+Fortran kernel on random soundings.
+"""
+
+import numpy as np
+import pytest
+
+from soundings import soundings
+
+pcmin = pytest.importorskip('pcmin')
+import pcmin_numpy
+
+
+def test_matches_fortran():
+    data = soundings(1000, seed=5)
+    fortran = pcmin.pcminv(*data)
+    port = pcmin_numpy.pcminv(*data)
+    np.testing.assert_array_equal(port[2], fortran[2])
+    ok = fortran[2] == 1
+    np.testing.assert_allclose(port[0][ok], fortran[0][ok], atol=0.2)
+    np.testing.assert_allclose(port[1][ok], fortran[1][ok], atol=0.05)
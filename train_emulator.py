@@ -0,0 +1,95 @@
+"""
+Fit the statistical emulator of the PI kernel (see :mod:`pcmin_emulator`)
+to ERA5 soundings.
+
+Soundings for the given times are loaded using the input paths and
+domain in the configuration file (see `calculate.ini`), PI is calculated
+with the reference engine, and the emulator is fitted to the results. The
+RMS and mean error of the emulator against the engine, on a fraction of
+the columns held out of the fit, are printed and saved with the model,
+along with the time taken by each to calculate PI for all the columns.
+
+The model is saved to `-o` (by default `~/.cache/pcmin/emulator.npz`),
+and is used by `calculate.py` with ``Name=emulator`` in the [Engine]
+section of the configuration file.
+
+Example::
+
+    python train_emulator.py -c calculate.ini -y 2014 2015 -m 1 4 7 10 \\
+        -t 0 12 -o emulator.npz --threads 8
+
+"""
+
+import os
+import argparse
+import itertools
+from configparser import ConfigParser
+from time import perf_counter
+
+import numpy as np
+
+import pcmin_emulator
+from engines import loadEngine
+from benchmark_engines import loadSoundings
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__,
+                                formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument('-c', '--config_file', help="Configuration file", required=True)
+    p.add_argument('-y', '--years', type=int, nargs='+', default=[2015],
+                   help="Years")
+    p.add_argument('-m', '--months', type=int, nargs='+', default=[1],
+                   help="Months")
+    p.add_argument('-t', '--times', type=int, nargs='+', default=[0],
+                   help="Time indices in each monthly file")
+    p.add_argument('-e', '--engine', default='fortran',
+                   help="Engine the emulator is fitted to")
+    p.add_argument('-o', '--output', default=pcmin_emulator.MODELFILE,
+                   help="File to save the model to")
+    p.add_argument('--holdout', type=float, default=0.2,
+                   help="Fraction of columns used to estimate the error")
+    p.add_argument('--threads', type=int,
+                   default=int(os.environ.get('OMP_NUM_THREADS', 1)),
+                   help="Number of threads for the engine")
+    args = p.parse_args()
+
+    config = ConfigParser()
+    config.read(args.config_file)
+    engine = loadEngine(args.engine)
+    engine.setnthreads(args.threads)
+
+    data = []
+    elapsed = 0.
+    for year, month, tdx in itertools.product(args.years, args.months,
+                                              args.times):
+        soundings = loadSoundings(config, year, month, tdx)
+        start = perf_counter()
+        pmin, vmax, ifl = engine.pcminv(*soundings)[:3]
+        elapsed += perf_counter() - start
+        data.append(soundings + (pmin, vmax, ifl))
+        print(f"{year}-{month:02d} time {tdx}: {len(pmin)} columns, "
+              f"{np.sum(ifl == 1)} converged")
+    data = [np.concatenate(arrays) for arrays in zip(*data)]
+    ncol = len(data[0])
+
+    model = pcmin_emulator.fit(*data, holdout=args.holdout)
+    pcmin_emulator.saveModel(model, args.output)
+    print(f"\nSaved the emulator to {args.output}: fitted to "
+          f"{model['ntrain']} columns, tested on {model['ntest']}")
+    print(f"{'':>10s} {'RMS':>8s} {'mean':>8s}")
+    for k, name in enumerate(('VMAX', 'PMIN')):
+        print(f"{name:>10s} {model['rmse'][k]:8.2f} {model['bias'][k]:8.2f}")
+
+    pcmin_emulator.setmodel(args.output)
+    soundings = data[:5]
+    start = perf_counter()
+    pcmin_emulator.pcminv(*soundings)
+    emulated = perf_counter() - start
+    print(f"\n{'engine':>10s} {'time (s)':>10s} {'col/s':>12s}")
+    for name, seconds in ((args.engine, elapsed), ('emulator', emulated)):
+        print(f"{name:>10s} {seconds:10.3f} {ncol / seconds:12.0f}")
+
+
+if __name__ == "__main__":
+    main()